@@ -1,16 +1,70 @@
-from flask import Flask
-from routes.whatsapp import bp as whatsapp_bp
-from routes.summary import bp as summary_bp
-from routes.debug import bp as debug_bp
-from config import GROQ_API_KEY, OCR_BACKEND, TESSERACT_CMD
+from services import startup  # first import: starts the startup clock
+import threading
+with startup.timed("import flask"):
+    from flask import Flask
+with startup.timed("import routes"):
+    from routes.whatsapp import bp as whatsapp_bp
+    from routes.summary import bp as summary_bp
+    from routes.debug import bp as debug_bp
+    from routes.analytics import bp as analytics_bp
+from config import GROQ_API_KEY, OCR_BACKEND, TESSERACT_CMD, INGEST_MODE, WARMUP_ON_START, WARMUP_STEPS, CACHE_PHASH
+
+# Heavy clients and libraries load on first use; warm-up steps pay for them in the
+# background right after start so the first webhook / cron does not have to
+def _warm_sheets():
+    from services.sheets import get_values_client
+    get_values_client()
+
+def _warm_http():
+    from services.http import warm_up as warm_http
+    targets = [("twilio", "https://api.twilio.com/")]
+    if OCR_BACKEND.lower() != "tesseract":
+        targets.append(("ocr", "https://api.ocr.space/"))
+    warm_http(targets)
+
+def _warm_llm():
+    from services.llm import get_groq_client
+    get_groq_client()
+
+def _warm_ledger():
+    from services import ledger
+    ledger.sync(force=True)
+
+def _warm_ocr():
+    if OCR_BACKEND.lower() == "tesseract":
+        from services.ocr import _pytesseract
+        _pytesseract()
+    if OCR_BACKEND.lower() == "tesseract" or CACHE_PHASH:
+        from PIL import Image  # noqa: F401
+
+WARM_UP = {"sheets": _warm_sheets, "http": _warm_http, "llm": _warm_llm, "ledger": _warm_ledger, "ocr": _warm_ocr}
+
+def warm_up(steps=WARMUP_STEPS):
+    for name in steps:
+        try:
+            with startup.timed(f"warm-up {name}"):
+                WARM_UP[name]()
+        except Exception as e:
+            print(f"{name} warm-up failed: {e}")
+    startup.print_report("Warm-up done")
 
 def create_app():
-    app = Flask(__name__)
-    app.register_blueprint(whatsapp_bp)
-    app.register_blueprint(summary_bp)
-    app.register_blueprint(debug_bp)
-    print(f"Grok key loaded: {'yes' if GROQ_API_KEY else 'NO'}")
-    print(f"OCR backend: {OCR_BACKEND}  (tesseract at {TESSERACT_CMD})")
+    with startup.timed("create app"):
+        app = Flask(__name__)
+        app.register_blueprint(whatsapp_bp)
+        app.register_blueprint(summary_bp)
+        app.register_blueprint(debug_bp)
+        app.register_blueprint(analytics_bp)
+        app.after_request(startup.mark_first_response)
+        print(f"Grok key loaded: {'yes' if GROQ_API_KEY else 'NO'}")
+        print(f"OCR backend: {OCR_BACKEND}  (tesseract at {TESSERACT_CMD})")
+        if INGEST_MODE == "async":
+            from services import jobqueue
+            jobqueue.start_workers()
+            print("Ingest mode: async (queue workers started)")
+    startup.print_report()
+    if WARMUP_ON_START:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
     return app
 
 app = create_app()
@@ -0,0 +1,14 @@
+from asgiref.wsgi import WsgiToAsgi
+from starlette.applications import Starlette
+from starlette.routing import Mount
+
+from app import app as flask_app
+from routes.aio import routes
+from services import aio
+
+# ASGI entrypoint: async webhook + summary handlers, everything else via Flask.
+#   uvicorn asgi:app --host 0.0.0.0 --port 8080
+app = Starlette(
+    routes=routes + [Mount("/", app=WsgiToAsgi(flask_app))],
+    on_shutdown=[aio.aclose],
+)
@@ -0,0 +1,56 @@
+"""Synthetic ledgers and inbound messages for the benchmarks (seeded, so runs are comparable)."""
+import random, datetime as dt
+
+MERCHANTS = [("Trader Joe's", "groceries"), ("Safeway", "groceries"), ("Chipotle", "eating_out"),
+             ("Blue Bottle", "eating_out"), ("Uber", "transport"), ("Shell", "transport"),
+             ("PG&E", "utilities"), ("Comcast", "utilities"), ("Amazon", "shopping"), ("Target", "shopping"),
+             ("CVS", "medical"), ("AMC", "entertainment"), ("Delta", "travel"), ("Landlord", "rent")]
+
+def _date_cell(d, rnd):
+    # the sheet holds what people typed: mostly ISO, sometimes US or month-name dates
+    r = rnd.random()
+    if r < 0.8:
+        return d.isoformat()
+    if r < 0.95:
+        return f"{d.month}/{d.day}/{d.year}"
+    return d.strftime("%b %d, %Y")
+
+def users(n):
+    return [f"whatsapp:+1555{i:07d}" for i in range(n)]
+
+def ledger_rows(n, n_users=1, days=730, end=None, seed=7):
+    """`n` sheet rows (A:J) spread over the `days` days up to `end`, round-robin across users.
+    The first user's rows leave column J blank, like rows logged before multi-user support."""
+    rnd = random.Random(seed)
+    end = end or dt.date.today()
+    uids = [""] + users(n_users)[1:]
+    rows = []
+    for i in range(n):
+        d = end - dt.timedelta(days=rnd.randrange(days))
+        name, cat = rnd.choice(MERCHANTS)
+        amount = round(rnd.lognormvariate(3, 1), 2)
+        rows.append([f"{d.isoformat()}T12:00:00Z", _date_cell(d, rnd), name, f"{amount:.2f}", "USD", cat,
+                     "", "text", f"SMbench{i:08d}", uids[i % len(uids)]])
+    return rows
+
+def date_cells(n, seed=7):
+    rnd = random.Random(seed)
+    today = dt.date.today()
+    return [_date_cell(today - dt.timedelta(days=rnd.randrange(3650)), rnd) for _ in range(n)]
+
+def webhook_forms(n, sender, seed=7):
+    """Twilio webhook forms: mostly quick-parse texts, some that need the LLM, a few receipt photos."""
+    rnd = random.Random(seed)
+    forms = []
+    for i in range(n):
+        form = {"From": sender, "MessageSid": f"SMhook{seed}{i:08d}", "NumMedia": "0"}
+        r = rnd.random()
+        name, _ = rnd.choice(MERCHANTS)
+        if r < 0.6:
+            form["Body"] = f"{name} {rnd.randint(2, 200)}.{rnd.randint(0, 99):02d}"
+        elif r < 0.9:
+            form["Body"] = f"lunch {rnd.randint(5, 40)} and uber {rnd.randint(5, 40)} yesterday"
+        else:
+            form.update(Body="", NumMedia="1", MediaUrl0=f"https://api.twilio.com/media/ME{i:08d}")
+        forms.append(form)
+    return forms
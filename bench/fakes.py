@@ -0,0 +1,131 @@
+"""Offline stand-ins for Sheets, Groq, Twilio and OCR.Space with configurable latency.
+
+`install(latency_ms)` swaps them into the service modules; nothing leaves the
+machine afterwards. Each fake sleeps `latency_ms` per call to model the round trip.
+"""
+import os, re, json, time, threading
+import requests
+from requests.adapters import BaseAdapter
+
+class _Request:
+    def __init__(self, fn, latency):
+        self.fn, self.latency = fn, latency
+
+    def execute(self, **kw):
+        time.sleep(self.latency)
+        return self.fn()
+
+class FakeSheetValues:
+    """`spreadsheets().values()` over an in-memory `transactions` tab (row 1 is the header)."""
+    def __init__(self, rows=(), latency=0.0):
+        self.rows = [["timestamp_utc", "date", "name", "amount", "currency", "category", "notes", "source", "msg_sid", "user"]]
+        self.rows.extend(rows)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def _bounds(self, rng):
+        m = re.search(r"!A(\d+)?:[A-Z](\d+)?", rng)
+        start = int(m.group(1) or 1)
+        end = int(m.group(2)) if m.group(2) else None
+        return start, end
+
+    def get(self, spreadsheetId, range, **kw):
+        self.calls += 1
+        def fn():
+            start, end = self._bounds(range)
+            with self.lock:
+                return {"values": self.rows[start - 1:end]}
+        return _Request(fn, self.latency)
+
+    def batchGet(self, spreadsheetId, ranges, **kw):
+        self.calls += 1
+        def fn():
+            out = []
+            for rng in ranges:
+                start, end = self._bounds(rng)
+                with self.lock:
+                    out.append({"range": rng, "values": self.rows[start - 1:end]})
+            return {"valueRanges": out}
+        return _Request(fn, self.latency)
+
+    def append(self, spreadsheetId, range, body, **kw):
+        self.calls += 1
+        def fn():
+            with self.lock:
+                first = len(self.rows) + 1
+                self.rows.extend(body["values"])
+                last = len(self.rows)
+            return {"updates": {"updatedRange": f"transactions!A{first}:J{last}", "updatedRows": last - first + 1}}
+        return _Request(fn, self.latency)
+
+_PAIR = re.compile(r"([a-z][a-z ]*?)\s*\$?(\d+(?:\.\d+)?)")
+
+def _fake_expenses(text):
+    return [{"name": re.sub(r"^(and|then|plus) ", "", name.strip()).title() or "Unknown", "amount": float(amt), "currency": "USD",
+             "category": "other", "date": None, "notes": text[:60]}
+            for name, amt in _PAIR.findall(text.lower())] or []
+
+class _Completions:
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+
+    def create(self, messages, response_format=None, **kw):
+        time.sleep(self.latency)
+        self.calls += 1
+        user = messages[-1]["content"]
+        if "Inputs:\n" in user:  # batched extraction (services.llm.batch_request)
+            inputs = [json.loads(l) for l in user.split("Inputs:\n", 1)[1].splitlines()]
+            content = json.dumps({"results": [{"i": x["i"], "expenses": _fake_expenses(x["text"])} for x in inputs]})
+        elif response_format:  # single extraction (services.llm.extract_request)
+            exps = _fake_expenses(user.split("Input:", 1)[-1]) or [{"name": "Unknown", "amount": None}]
+            content = json.dumps(exps[0])
+        else:  # summary
+            content = "You spent a little on a few things. Keep it up."
+        msg = type("Message", (), {"content": content})()
+        return type("Completion", (), {"choices": [type("Choice", (), {"message": msg})()]})()
+
+class FakeGroq:
+    def __init__(self, latency=0.0):
+        self.chat = type("Chat", (), {})()
+        self.chat.completions = _Completions(latency)
+
+class FakeHTTPAdapter(BaseAdapter):
+    """Answers Twilio (send + media) and OCR.Space requests locally."""
+    def __init__(self, latency=0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls = 0
+
+    def send(self, request, **kw):
+        time.sleep(self.latency)
+        self.calls += 1
+        r = requests.Response()
+        r.status_code, r.request, r.url = 200, request, request.url
+        if "api.ocr.space" in request.url:
+            body = {"ParsedResults": [{"ParsedText": "CORNER CAFE\nLATTE 4.50\nTOTAL 4.50"}], "IsErroredOnProcessing": False}
+            r._content = json.dumps(body).encode()
+        elif "/Messages.json" in request.url:
+            r.status_code = 201
+            r._content = json.dumps({"sid": "SMfake", "status": "queued"}).encode()
+        else:  # media download
+            r._content = b"\xff\xd8fake-jpeg" + os.urandom(512)
+        return r
+
+    def close(self):
+        pass
+
+def install(latency_ms=0.0, rows=()):
+    """Point every outbound client at the fakes. Returns them as a dict."""
+    from services import http, llm, sheets
+    latency = latency_ms / 1000.0
+    fakes = {"sheets": FakeSheetValues(rows, latency), "groq": FakeGroq(latency), "http": FakeHTTPAdapter(latency)}
+    sheets._sheets_values = fakes["sheets"]
+    llm.groq_client = fakes["groq"]
+    for policy in ("default", "ocr", "twilio"):
+        s = requests.Session()
+        s.mount("https://", fakes["http"])
+        s.mount("http://", fakes["http"])
+        http._sessions[(os.getpid(), policy)] = s
+    return fakes
@@ -0,0 +1,56 @@
+"""Compare tesseract on raw images vs the preprocessing pipeline.
+
+    python -m bench.ocr_bench path/to/receipts [--runs 3]
+
+Every image in the directory is OCR'd both ways (sequentially, so latencies are
+per image). If `<image>.txt` exists next to an image it is used as ground truth
+and accuracy is reported as a character-level similarity ratio.
+"""
+import os, sys, time, argparse, difflib, statistics
+
+from services.ocr import _tesseract_job
+
+IMAGE_EXT = (".jpg", ".jpeg", ".png", ".webp", ".tif", ".tiff")
+
+def _similarity(a, b):
+    norm = lambda s: " ".join(s.lower().split())
+    return difflib.SequenceMatcher(None, norm(a), norm(b)).ratio()
+
+def _pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+def run(directory, runs=1):
+    images = sorted(f for f in os.listdir(directory) if f.lower().endswith(IMAGE_EXT))
+    if not images:
+        raise SystemExit(f"No images in {directory}")
+    results = {}
+    for label, preprocess in (("raw", False), ("preprocessed", True)):
+        lat, acc = [], []
+        for name in images:
+            path = os.path.join(directory, name)
+            with open(path, "rb") as f:
+                content = f.read()
+            for _ in range(runs):
+                t0 = time.perf_counter()
+                text = _tesseract_job(content, preprocess)
+                lat.append(time.perf_counter() - t0)
+            truth = os.path.splitext(path)[0] + ".txt"
+            if os.path.exists(truth):
+                with open(truth, encoding="utf-8") as f:
+                    acc.append(_similarity(text, f.read()))
+        results[label] = {"images": len(images), "p50_s": round(_pct(lat, 0.5), 3),
+                          "p90_s": round(_pct(lat, 0.9), 3), "mean_s": round(statistics.mean(lat), 3),
+                          "accuracy": round(statistics.mean(acc), 3) if acc else None}
+    return results
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("directory")
+    ap.add_argument("--runs", type=int, default=1)
+    args = ap.parse_args(argv)
+    for label, r in run(args.directory, args.runs).items():
+        print(f"{label:>13}: " + "  ".join(f"{k}={v}" for k, v in r.items()))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""Throughput and latency of the hot paths against offline stand-ins.
+
+    python -m bench.run [--rows 1000,10000,100000] [--latency-ms 0] [--iterations 200]
+
+Each ledger size runs in a fresh process with its own temporary SQLite files and
+fakes for Sheets, Groq, Twilio and OCR.Space (bench/fakes.py), so nothing leaves
+the machine. Results are written to bench/results/<utc time>-<git sha>.json and
+compared with the previous file there (or --baseline); a p50 more than
+--threshold slower than the baseline is reported as a regression (exit status 1).
+"""
+import os, sys, json, time, argparse, tempfile, subprocess, datetime as dt
+
+from bench.ocr_bench import _pct
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TARGETS = ("ledger_sync", "whatsapp_webhook", "build_daily_context", "build_window_context",
+           "aggregate", "normalize_sheet_date")
+
+def _measure(fn, iterations, per_call=1):
+    lat = []
+    t0 = time.perf_counter()
+    for i in range(iterations):
+        t = time.perf_counter()
+        fn(i)
+        lat.append((time.perf_counter() - t) / per_call)
+    total = time.perf_counter() - t0
+    return {"ops_per_s": round(iterations * per_call / total, 1) if total else None,
+            "p50_ms": round(_pct(lat, 0.5) * 1000, 4), "p99_ms": round(_pct(lat, 0.99) * 1000, 4),
+            "n": iterations * per_call}
+
+def child(rows, users, latency_ms, iterations, only):
+    """Runs inside the per-size process (env already points at temp files)."""
+    from bench import data, fakes
+    fakes.install(latency_ms, data.ledger_rows(rows, users))
+    from services import ledger, rollups, summaries
+    from utils.dates import normalize_sheet_date, la_today
+    today = la_today().isoformat()
+    uid = ledger.OWNER
+    out = {}
+
+    def want(name):
+        return not only or name in only
+
+    if want("ledger_sync"):
+        t = time.perf_counter()
+        ledger.sync(force=True)
+        out["ledger_sync"] = {"ops_per_s": round(rows / (time.perf_counter() - t), 1), "p50_ms": None,
+                              "p99_ms": None, "n": rows, "total_s": round(time.perf_counter() - t, 3)}
+    else:
+        ledger.sync(force=True)
+
+    if want("build_daily_context"):
+        out["build_daily_context"] = _measure(lambda i: summaries.build_contexts(["day"], today, uid=uid), iterations)
+    if want("build_window_context"):
+        out["build_window_context"] = _measure(
+            lambda i: summaries.build_contexts(["week", "month"], today, uid=uid), iterations)
+    if want("aggregate"):
+        month = summaries.month_bounds(la_today())
+        wins = [summaries.trailing_bounds(today, 7), month, summaries.prev_month_bounds(month[0])]
+        out["aggregate"] = _measure(lambda i: rollups.windows_metrics(wins, uid), iterations)
+    if want("normalize_sheet_date"):
+        cells = data.date_cells(1000)
+        out["normalize_sheet_date"] = _measure(lambda i: [normalize_sheet_date(c) for c in cells], iterations, 1000)
+    if want("whatsapp_webhook"):
+        from app import app
+        client = app.test_client()
+        forms = data.webhook_forms(iterations, uid)
+        out["whatsapp_webhook"] = _measure(lambda i: client.post("/whatsapp", data=forms[i]), iterations)
+    return out
+
+def _git_sha():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return "nogit"
+
+def _run_size(rows, args):
+    with tempfile.TemporaryDirectory(prefix="bench-") as tmp:
+        from bench.data import users
+        env = dict(os.environ,
+                   LEDGER_DB_PATH=os.path.join(tmp, "ledger.db"), CACHE_DB_PATH=os.path.join(tmp, "cache.db"),
+                   QUEUE_DB_PATH=os.path.join(tmp, "queue.db"), WARMUP_ON_START="0", INGEST_MODE="sync",
+                   SUMMARY_PRECOMPUTE="0", OCR_BACKEND="ocrspace", ALLOWED_SENDERS="",
+                   SHEET_ID="bench", GROQ_API_KEY="bench", OCRSPACE_API_KEY="bench",
+                   TWILIO_ACCOUNT_SID="ACbench", TWILIO_AUTH_TOKEN="bench",
+                   TWILIO_WHATSAPP_FROM="whatsapp:+15550000000", YOUR_WHATSAPP_NUMBER=users(1)[0])
+        cmd = [sys.executable, "-m", "bench.run", "--child", str(rows), "--users", str(args.users),
+               "--latency-ms", str(args.latency_ms), "--iterations", str(args.iterations)]
+        if args.only:
+            cmd += ["--only", args.only]
+        p = subprocess.run(cmd, cwd=ROOT, env=env, capture_output=True, text=True)
+        if p.returncode:
+            raise SystemExit(f"bench for {rows} rows failed:\n{p.stderr[-4000:]}")
+        return json.loads(p.stdout.strip().splitlines()[-1])
+
+def _baseline(path):
+    if path:
+        with open(path) as f:
+            return json.load(f)
+    files = sorted(f for f in os.listdir(RESULTS_DIR) if f.endswith(".json")) if os.path.isdir(RESULTS_DIR) else []
+    if not files:
+        return None
+    with open(os.path.join(RESULTS_DIR, files[-1])) as f:
+        return json.load(f)
+
+def compare(current, baseline, threshold):
+    """[(size, target, old p50, new p50)] for targets whose p50 grew by more than `threshold`."""
+    worse = []
+    for size, targets in current["results"].items():
+        for name, r in targets.items():
+            old = baseline["results"].get(size, {}).get(name, {})
+            key = "p50_ms" if r.get("p50_ms") is not None else "total_s"
+            if old.get(key) and r.get(key) and r[key] > old[key] * (1 + threshold):
+                worse.append((size, name, old[key], r[key]))
+    return worse
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rows", default="1000,10000,100000", help="comma-separated ledger sizes")
+    ap.add_argument("--users", type=int, default=1)
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="simulated round trip per fake API call")
+    ap.add_argument("--iterations", type=int, default=200)
+    ap.add_argument("--only", default="", help=f"comma-separated subset of: {', '.join(TARGETS)}")
+    ap.add_argument("--baseline", help="results file to compare with (default: the latest in bench/results)")
+    ap.add_argument("--threshold", type=float, default=0.2, help="allowed p50 slowdown before flagging")
+    ap.add_argument("--no-save", action="store_true")
+    ap.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+    only = {t for t in args.only.split(",") if t}
+
+    if args.child is not None:
+        print(json.dumps(child(args.child, args.users, args.latency_ms, args.iterations, only)))
+        return 0
+
+    baseline = _baseline(args.baseline)
+    current = {"sha": _git_sha(), "at": dt.datetime.now(dt.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+               "params": {"users": args.users, "latency_ms": args.latency_ms, "iterations": args.iterations},
+               "results": {}}
+    for rows in [int(r) for r in args.rows.split(",") if r]:
+        res = current["results"][str(rows)] = _run_size(rows, args)
+        print(f"-- {rows} rows")
+        for name, r in res.items():
+            print(f"{name:>22}: " + "  ".join(f"{k}={v}" for k, v in r.items() if v is not None))
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{current['at'].replace(':', '')}-{current['sha']}.json")
+        with open(path, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"saved {path}")
+
+    if baseline:
+        if baseline.get("params") != current["params"]:
+            print(f"note: baseline {baseline.get('sha')} used different params {baseline.get('params')}")
+        worse = compare(current, baseline, args.threshold)
+        for size, name, old, new in worse:
+            print(f"REGRESSION {name} @ {size} rows: {old} -> {new} (vs {baseline.get('sha')})")
+        if worse:
+            return 1
+        print(f"no regressions vs {baseline.get('sha')} (threshold {args.threshold:.0%})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -17,6 +17,13 @@ GROQ_API_KEY = os.getenv("GROQ_API_KEY")  # required
 OCR_BACKEND = os.getenv("OCR_BACKEND", "ocrspace")  # ocrspace | tesseract
 OCRSPACE_API_KEY = os.getenv("OCRSPACE_API_KEY")    # required if ocrspace
 TESSERACT_CMD = os.getenv("TESSERACT_CMD", r"C:\Program Files\Tesseract-OCR\tesseract.exe")
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "0"))              # tesseract processes per web worker; 0 = cores / WEB_CONCURRENCY
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))      # web server processes sharing the CPU (gunicorn -w)
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", "2000"))         # px; images are scaled to about this long side
+OCR_TESSERACT_CONFIG = os.getenv("OCR_TESSERACT_CONFIG", "--psm 4")  # psm 4 suits single-column receipts
+MEDIA_CONCURRENCY = int(os.getenv("MEDIA_CONCURRENCY", "8"))  # attachments / pages downloaded and OCR'd at once (per process)
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "10"))         # pages OCR'd per PDF attachment
+PDF_RENDER_DPI = int(os.getenv("PDF_RENDER_DPI", "200"))
 
 # Twilio WhatsApp
 TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")      # required
@@ -24,5 +31,89 @@ TWILIO_AUTH_TOKEN  = os.getenv("TWILIO_AUTH_TOKEN")       # required
 TWILIO_WHATSAPP_FROM = os.getenv("TWILIO_WHATSAPP_FROM")  # e.g., whatsapp:+14155238886
 YOUR_WHATSAPP_NUMBER = os.getenv("YOUR_WHATSAPP_NUMBER")  # e.g., whatsapp:+1XXXXXXXXXX
 
+# Multi-user: each row records its sender (column J) and summaries are per sender.
+# Rows without a sender belong to YOUR_WHATSAPP_NUMBER.
+ALLOWED_SENDERS = {s.strip() for s in os.getenv("ALLOWED_SENDERS", "").split(",") if s.strip()}  # empty = anyone
+SUMMARY_FANOUT_WORKERS = int(os.getenv("SUMMARY_FANOUT_WORKERS", "8"))  # users summarised in parallel
+TWILIO_SEND_RATE = float(os.getenv("TWILIO_SEND_RATE", "10"))  # messages/second per process; 0 = unlimited
+
 # Optional: protect cron endpoints (add ?token=... to your scheduler call)
 INTERNAL_CRON_TOKEN = os.getenv("INTERNAL_CRON_TOKEN")
+
+# Local ledger cache (SQLite mirror of the transactions sheet)
+LEDGER_DB_PATH = os.getenv("LEDGER_DB_PATH", "ledger.db")
+LEDGER_SYNC_INTERVAL = float(os.getenv("LEDGER_SYNC_INTERVAL", "60"))  # seconds between tail syncs
+
+# Webhook ingestion: "sync" answers after logging; "async" acks at once and
+# logs from a durable queue, confirming later via send_whatsapp
+INGEST_MODE = os.getenv("INGEST_MODE", "sync")  # sync | async
+QUEUE_DB_PATH = os.getenv("QUEUE_DB_PATH", "queue.db")
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))       # threads per gunicorn worker
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "5"))
+
+# Sheets writes: concurrent appends are coalesced into one bulk append. Reads are paged
+SHEETS_BATCH_SIZE = int(os.getenv("SHEETS_BATCH_SIZE", "100"))       # rows per append; 1 disables buffering
+SHEETS_BATCH_WAIT_MS = int(os.getenv("SHEETS_BATCH_WAIT_MS", "0"))    # extra linger to gather a batch
+SHEETS_WRITE_TIMEOUT = float(os.getenv("SHEETS_WRITE_TIMEOUT", "60")) # seconds a caller waits for its row
+SHEETS_READ_PAGE = int(os.getenv("SHEETS_READ_PAGE", "5000"))          # rows per ranged read; bounds memory per sync
+
+# Multi-input extraction: pending messages / import lines per LLM request
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "16"))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "8"))  # queue jobs claimed per worker round
+
+# Bulk import (python -m services.backfill)
+BACKFILL_CONCURRENCY = int(os.getenv("BACKFILL_CONCURRENCY", "4"))  # parallel LLM calls
+
+# Fast-path parser for simple text messages; below this confidence the LLM is used
+QUICKPARSE_ENABLED = os.getenv("QUICKPARSE_ENABLED", "1") == "1"
+QUICKPARSE_MIN_CONFIDENCE = float(os.getenv("QUICKPARSE_MIN_CONFIDENCE", "0.8"))
+
+# Shared OCR / LLM result cache (SQLite file, shared by all workers)
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "1") == "1"
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", "cache.db")
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "20000"))
+CACHE_TTL_DAYS = float(os.getenv("CACHE_TTL_DAYS", "30"))
+CACHE_PHASH = os.getenv("CACHE_PHASH", "0") == "1"  # also match re-compressed images by perceptual hash
+
+# AI summary texts are cached by a fingerprint of their context (in the result cache);
+# optionally regenerate the current day/week/month in the background after each message
+SUMMARY_PRECOMPUTE = os.getenv("SUMMARY_PRECOMPUTE", "0") == "1"
+SUMMARY_PRECOMPUTE_DELAY = float(os.getenv("SUMMARY_PRECOMPUTE_DELAY", "20"))  # seconds; bursts share one run
+# Week/month prompts list the top K categories / merchants (the rest fold into one line)
+SUMMARY_TOP_K = int(os.getenv("SUMMARY_TOP_K", "10"))
+SUMMARY_TOKEN_BUDGET = int(os.getenv("SUMMARY_TOKEN_BUDGET", "1200"))  # approx. tokens of window data per prompt
+
+# Outbound HTTP (Twilio, OCR.Space, media downloads, Sheets reads)
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))   # keep-alive connections per host per worker
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))        # retries with backoff on 429/5xx
+WARMUP_ON_START = os.getenv("WARMUP_ON_START", "1") == "1"
+# Background warm-up after start: sheets (client), http (pre-connect), llm (client), ledger (tail sync), ocr
+WARMUP_STEPS = [s.strip() for s in os.getenv("WARMUP_STEPS", "sheets,http,llm,ledger,ocr").split(",") if s.strip()]
+
+# ASGI serving mode (asgi.py): max in-flight calls per upstream, per process
+ASYNC_MAX_MEDIA = int(os.getenv("ASYNC_MAX_MEDIA", "32"))
+ASYNC_MAX_OCR = int(os.getenv("ASYNC_MAX_OCR", "8"))
+ASYNC_MAX_LLM = int(os.getenv("ASYNC_MAX_LLM", "16"))
+ASYNC_MAX_TWILIO = int(os.getenv("ASYNC_MAX_TWILIO", "16"))
+ASYNC_MAX_THREADS = int(os.getenv("ASYNC_MAX_THREADS", "16"))  # blocking work (Sheets, SQLite, tesseract)
+
+# Metrics (/metrics) and the slow-request log (/debug-slow); per worker process
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_SLOW_MS = float(os.getenv("METRICS_SLOW_MS", "3000"))      # requests at least this slow are logged
+METRICS_SLOW_SAMPLE = float(os.getenv("METRICS_SLOW_SAMPLE", "1"))  # fraction of slow requests logged
+METRICS_SLOW_LOG_SIZE = int(os.getenv("METRICS_SLOW_LOG_SIZE", "100"))  # kept for /debug-slow
+
+# Ledger analytics (/analytics/*); the week/month summary contexts get a compact digest
+ANALYTICS_IN_SUMMARIES = os.getenv("ANALYTICS_IN_SUMMARIES", "1") == "1"
+ANALYTICS_ANOMALY_Z = float(os.getenv("ANALYTICS_ANOMALY_Z", "3"))  # std devs above the category mean
+ANALYTICS_CACHE_USERS = int(os.getenv("ANALYTICS_CACHE_USERS", "32"))  # users' column arrays kept in memory
+
+# Budget rules (JSON list, see services/budgets.py), checked on every logged expense
+BUDGETS_PATH = os.getenv("BUDGETS_PATH", "budgets.json")  # no file = no rules
+BUDGET_ALERTS = os.getenv("BUDGET_ALERTS", "reply")       # reply (added to the confirmation) | push (separate message) | off
+BUDGET_WARN_AT = float(os.getenv("BUDGET_WARN_AT", "0.8"))  # monthly caps also warn at this fraction
+
+# Duplicate expenses on ingest: same amount + merchant within a few days, or the same receipt again
+DUPES_POLICY = os.getenv("DUPES_POLICY", "off")  # off | skip | flag (log it, with a note) | ask (log on YES); opt-in
+DUPES_WINDOW_DAYS = int(os.getenv("DUPES_WINDOW_DAYS", "1"))
+DUPES_ASK_TTL_MIN = float(os.getenv("DUPES_ASK_TTL_MIN", "60"))  # held duplicates expire after this
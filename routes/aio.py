@@ -0,0 +1,140 @@
+"""Async handlers for the hot endpoints, served by asgi.py.
+
+Same URLs and responses as routes/whatsapp.py and routes/summary.py; anything
+not listed here falls through to the Flask app.
+"""
+import asyncio
+from functools import partial
+from urllib.parse import parse_qsl
+from starlette.requests import Request
+from starlette.responses import Response, PlainTextResponse, JSONResponse
+from starlette.routing import Route
+from twilio.twiml.messaging_response import MessagingResponse
+
+from services import aio, jobqueue, ledger, metrics, summaries
+from services.ingest import sender_allowed, IngestError, NOT_ALLOWED
+from utils.dates import la_today
+from config import INGEST_MODE, INTERNAL_CRON_TOKEN, SUMMARY_FANOUT_WORKERS
+
+def _twiml(text=None):
+    resp = MessagingResponse()
+    if text:
+        resp.message(text)
+    return Response(str(resp), media_type="application/xml")
+
+@metrics.traced("whatsapp_webhook")
+async def whatsapp_webhook(request: Request):
+    # Twilio posts urlencoded forms; parse directly rather than pull in python-multipart
+    form = dict(parse_qsl((await request.body()).decode("utf-8"), keep_blank_values=True))
+    if not sender_allowed(form.get("From") or ""):
+        return _twiml(NOT_ALLOWED)
+    if INGEST_MODE == "async":
+        if not await aio.run_blocking(jobqueue.enqueue, form):
+            return _twiml()  # redelivery
+        return _twiml("Got it, logging your expense…")
+    try:
+        return _twiml(await aio.handle_message(form))
+    except IngestError as e:
+        return _twiml(str(e))
+
+def _cron_guard(request):
+    if INTERNAL_CRON_TOKEN and request.query_params.get("token") != INTERNAL_CRON_TOKEN:
+        return PlainTextResponse("Unauthorized", status_code=401)
+    return None
+
+async def _summary_text(kind, ctx, refresh=False):
+    return summaries.empty_text(kind, ctx) or await aio.summarize(ctx, window=kind != "day", refresh=refresh)
+
+def _refresh(request):
+    return request.query_params.get("refresh") == "1"
+
+def _uid(request):
+    # ?user= only with the cron token; see routes/auth.py
+    user = request.query_params.get("user")
+    if user and INTERNAL_CRON_TOKEN and request.query_params.get("token") == INTERNAL_CRON_TOKEN:
+        return user
+    return ledger.OWNER
+
+async def _daily(request: Request, send: bool):
+    if send and (guard := _cron_guard(request)):
+        return guard
+    uid = _uid(request)
+    ctxs = await aio.run_blocking(summaries.build_contexts, ["day"], request.query_params.get("date"), uid=uid)
+    ctx = ctxs["day"]
+    body = await _summary_text("day", ctx, _refresh(request))
+    if not send:
+        return PlainTextResponse(body)
+    await aio.send_whatsapp(body, to=uid or None)
+    return JSONResponse({"ok": True, "sent": body, "date_used": ctx["date_used"]})
+
+async def _window(request: Request, label: str, send: bool):
+    if send and (guard := _cron_guard(request)):
+        return guard
+    uid = _uid(request)
+    ctxs = await aio.run_blocking(summaries.build_contexts, [label], request.query_params.get("date"), uid=uid)
+    ctx = ctxs[label]
+    start_iso, end_iso = ctx["window"]["start"], ctx["window"]["end"]
+    text = await _summary_text(label, ctx, _refresh(request))
+    if not send:
+        return PlainTextResponse(f"[{label} used: {start_iso} → {end_iso}]\n{text}")
+    await aio.send_whatsapp(text, to=uid or None)
+    return JSONResponse({"ok": True, "sent": text, label: [start_iso, end_iso]})
+
+@metrics.traced("summaries_cron")
+async def summaries_cron(request: Request):
+    if guard := _cron_guard(request):
+        return guard
+    date_iso = request.query_params.get("date") or la_today().isoformat()
+    kinds = summaries.requested_kinds(request.query_params.get("kinds"), date_iso)
+    user = _uid(request) if request.query_params.get("user") else None
+    if not user:
+        await aio.run_blocking(ledger.sync)
+    uids = [user] if user else await aio.run_blocking(ledger.users)
+    task = asyncio.create_task(_send_all(kinds, date_iso, uids, _refresh(request)))
+    _cron_tasks.add(task)  # keep a reference until it finishes
+    task.add_done_callback(_cron_tasks.discard)
+    return JSONResponse({"ok": True, "started": True, "date": date_iso, "kinds": kinds, "users": len(uids)},
+                        status_code=202)
+
+_cron_tasks = set()
+
+async def _send_all(kinds, date_iso, uids, refresh):
+    # Same claims as summaries.send_all: a summary already sent for this date is skipped
+    gate = asyncio.Semaphore(SUMMARY_FANOUT_WORKERS)
+    failed = {}
+
+    async def send_for(uid):
+        async with gate:
+            todo = [k for k in kinds if await aio.run_blocking(summaries.claim_send, uid, k, date_iso)]
+            sent = 0
+            try:
+                if not todo:
+                    return
+                ctxs = await aio.run_blocking(summaries.build_contexts, todo, date_iso, uid=uid)
+                texts = await asyncio.gather(*(_summary_text(k, ctxs[k], refresh) for k in todo))
+                # Sent in order so the day, week and month messages arrive in that order
+                for text in texts:
+                    await aio.send_whatsapp(text, to=uid or None)
+                    sent += 1
+            except Exception as e:
+                await aio.run_blocking(summaries.release_send, uid, todo[sent:], date_iso)
+                print(f"Summary for {uid} failed: {e}")
+                failed[uid] = str(e)
+
+    await asyncio.gather(*(send_for(uid) for uid in uids))
+    print(f"Summaries for {date_iso}: {len(uids) - len(failed)}/{len(uids)} users done")
+
+async def health(request: Request):
+    return PlainTextResponse("ok")
+
+routes = [
+    Route("/health", health),
+    Route("/whatsapp", whatsapp_webhook, methods=["POST"]),
+    Route("/daily-summary-ai-preview", metrics.traced("daily_summary_ai_preview")(partial(_daily, send=False))),
+    Route("/daily-summary-ai", metrics.traced("daily_summary_ai")(partial(_daily, send=True))),
+    Route("/weekly-summary-ai-preview", metrics.traced("weekly_summary_ai_preview")(partial(_window, label="week", send=False))),
+    Route("/weekly-summary-ai", metrics.traced("weekly_summary_ai")(partial(_window, label="week", send=True))),
+    Route("/monthly-summary-ai-preview", metrics.traced("monthly_summary_ai_preview")(partial(_window, label="month", send=False))),
+    Route("/monthly-summary-ai", metrics.traced("monthly_summary_ai")(partial(_window, label="month", send=True))),
+    Route("/summaries", summaries_cron),
+]
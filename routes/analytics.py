@@ -0,0 +1,82 @@
+import datetime as dt
+from flask import Blueprint, request, jsonify
+
+from services import ledger, metrics
+from routes.auth import request_uid as _uid
+
+bp = Blueprint("analytics", __name__)
+
+MAX_DAYS = 3660  # ten years of daily buckets is plenty for any window
+
+class BadParam(ValueError):
+    pass
+
+@bp.errorhandler(BadParam)
+def bad_param(e):
+    return str(e), 400, {"Content-Type":"text/plain"}
+
+def _int(name, default, hi=MAX_DAYS, raw=None):
+    raw = raw if raw is not None else request.args.get(name) or default
+    try:
+        value = int(raw)
+    except (TypeError, ValueError):
+        raise BadParam(f"{name} must be a whole number")
+    if not 1 <= value <= hi:
+        raise BadParam(f"{name} must be between 1 and {hi}")
+    return value
+
+def _date(name):
+    value = request.args.get(name)
+    if value:
+        try:
+            dt.date.fromisoformat(value)
+        except ValueError:
+            raise BadParam(f"{name} must be YYYY-MM-DD")
+    return value
+
+@bp.get("/analytics/trend")
+@metrics.traced("analytics_trend")
+def trend():
+    from services import analytics  # NumPy loads on first use
+    args = (_uid(), _int("months", 12, hi=120), _date("date"))
+    ledger.sync()
+    return jsonify(analytics.category_trend(*args)), 200
+
+@bp.get("/analytics/rolling")
+@metrics.traced("analytics_rolling")
+def rolling():
+    from services import analytics  # NumPy loads on first use
+    windows = tuple(_int("windows", None, raw=w) for w in (request.args.get("windows") or "7,30").split(","))
+    args = (_uid(), _int("days", 90), windows, _date("date"))
+    ledger.sync()
+    return jsonify(analytics.rolling_averages(*args)), 200
+
+@bp.get("/analytics/merchants")
+@metrics.traced("analytics_merchants")
+def merchants():
+    from services import analytics  # NumPy loads on first use
+    args = (_uid(), _int("top", 25), _date("start"), _date("end"))
+    ledger.sync()
+    return jsonify(analytics.merchant_stats(*args)), 200
+
+@bp.get("/analytics/recurring")
+@metrics.traced("analytics_recurring")
+def recurring():
+    from services import analytics  # NumPy loads on first use
+    args = (_uid(), _int("min", 3))
+    ledger.sync()
+    return jsonify(analytics.recurring_charges(*args, date=_date("date"))), 200
+
+@bp.get("/analytics/anomalies")
+@metrics.traced("analytics_anomalies")
+def anomalies():
+    from services import analytics  # NumPy loads on first use
+    z = request.args.get("z")
+    try:
+        z = float(z) if z else None
+    except ValueError:
+        raise BadParam("z must be a number")
+    args = (_uid(), _date("since"), _date("end"), z)
+    days = _int("days", 30)
+    ledger.sync()
+    return jsonify(analytics.anomalies(*args, days=days)), 200
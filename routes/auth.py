@@ -0,0 +1,26 @@
+"""Access checks shared by the Flask blueprints.
+
+Cron endpoints and reads of another user's ledger (`?user=`) need
+`?token=INTERNAL_CRON_TOKEN`. Without a token configured, cron endpoints stay
+open (as before) but `?user=` is ignored, so an open deployment only ever
+shows the owner's data.
+"""
+from flask import request
+
+from services import ledger
+from config import INTERNAL_CRON_TOKEN
+
+def authorized() -> bool:
+    return bool(INTERNAL_CRON_TOKEN) and request.args.get("token") == INTERNAL_CRON_TOKEN
+
+def cron_guard():
+    if not INTERNAL_CRON_TOKEN:
+        return None  # no guard configured
+    if not authorized():
+        return ("Unauthorized", 401, {"Content-Type":"text/plain"})
+    return None
+
+def request_uid():
+    """?user=whatsapp:+1... picks another user's ledger (token required); default is the owner."""
+    user = request.args.get("user")
+    return user if user and authorized() else ledger.OWNER
@@ -1,8 +1,10 @@
 from flask import Blueprint, request, jsonify
 from services.llm import extract_with_llm
-from services.sheets import get_values_client, read_all_rows
+from services.sheets import get_values_client, iter_row_blocks
+from services import budgets, dupes, ledger, quickparse, cache, metrics, startup
 from utils.dates import la_today, row_date_iso
-from config import SHEET_ID
+from routes.auth import authorized, request_uid
+from config import SHEET_ID, DUPES_WINDOW_DAYS
 
 bp = Blueprint("debug", __name__)
 
@@ -10,6 +12,19 @@ bp = Blueprint("debug", __name__)
 def health():
     return "ok", 200
 
+@bp.get("/metrics")
+def metrics_endpoint():
+    # Prometheus text format; each worker process reports its own numbers
+    return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+@bp.get("/debug-startup")
+def debug_startup():
+    return jsonify(startup.report()), 200
+
+@bp.get("/debug-slow")
+def debug_slow():
+    return jsonify(metrics.slow_requests()), 200
+
 @bp.get("/routes")
 def list_routes():
     # Light introspection
@@ -25,25 +40,67 @@ def debug_llm():
     except Exception as e:
         return f"LLM failed: {e}", 500
 
+@bp.get("/debug-quickparse")
+def debug_quickparse():
+    q = request.args.get("q")
+    data = quickparse.parse(q, request_uid()) if q else (None, None)
+    return jsonify({"parsed": data[0], "confidence": data[1], "stats": quickparse.stats()}), 200
+
+@bp.get("/debug-cache")
+def debug_cache():
+    return jsonify(cache.stats()), 200
+
 @bp.get("/debug-sheets")
 def debug_sheets():
     try:
         client = get_values_client()
-        res = client.get(spreadsheetId=SHEET_ID, range="transactions!A:I").execute()
+        # column A only: counting rows should not pull the whole sheet
+        res = client.get(spreadsheetId=SHEET_ID, range="transactions!A:A").execute()
         count = max(0, len(res.get("values", [])) - 1)
         return f"Sheets OK. Rows={count}", 200
     except Exception as e:
         return f"Sheets failed: {e}", 500
 
+@bp.get("/debug-budgets")
+def debug_budgets():
+    # ?reload=1 re-reads BUDGETS_PATH in this worker; ?user= needs ?token=
+    try:
+        budgets.rules(reload=request.args.get("reload") == "1")
+        return jsonify(budgets.status(request_uid())), 200
+    except Exception as e:
+        return f"Budgets failed: {e}", 500
+
+@bp.get("/debug-dupes")
+def debug_dupes():
+    # Owner's rows only; with ?token=, ?user= picks a user and no ?user= scans everyone
+    uid = request.args.get("user") if authorized() else ledger.OWNER
+    try:
+        return jsonify(dupes.scan(uid, int(request.args.get("days", DUPES_WINDOW_DAYS)))), 200
+    except Exception as e:
+        return f"Duplicate scan failed: {e}", 500
+
+@bp.get("/debug-ledger")
+def debug_ledger():
+    try:
+        fetched = ledger.sync(force=request.args.get("force") == "1")
+        return jsonify({"rows": ledger.row_count(), "fetched": fetched, "users": len(ledger.users()),
+                        "synced_through": ledger.get_meta("synced_through")}), 200
+    except Exception as e:
+        return f"Ledger failed: {e}", 500
+
 @bp.get("/debug-summary-data")
 def debug_summary_data():
-    rows = read_all_rows()
-    today = la_today().isoformat()
+    # Raw rows carry the sender's number: only the requesting user's (see request_uid)
+    uid = request_uid()
+    today = la_today()
     parsed = []
-    for i, r in enumerate(rows[:20]):
-        parsed.append({"i": i, "raw": r, "parsed_date": row_date_iso(r),
-                       "amount": r[3] if len(r) > 3 else None,
-                       "category": r[5] if len(r) > 5 else None})
-    todays = [r for r in rows if row_date_iso(r) == today]
-    return jsonify({"row_count": len(rows), "today_LA": today,
-                    "todays_count": len(todays), "first_rows": parsed}), 200
+    for start, rows in iter_row_blocks(2, 21):
+        for i, r in enumerate(rows):
+            if ledger.row_uid(r) != uid:
+                continue
+            parsed.append({"i": start + i - 2, "raw": r, "parsed_date": row_date_iso(r),
+                           "amount": r[3] if len(r) > 3 else None,
+                           "category": r[5] if len(r) > 5 else None})
+    todays = sum(1 for _ in ledger.fetch_window(today, today, uid))
+    return jsonify({"user": uid, "row_count": ledger.row_count(), "today_LA": today.isoformat(),
+                    "todays_count": todays, "first_rows": parsed}), 200
@@ -0,0 +1,249 @@
+"""Async counterparts of the service calls, used by the ASGI serving mode (asgi.py).
+
+Network calls share one pooled httpx.AsyncClient / AsyncGroq per process and
+each upstream is capped by its own semaphore. Libraries without an async API
+(googleapiclient, SQLite, tesseract) run in threads, capped by ASYNC_MAX_THREADS.
+Caching, parsing and normalisation are shared with the sync services.
+"""
+import io, time, asyncio, hashlib, tempfile
+import httpx
+
+from config import (GROQ_API_KEY, OCR_BACKEND, OCRSPACE_API_KEY, CACHE_PHASH, HTTP_POOL_SIZE, HTTP_RETRIES,
+                    TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_WHATSAPP_FROM, YOUR_WHATSAPP_NUMBER,
+                    ASYNC_MAX_MEDIA, ASYNC_MAX_OCR, ASYNC_MAX_LLM, ASYNC_MAX_TWILIO, ASYNC_MAX_THREADS,
+                    SHEETS_BATCH_SIZE, SHEETS_WRITE_TIMEOUT)
+from services import cache, ledger, llm, metrics, ocr
+from services.http import RETRY_STATUSES
+from services.ingest import (ALREADY_LOGGED, already_logged, append_expenses, attachment_texts, finish_attachments,
+                             quick_results, screen_duplicates, confirmed_duplicates, extraction_failed,
+                             append_failed, logged)
+from services.messaging import twilio_limiter
+from services.sheets import submit_transaction_row, append_transaction_row
+
+SPOOL_MAX = 1 << 20  # media above 1 MB spills from memory to a temp file
+
+_client = None
+_groq = None
+_sems = {}
+
+def _sem(name):
+    if name not in _sems:
+        limit = {"media": ASYNC_MAX_MEDIA, "ocr": ASYNC_MAX_OCR, "llm": ASYNC_MAX_LLM,
+                 "twilio": ASYNC_MAX_TWILIO, "threads": ASYNC_MAX_THREADS}[name]
+        _sems[name] = asyncio.Semaphore(limit)
+    return _sems[name]
+
+def client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=HTTP_POOL_SIZE * 8, max_keepalive_connections=HTTP_POOL_SIZE),
+            timeout=httpx.Timeout(30, connect=10),
+        )
+    return _client
+
+def groq():
+    global _groq
+    if _groq is None:
+        from groq import AsyncGroq
+        _groq = AsyncGroq(api_key=GROQ_API_KEY)
+    return _groq
+
+async def aclose():
+    if _client is not None:
+        await _client.aclose()
+    if _groq is not None:
+        await _groq.close()
+
+async def run_blocking(fn, *args, **kw):
+    async with _sem("threads"):
+        return await asyncio.to_thread(fn, *args, **kw)
+
+async def request(method, url, *, retry_statuses=RETRY_STATUSES, rewind=None, **kw):
+    """HTTP call with backoff on `retry_statuses` and connection failures."""
+    for attempt in range(HTTP_RETRIES + 1):
+        if rewind:
+            rewind.seek(0)
+        wait = 0.0
+        try:
+            r = await client().request(method, url, **kw)
+        except (httpx.ConnectError, httpx.ConnectTimeout):
+            if attempt == HTTP_RETRIES:
+                raise
+        else:
+            if r.status_code not in retry_statuses or attempt == HTTP_RETRIES:
+                r.raise_for_status()
+                return r
+            wait = float(r.headers.get("Retry-After") or 0)
+        await asyncio.sleep(max(wait, 0.5 * 2 ** attempt))
+
+# ---- Media + OCR
+async def fetch_media(url: str):
+    """Stream a Twilio media URL into a spooled temp file. Returns (file, sha256 hex)."""
+    f = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX)
+    h = hashlib.sha256()
+    async with _sem("media"):
+        with metrics.stage("media_download"):
+            async with client().stream("GET", url, auth=(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN),
+                                       follow_redirects=True) as r:
+                r.raise_for_status()
+                async for chunk in r.aiter_bytes():
+                    f.write(chunk)
+                    h.update(chunk)
+    f.seek(0)
+    return f, h.hexdigest()
+
+async def _ocr_file(f, sha) -> str:
+    phash = thumb = None
+    if CACHE_PHASH:
+        phash, thumb = ocr.perceptual_hash(f.read())
+        f.seek(0)
+    keys = ocr.ocr_cache_keys(sha, phash)
+    hit = ocr.cached_ocr(keys, thumb)
+    if hit is not None:
+        return hit
+    with metrics.stage("ocr"):
+        if OCR_BACKEND.lower() == "tesseract":
+            async with _sem("ocr"):
+                text = await asyncio.to_thread(ocr.ocr_via_tesseract, f.read())
+        else:
+            text = await ocr_via_ocrspace(f)
+    ocr.store_ocr(keys, text, thumb)
+    return text
+
+async def ocr_via_ocrspace(f) -> str:
+    if not OCRSPACE_API_KEY:
+        raise RuntimeError("Missing OCRSPACE_API_KEY")
+    async with _sem("ocr"):
+        r = await request(
+            "POST", "https://api.ocr.space/parse/image", rewind=f,
+            headers={"apikey": OCRSPACE_API_KEY},
+            data={"language": "eng", "scale": "true", "isTable": "true"},
+            files={"file": ("receipt.jpg", f, "application/octet-stream")},
+        )
+    return ocr.parse_ocrspace_response(r.json())
+
+async def ocr_from_media_url(media_url: str, content_type: str = "") -> str:
+    f, sha = await fetch_media(media_url)
+    with f:
+        if not ocr.is_pdf(f.read(5), content_type):
+            f.seek(0)
+            return await _ocr_file(f, sha)
+        f.seek(0)
+        pages = await run_blocking(ocr.pdf_pages, f.read())
+    texts = await asyncio.gather(*(_ocr_file(io.BytesIO(p), hashlib.sha256(p).hexdigest()) for p in pages))
+    return "\n\n".join(t for t in texts if t)
+
+# ---- LLM
+async def extract_expenses(text: str) -> list:
+    """Async twin of `services.llm.extract_expenses` (one input per request: the
+    event loop overlaps requests instead of batching them)."""
+    key = llm._expenses_cache_key(text)
+    hit = cache.get("llm-expenses", key)
+    if hit is not None:
+        return hit
+    async with _sem("llm"):
+        with metrics.stage("llm_extract"):
+            r = await groq().chat.completions.create(**llm.batch_request([text]))
+    got = llm.parse_batch_response(r.choices[0].message.content, [text])
+    if 0 not in got:
+        raise ValueError("LLM returned no valid result for this input")
+    llm.cache_expenses(key, got[0], text)
+    return got[0]
+
+async def summarize(context: dict, window: bool = False, refresh: bool = False) -> str:
+    msg = llm.summary_message(context, window)
+    key = llm.summary_cache_key(context, window, msg)
+    if not refresh:
+        hit = cache.get("summary", key)
+        if hit is not None:
+            return hit
+    async with _sem("llm"):
+        t0 = time.perf_counter()
+        with metrics.stage("llm_summary"):
+            r = await groq().chat.completions.create(**llm.summary_request(context, window, msg))
+        llm.record_summary(window, msg, r, time.perf_counter() - t0)
+    text = r.choices[0].message.content.strip()
+    cache.put("summary", key, text)
+    return text
+
+# ---- Twilio
+async def send_whatsapp(body: str, to: str = None):
+    to = to or YOUR_WHATSAPP_NUMBER
+    if not all([TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_WHATSAPP_FROM, to]):
+        raise RuntimeError("Missing Twilio env vars")
+    await asyncio.sleep(twilio_limiter.reserve())
+    async with _sem("twilio"):
+        # Only 429 is retried: a 5xx on a send may already have delivered
+        with metrics.stage("twilio_send"):
+            await request(
+                "POST", f"https://api.twilio.com/2010-04-01/Accounts/{TWILIO_ACCOUNT_SID}/Messages.json",
+                retry_statuses=(429,), auth=(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN),
+                data={"From": TWILIO_WHATSAPP_FROM, "To": to, "Body": body},
+            )
+    return True
+
+# ---- Ingestion
+async def append_row(data: dict, source: str, msg_sid: str, user: str = ""):
+    if SHEETS_BATCH_SIZE <= 1:
+        return await run_blocking(append_transaction_row, data, source, msg_sid, user)
+    # Wait on the write buffer's Future without parking a thread per request. shield: a
+    # timeout must not cancel it, the row stays queued (see sheets.append_transaction_row)
+    with metrics.stage("sheets_append"):
+        fut = asyncio.wrap_future(submit_transaction_row(data, source, msg_sid, user))
+        try:
+            return await asyncio.wait_for(asyncio.shield(fut), SHEETS_WRITE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"sheet append still pending after {SHEETS_WRITE_TIMEOUT:g}s") from None
+
+async def extract_message(form) -> tuple:
+    """Async twin of `services.ingest.extract_message`."""
+    body = (form.get("Body") or "").strip()
+    num_media = int(form.get("NumMedia", "0") or 0)
+    source = "image" if num_media > 0 else "text"
+    if source == "text":
+        texts = [body]
+        results = quick_results(form, body) or [await extract_expenses(body)]
+    else:
+        # Attachments (and a PDF's pages) are fetched and OCR'd concurrently, capped by the media/ocr semaphores
+        items = ocr.media_items(form)
+        ocr_texts = await asyncio.gather(*(ocr_from_media_url(u, t) for u, t in items)) if items else [""]
+        texts = attachment_texts(body, ocr_texts)
+        results = await asyncio.gather(*(extract_expenses(t) for t in texts))
+        return finish_attachments(texts, results, ocr_texts), source
+    return finish_attachments(texts, results), source
+
+async def handle_message(form) -> str:
+    """Async twin of `services.ingest.handle_message`. Raises IngestError."""
+    msg_sid = form.get("MessageSid") or ""
+    if await run_blocking(already_logged, msg_sid):
+        return ALREADY_LOGGED
+    user = form.get("From") or ""
+    held = await run_blocking(confirmed_duplicates, form)
+    # Pull the sheet tail into the ledger while OCR/LLM are in flight
+    tail = asyncio.create_task(run_blocking(ledger.sync))
+    try:
+        if held:
+            (expenses, source), note = held, ""
+        else:
+            try:
+                expenses, source = await extract_message(form)
+            except Exception as e:
+                raise extraction_failed(e) from e
+    finally:
+        try:
+            await tail  # duplicate checks should see hand-added rows too
+        except Exception as e:
+            print(f"Ledger sync failed: {e}")
+    if not held:
+        expenses, note = await run_blocking(screen_duplicates, user, expenses, source)
+    if not expenses:
+        return note
+    try:
+        if len(expenses) == 1:
+            rows = [await append_row(expenses[0], source, msg_sid, user)]
+        else:
+            rows = await run_blocking(append_expenses, expenses, source, msg_sid, user)
+    except Exception as e:
+        raise append_failed(expenses, e) from e
+    return await run_blocking(logged, user, expenses, rows, note)
@@ -0,0 +1,216 @@
+"""Columnar analytics over one user's ledger (NumPy).
+
+A user's dated rows are loaded once into parallel arrays (day ordinal, amount,
+category and merchant codes) and kept until `ledger.version()` changes. Every
+query is a few vectorised passes over those arrays (bincount, lexsort, cumsum)
+instead of a Python loop per row, so a full ledger answers in milliseconds.
+"""
+import threading, functools
+import datetime as dt
+from collections import OrderedDict
+import numpy as np
+
+from services import ledger, metrics
+from utils.dates import la_today
+from utils.rows import to_ordinal
+from config import ANALYTICS_CACHE_USERS, ANALYTICS_ANOMALY_Z
+
+EPOCH = dt.date(1970, 1, 1).toordinal()
+# (name, min days, max days) between charges of a recurring expense
+CADENCES = (("weekly", 6, 8), ("biweekly", 13, 15), ("monthly", 27, 33), ("quarterly", 85, 97), ("yearly", 355, 375))
+
+class Columns:
+    """One user's rows in date order; `cat`/`merch` index into `cats`/`merchants`."""
+    __slots__ = ("row", "day", "amt", "cat", "merch", "cats", "merchants")
+
+_cache = OrderedDict()  # uid -> (ledger version, Columns)
+_lock = threading.Lock()
+
+def _codes(values):
+    index = {}
+    codes = np.fromiter((index.setdefault(v, len(index)) for v in values), dtype=np.int64, count=len(values))
+    return codes, list(index)
+
+def _load(uid):
+    rows = ledger.get_conn().execute(
+        "SELECT row_num, day, amt, COALESCE(NULLIF(category, ''), 'other'), COALESCE(NULLIF(name, ''), 'Unknown') "
+        "FROM rows WHERE uid=? AND day IS NOT NULL AND amt IS NOT NULL ORDER BY day, row_num", (uid,)).fetchall()
+    row, day, amt, cat, merch = zip(*rows) if rows else ((),) * 5
+    c = Columns()
+    c.row = np.array(row, dtype=np.int64)
+    c.day = np.array(day, dtype=np.int64)
+    c.amt = np.array(amt, dtype=np.float64)
+    c.cat, c.cats = _codes(cat)
+    c.merch, c.merchants = _codes(merch)
+    return c
+
+def columns(uid=ledger.OWNER) -> Columns:
+    v = ledger.version()
+    with _lock:
+        hit = _cache.get(uid)
+        if hit and hit[0] == v:
+            _cache.move_to_end(uid)
+            return hit[1]
+    with metrics.stage("analytics_load"):
+        cols = _load(uid)
+    with _lock:
+        _cache[uid] = (v, cols)
+        _cache.move_to_end(uid)
+        while len(_cache) > ANALYTICS_CACHE_USERS:
+            _cache.popitem(last=False)
+    return cols
+
+def _iso(ordinal):
+    return dt.date.fromordinal(int(ordinal)).isoformat()
+
+def _end(date):
+    return dt.date.fromisoformat(date) if date else la_today()
+
+def _r(a):
+    return [round(float(x), 2) for x in a]
+
+def _months(days):
+    # months since 1970-01 for an array of date ordinals
+    return (days - EPOCH).astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+
+def _group_quantiles(groups, values, ngroups, qs):
+    """Per-group quantiles of `values` (linear interpolation), shape (len(qs), ngroups);
+    NaN where a group is empty. Returns (quantiles, counts)."""
+    order = np.lexsort((values, groups))
+    v = values[order]
+    counts = np.bincount(groups, minlength=ngroups)
+    starts = np.cumsum(counts) - counts
+    out = np.full((len(qs), ngroups), np.nan)
+    has = counts > 0
+    s, n = starts[has], counts[has]
+    for i, q in enumerate(qs):
+        pos = s + q * (n - 1)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.minimum(lo + 1, s + n - 1)
+        frac = pos - lo
+        out[i, has] = v[lo] * (1 - frac) + v[hi] * frac
+    return out, counts
+
+def category_trend(uid=ledger.OWNER, months=12, date=None):
+    """Spend per category per calendar month, for the `months` months ending at `date`'s month."""
+    c = columns(uid)
+    end = _end(date)
+    end_m = (end.year - 1970) * 12 + end.month - 1
+    start_m = end_m - months + 1
+    m = _months(c.day)
+    sel = (m >= start_m) & (m <= end_m)
+    grid = np.bincount(c.cat[sel] * months + (m[sel] - start_m), weights=c.amt[sel],
+                       minlength=len(c.cats) * months).reshape(len(c.cats), months)
+    order = np.argsort(-grid.sum(axis=1), kind="stable")
+    return {"months": [f"{1970 + (start_m + i) // 12}-{(start_m + i) % 12 + 1:02d}" for i in range(months)],
+            "total": _r(grid.sum(axis=0)),
+            "categories": {c.cats[i]: _r(grid[i]) for i in order if grid[i].any()}}
+
+def rolling_averages(uid=ledger.OWNER, days=90, windows=(7, 30), date=None):
+    """Daily spend for the last `days` days up to `date`, with trailing averages over each of `windows`."""
+    c = columns(uid)
+    end = _end(date).toordinal()
+    span = days + max(windows) - 1
+    start = end - span + 1
+    sel = (c.day >= start) & (c.day <= end)
+    daily = np.bincount(c.day[sel] - start, weights=c.amt[sel], minlength=span)
+    cum = np.concatenate(([0.0], np.cumsum(daily)))
+    out = {"days": [_iso(d) for d in range(end - days + 1, end + 1)], "daily": _r(daily[-days:])}
+    for w in windows:
+        out[f"avg_{w}d"] = _r(((cum[w:] - cum[:-w]) / w)[-days:])
+    return out
+
+def merchant_stats(uid=ledger.OWNER, top=25, start=None, end=None, qs=(0.5, 0.9, 0.99)):
+    """Count, total, mean and amount percentiles per merchant, biggest total first."""
+    c = columns(uid)
+    sel = np.ones(len(c.day), dtype=bool)
+    if start:
+        sel &= c.day >= to_ordinal(start)
+    if end:
+        sel &= c.day <= to_ordinal(end)
+    g, a = c.merch[sel], c.amt[sel]
+    q, counts = _group_quantiles(g, a, len(c.merchants), qs)
+    totals = np.bincount(g, weights=a, minlength=len(c.merchants))
+    out = []
+    for i in np.argsort(-totals, kind="stable")[:top]:
+        if not counts[i]:
+            continue
+        row = {"merchant": c.merchants[i], "count": int(counts[i]), "total": round(float(totals[i]), 2),
+               "mean": round(float(totals[i] / counts[i]), 2)}
+        row.update({f"p{int(p * 100)}": round(float(q[k, i]), 2) for k, p in enumerate(qs)})
+        out.append(row)
+    return out
+
+def recurring_charges(uid=ledger.OWNER, min_occurrences=3, max_amount_cv=0.25, max_gap_cv=0.25, date=None):
+    """Merchants charged on a regular cadence for a steady amount, e.g. subscriptions and rent."""
+    c = columns(uid)
+    nm = len(c.merchants)
+    order = np.lexsort((c.day, c.merch))
+    g, d, a = c.merch[order], c.day[order], c.amt[order]
+    same = g[1:] == g[:-1]
+    gaps = (d[1:] - d[:-1])[same]
+    gg = g[1:][same]
+    pos = gaps > 0  # several charges on one day count once
+    gaps, gg = gaps[pos].astype(np.float64), gg[pos]
+    med_gap, ngaps = _group_quantiles(gg, gaps, nm, (0.5,))
+    med_gap = med_gap[0]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        gap_mean = np.bincount(gg, weights=gaps, minlength=nm) / ngaps
+        gap_cv = np.sqrt(np.maximum(np.bincount(gg, weights=gaps ** 2, minlength=nm) / ngaps - gap_mean ** 2, 0)) / gap_mean
+        n = np.bincount(g, minlength=nm)
+        amt_mean = np.bincount(g, weights=a, minlength=nm) / n
+        amt_cv = np.sqrt(np.maximum(np.bincount(g, weights=a ** 2, minlength=nm) / n - amt_mean ** 2, 0)) / np.abs(amt_mean)
+    last = d[np.cumsum(n) - 1] if len(d) else np.zeros(nm, dtype=np.int64)
+    ok = (ngaps >= min_occurrences - 1) & (gap_cv <= max_gap_cv) & (amt_cv <= max_amount_cv)
+    today = _end(date).toordinal()
+    out = []
+    for i in np.flatnonzero(ok):
+        cadence = next((name for name, lo, hi in CADENCES if lo <= med_gap[i] <= hi), None)
+        if not cadence:
+            continue
+        interval = int(round(med_gap[i]))
+        out.append({"merchant": c.merchants[i], "cadence": cadence, "interval_days": interval,
+                    "amount": round(float(amt_mean[i]), 2), "count": int(n[i]), "last": _iso(last[i]),
+                    "next_expected": _iso(last[i] + interval), "active": bool(today - last[i] <= interval * 1.5)})
+    return sorted(out, key=lambda r: -r["amount"])
+
+def anomalies(uid=ledger.OWNER, since=None, end=None, z=None, min_history=5, days=30):
+    """Expenses dated from `since` (default: the last `days` days) whose amount is `z` or more
+    standard deviations above their category's mean before `since`."""
+    c = columns(uid)
+    z = ANALYTICS_ANOMALY_Z if z is None else z
+    since_o = to_ordinal(since) if since else la_today().toordinal() - days + 1
+    hist = c.day < since_o
+    new = ~hist if not end else (~hist & (c.day <= to_ordinal(end)))
+    nc = len(c.cats)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        n = np.bincount(c.cat[hist], minlength=nc)
+        mean = np.bincount(c.cat[hist], weights=c.amt[hist], minlength=nc) / n
+        std = np.sqrt(np.maximum(np.bincount(c.cat[hist], weights=c.amt[hist] ** 2, minlength=nc) / n - mean ** 2, 0))
+        cat, amt = c.cat[new], c.amt[new]
+        score = (amt - mean[cat]) / std[cat]
+    flag = (n[cat] >= min_history) & (std[cat] > 0) & (score >= z)
+    idx = np.flatnonzero(new)[flag]
+    out = [{"row": int(c.row[i]), "date": _iso(c.day[i]), "name": c.merchants[c.merch[i]],
+            "category": c.cats[c.cat[i]], "amount": round(float(c.amt[i]), 2),
+            "z": round(float(s), 2), "category_mean": round(float(mean[c.cat[i]]), 2)}
+           for i, s in zip(idx, score[flag])]
+    return {"since": _iso(since_o), "threshold": z, "flags": sorted(out, key=lambda r: -r["z"])}
+
+def window_insights(uid, start, end, top=3):
+    """Compact extras for a week/month summary context: unusual expenses in the window,
+    recurring charges seen in it and the 3-month trend of its biggest categories.
+    Reused until the ledger changes; treat the result as read-only."""
+    return _window_insights(ledger.version(), uid, start, end, top)
+
+@functools.lru_cache(maxsize=256)
+def _window_insights(version, uid, start, end, top):
+    s, e = to_ordinal(start), to_ordinal(end)
+    trend = category_trend(uid, 3, end)
+    recurring = [{k: r[k] for k in ("merchant", "cadence", "amount")}
+                 for r in recurring_charges(uid, date=end) if s <= to_ordinal(r["last"]) <= e]
+    return {"unusual": [{k: f[k] for k in ("date", "name", "category", "amount", "category_mean")}
+                        for f in anomalies(uid, start, end)["flags"][:top]],
+            "recurring": recurring[:top * 2],
+            "category_trend_3m": {"months": trend["months"],
+                                  "categories": dict(list(trend["categories"].items())[:top])}}
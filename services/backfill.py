@@ -0,0 +1,324 @@
+"""Bulk import of bank CSV exports and WhatsApp chat exports.
+
+    python -m services.backfill statement.csv
+    python -m services.backfill "WhatsApp Chat.txt" --format whatsapp --concurrency 8 [--sender "Sam"]
+
+The file is streamed through generator stages (parse -> deterministic
+pre-extraction via services.quickparse -> LLM for the ambiguous lines -> bulk sheet append), so memory
+stays bounded by the batch size. Progress is checkpointed after every append;
+re-running the same command resumes where it stopped and retries the lines
+whose LLM call failed. Each imported row gets
+MessageSid `import:[<user>:]<file>:<line>`, so lines already in the ledger are skipped.
+"""
+import os, re, csv, sys, json, time, argparse
+import datetime as dt
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from config import BACKFILL_CONCURRENCY, SHEETS_BATCH_SIZE, LLM_BATCH_SIZE
+from services.llm import extract_batch, normalize_extraction
+from services.sheets import append_transaction_rows
+from services import ledger, quickparse
+from utils.dates import normalize_sheet_date
+
+SOURCE = "import"
+
+# ---- Stage 1: parse
+_DATE_COLS = ("date", "transaction date", "posted date", "posting date", "booking date", "value date")
+_DESC_COLS = ("description", "merchant", "payee", "name", "details", "memo", "narrative")
+_SIGNED_COLS = ("amount", "amount (usd)", "transaction amount")
+_DEBIT_COLS = ("debit", "withdrawal", "withdrawals", "debit amount")
+_CREDIT_COLS = ("credit", "deposit", "deposits", "credit amount")
+
+def _pick(header, names):
+    for name in names:
+        if name in header:
+            return header[name]
+    return None
+
+def _money(s):
+    s = (s or "").strip().replace(",", "").replace("$", "")
+    if s.startswith("(") and s.endswith(")"):
+        s = "-" + s[1:-1]
+    try: return float(s)
+    except: return None
+
+def parse_csv(f, start_line=0, charges_positive=False, retry=()):
+    """Yield {line, text, date, name, amount} per bank statement row.
+
+    A single signed amount column is read as negative = spend (most banks);
+    card exports that list charges as positive need `charges_positive`. Lines up to
+    `start_line` are skipped unless listed in `retry`.
+    """
+    reader = csv.reader(f)
+    raw_header = next(reader, None)
+    if not raw_header:
+        return
+    header = {h.strip().lower(): i for i, h in enumerate(raw_header)}
+    i_date, i_desc = _pick(header, _DATE_COLS), _pick(header, _DESC_COLS)
+    i_debit, i_credit = _pick(header, _DEBIT_COLS), _pick(header, _CREDIT_COLS)
+    i_signed = _pick(header, _SIGNED_COLS) if i_debit is None else None
+    for line, cells in enumerate(reader, start=2):
+        if (line <= start_line and line not in retry) or not any(cells):
+            continue
+        cell = lambda i: cells[i].strip() if i is not None and i < len(cells) else ""
+        if i_signed is not None:
+            amount = _money(cell(i_signed))
+            if amount is not None and (amount < 0) == charges_positive and amount != 0:
+                continue  # money in, not an expense
+        else:
+            amount = _money(cell(i_debit))
+            if amount is None and _money(cell(i_credit)):
+                continue
+        yield {"line": line, "text": ", ".join(c.strip() for c in cells if c.strip()),
+               "date": normalize_sheet_date(cell(i_date)), "name": cell(i_desc) or None,
+               "amount": abs(amount) if amount is not None else None}
+
+# "8/23/25, 9:14 PM - Name: text"  or  "[23/08/2025, 21:14:05] Name: text"
+_WA_LINE = re.compile(r"^\[?(\d{1,2}/\d{1,2}/\d{2,4}),?\s+[\d:]+(?:\s?[APap][Mm])?\]?\s*(?:-\s*)?([^:]+):\s(.*)$")
+_WA_SKIP = ("<media omitted>", "this message was deleted", "messages and calls are end-to-end encrypted")
+# Starts of the bot's own replies (services.ingest), which a chat with the bot also contains
+_BOT_REPLY = re.compile(r"^(logged:|logged \d+ expenses:|got it, logging|already logged|parsed but sheet append"
+                        r"|llm/ocr error|this number isn't set up|⚠️|🚨|❓)", re.I)
+
+def scan_chat(f):
+    """(sender, dayfirst) for a chat export. The sender to import is, with the bot in the
+    chat, the participant who is not sending its replies, else whoever wrote the most.
+    Dates are D/M if any first field is over 12, M/D otherwise (also when it can't tell)."""
+    sent, replies = Counter(), Counter()
+    dayfirst = False
+    for raw in f:
+        m = _WA_LINE.match(raw.rstrip("\n"))
+        if m:
+            sender, body = m.group(2).strip(), m.group(3).strip()
+            sent[sender] += 1
+            replies[sender] += bool(_BOT_REPLY.match(body))
+            dayfirst = dayfirst or int(m.group(1).split("/")[0]) > 12
+    bot = max(replies, key=replies.get) if any(replies.values()) else None
+    people = [s for s, _ in sent.most_common() if s != bot]
+    return (people[0] if people else None), dayfirst
+
+def _chat_date(s, dayfirst=False):
+    # Exports use the phone's locale: M/D/YY or D/M/YYYY, the same all through a file
+    if not dayfirst:
+        return normalize_sheet_date(s)
+    a, b, y = s.split("/")
+    return normalize_sheet_date(f"{b}/{a}/{y}")
+
+def parse_whatsapp(f, start_line=0, sender=None, retry=(), dayfirst=False):
+    """Yield one record per chat message (only `sender`'s, if given); continuation
+    lines join their message. The bot's replies are always skipped."""
+    cur = None
+    for line, raw in enumerate(f, start=1):
+        text = raw.rstrip("\n")
+        m = _WA_LINE.match(text)
+        if not m:
+            if cur and text.strip():
+                cur["text"] += "\n" + text.strip()
+            continue
+        if cur:
+            yield cur
+        cur = None
+        date_str, who, body = m.groups()
+        if (line <= start_line and line not in retry) or not body.strip() or body.strip().lower() in _WA_SKIP:
+            continue
+        if (sender and who.strip() != sender) or _BOT_REPLY.match(body.strip()):
+            continue
+        cur = {"line": line, "text": body.strip(), "date": _chat_date(date_str, dayfirst),
+               "name": None, "amount": None}
+    if cur:
+        yield cur
+
+# ---- Stage 2: deterministic pre-extraction
+def _sent(rec):
+    """Date a chat line was written, the reference for its relative dates (None for a statement row)."""
+    if rec["name"] or not rec["date"]:
+        return None
+    return dt.date.fromisoformat(rec["date"])
+
+def pre_extract(records, uid=ledger.OWNER):
+    """Attach `data` to records that need no LLM; the rest pass through without it."""
+    learned = quickparse.learned_merchants(uid)
+    for rec in records:
+        if rec["name"]:
+            # Statement row: amount/date/merchant are given, only the category is missing
+            hit = learned.get(rec["name"].lower())
+            cat = hit[1] if hit else quickparse.keyword_category(rec["name"])
+            if rec["amount"] is not None and rec["date"] and cat:
+                rec["expenses"] = [{"name": rec["name"], "amount": rec["amount"], "currency": "USD",
+                                    "category": cat, "date": rec["date"], "notes": rec["text"][:200]}]
+        else:
+            # "yesterday" in a chat line means the day before it was sent, not before the import
+            data = quickparse.quick_parse(rec["text"], uid, _sent(rec))
+            if data:
+                data["date"] = data["date"] or rec["date"]
+                rec["expenses"] = [data]
+        yield rec
+
+# ---- Stage 3: LLM for ambiguous lines, LLM_BATCH_SIZE lines per request
+def _llm_group(recs):
+    results = extract_batch([rec["text"] for rec in recs], sent=[_sent(rec) for rec in recs])
+    for rec, res in zip(recs, results):
+        if isinstance(res, Exception):
+            rec["error"] = str(res)
+            continue
+        if rec["name"]:
+            # A statement line is one transaction, and its parsed facts beat the model's guesses
+            data = res[0] if res else normalize_extraction({}, rec["text"])
+            data["name"] = rec["name"]
+            if rec["amount"] is not None:
+                data["amount"] = rec["amount"]
+            res = [data]
+        for data in res:
+            data["date"] = data.get("date") or rec["date"]
+        rec["expenses"] = res
+    return recs
+
+def llm_stage(records, pool, concurrency, stats, batch_size=None):
+    """Run the LLM over records lacking `expenses`, batch_size records per request and
+    at most `concurrency` requests in flight. Records come out in file order."""
+    batch_size = max(1, batch_size or LLM_BATCH_SIZE)
+    window = deque()  # (record, its LLM group or None), in file order
+    group = None
+
+    def submit(g):
+        nonlocal group
+        stats["llm"] += 1
+        g["future"] = pool.submit(_llm_group, g["recs"])
+        if g is group:
+            group = None
+
+    def settle(rec, g):
+        if g is not None:
+            if g["future"] is None:
+                submit(g)  # still filling, but an older record is due
+            g["future"].result()
+        return rec
+
+    for rec in records:
+        g = None
+        if "expenses" not in rec:
+            if group is None:
+                group = {"recs": [], "future": None}
+            g = group
+            g["recs"].append(rec)
+            if len(g["recs"]) >= batch_size:
+                submit(g)
+        window.append((rec, g))
+        while len(window) > concurrency * batch_size * 2:
+            yield settle(*window.popleft())
+    if group is not None:
+        submit(group)
+    while window:
+        yield settle(*window.popleft())
+
+# ---- Stage 4: bulk append
+def chunked(records, size):
+    chunk = []
+    for rec in records:
+        chunk.append(rec)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _load_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def _save_checkpoint(path, state):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+def run(path, fmt=None, concurrency=None, batch_size=None, checkpoint=None,
+        charges_positive=False, user="", sender=None, dayfirst=None, log=print):
+    fmt = fmt or ("csv" if path.lower().endswith(".csv") else "whatsapp")
+    concurrency = concurrency or BACKFILL_CONCURRENCY
+    batch_size = batch_size or SHEETS_BATCH_SIZE
+    checkpoint = checkpoint or path + ".checkpoint.json"
+    state = _load_checkpoint(checkpoint)
+    stats = {"written": 0, "skipped": 0, "failed": 0, "llm": 0, **state.get("stats", {})}
+    start_line = state.get("line", 0)
+    failed = set(state.get("failed_lines", []))  # lines whose LLM call failed, retried on resume
+    tag = os.path.basename(path)
+    if user:
+        tag = f"{user}:{tag}"  # two users may import files with the same name
+    t0 = time.monotonic()
+    if start_line:
+        log(f"Resuming {tag} after line {start_line}" + (f", retrying {len(failed)} failed lines" if failed else ""))
+
+    if fmt == "whatsapp" and (not sender or dayfirst is None):
+        with open(path, encoding="utf-8-sig") as f:
+            found, found_dayfirst = scan_chat(f)
+        if not sender:
+            sender = found
+            log(f"Importing messages from {sender!r} (--sender to pick another participant)")
+        if dayfirst is None:
+            dayfirst = found_dayfirst
+            log(f"Reading dates as {'D/M' if dayfirst else 'M/D'} (--dayfirst / --monthfirst to override)")
+
+    ledger.sync(force=True)
+    with open(path, newline="" if fmt == "csv" else None, encoding="utf-8-sig") as f, \
+         ThreadPoolExecutor(max_workers=concurrency) as pool:
+        parsed = (parse_csv(f, start_line, charges_positive, failed) if fmt == "csv"
+                  else parse_whatsapp(f, start_line, sender, failed, dayfirst))
+        records = pre_extract(parsed, user or ledger.OWNER)
+        for chunk in chunked(llm_stage(records, pool, concurrency, stats), batch_size):
+            items = []
+            for rec in chunk:
+                msg_sid = f"{SOURCE}:{tag}:{rec['line']}"
+                if "error" in rec:
+                    failed.add(rec["line"])
+                    log(f"  line {rec['line']}: LLM failed ({rec['error']})")
+                    continue
+                failed.discard(rec["line"])
+                if ledger.has_msg_sid(msg_sid) or not rec["expenses"]:
+                    stats["skipped"] += 1  # already imported, or a chat line with no expense
+                else:
+                    for k, data in enumerate(rec["expenses"]):
+                        if not data.get("date"):
+                            data["date"] = rec["date"]
+                        # A line holding several expenses logs each; extra ones get a #k suffix
+                        items.append((data, SOURCE, msg_sid if k == 0 else f"{msg_sid}#{k}", user))
+            if items:
+                results = append_transaction_rows(items)
+                errors = [r for r in results if isinstance(r, Exception)]
+                if errors:
+                    # Stop without advancing the checkpoint; a re-run retries this chunk
+                    raise RuntimeError(f"Sheet append failed near line {chunk[0]['line']}: {errors[0]}")
+                stats["written"] += len(items)
+            stats["failed"] = len(failed)
+            _save_checkpoint(checkpoint, {"path": path, "line": max(start_line, chunk[-1]["line"]),
+                                          "failed_lines": sorted(failed), "stats": stats})
+            rate = stats["written"] / max(1e-9, time.monotonic() - t0)
+            log(f"line {chunk[-1]['line']}: written={stats['written']} skipped={stats['skipped']} "
+                f"failed={stats['failed']} llm_calls={stats['llm']} ({rate:.1f} rows/s)")
+    return stats
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Backfill expenses from a bank CSV or WhatsApp chat export.")
+    ap.add_argument("path")
+    ap.add_argument("--format", choices=["csv", "whatsapp"], help="default: by file extension")
+    ap.add_argument("--concurrency", type=int, help=f"parallel LLM calls (default {BACKFILL_CONCURRENCY})")
+    ap.add_argument("--batch-size", type=int, help=f"rows per sheet append (default {SHEETS_BATCH_SIZE})")
+    ap.add_argument("--checkpoint", help="checkpoint file (default <path>.checkpoint.json)")
+    ap.add_argument("--charges-positive", action="store_true",
+                    help="CSV amount column lists spending as positive numbers")
+    ap.add_argument("--user", default="", help="WhatsApp address the rows belong to (default: YOUR_WHATSAPP_NUMBER)")
+    ap.add_argument("--sender", help="chat export: participant name to import (default: the one who isn't the bot)")
+    order = ap.add_mutually_exclusive_group()
+    order.add_argument("--dayfirst", action="store_true", default=None, help="chat export dates are D/M/Y")
+    order.add_argument("--monthfirst", action="store_false", dest="dayfirst", help="chat export dates are M/D/Y")
+    args = ap.parse_args(argv)
+    stats = run(args.path, args.format, args.concurrency, args.batch_size, args.checkpoint,
+                args.charges_positive, args.user, args.sender, args.dayfirst)
+    print(f"Done: {stats}")
+
+if __name__ == "__main__":
+    sys.exit(main())
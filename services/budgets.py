@@ -0,0 +1,150 @@
+"""Budget rules checked against every logged expense.
+
+Rules are a JSON list in BUDGETS_PATH:
+
+    [{"kind": "monthly", "category": "eating_out", "limit": 400},
+     {"kind": "daily", "merchant": "Uber", "limit": 60},
+     {"kind": "single", "limit": 250, "user": "whatsapp:+15551234567"}]
+
+`monthly` caps spend in a calendar month (with a warning at `warn_at`, default
+BUDGET_WARN_AT, of the cap), `daily` caps spend in one day and `single` flags
+one expense at or above the limit. A rule covers a category, a merchant or
+(neither) all spending; without "user" it applies to each user's own spend.
+
+Rules are indexed by scope, so an expense only looks at the rules for its
+category, its merchant and total spend. Running totals are the per-day buckets
+in `services.rollups`, which the write-through has already updated when the
+check runs: a day is one bucket lookup, a month at most 31 days of buckets.
+An alert fires when an expense crosses a threshold, not again for later ones.
+"""
+import json, threading
+import datetime as dt
+from collections import defaultdict
+from services import ledger, metrics
+from utils.dates import la_today
+from utils.rows import row_day
+from config import BUDGETS_PATH, BUDGET_WARN_AT
+
+KINDS = ("monthly", "daily", "single")
+
+_rules = None
+_lock = threading.Lock()
+
+def _scope(rule):
+    if rule.get("category"):
+        return ("category", rule["category"].strip().lower())
+    if rule.get("merchant"):
+        return ("merchant", rule["merchant"].strip().lower())
+    return ("total", "")
+
+def load(path=BUDGETS_PATH) -> dict:
+    """Rules in `path` indexed by scope ((kind, lowercased key) -> [rule]); {} if there is no file."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            rules = json.load(f)
+    except FileNotFoundError:
+        return {}
+    index = defaultdict(list)
+    for r in rules:
+        if r.get("kind") not in KINDS or not isinstance(r.get("limit"), (int, float)):
+            raise ValueError(f"Bad budget rule: {r}")
+        index[_scope(r)].append(r)
+    return dict(index)
+
+def rules(reload=False) -> dict:
+    global _rules
+    with _lock:
+        if _rules is None or reload:
+            _rules = load()
+        return _rules
+
+def _applies(rule, uid, kind):
+    return rule["kind"] == kind and rule.get("user") in (None, uid)
+
+def _label(rule):
+    if rule.get("name"):
+        return rule["name"]
+    return rule.get("category") or rule.get("merchant") or "Total spending"
+
+def _period(kind, day):
+    if kind == "daily":
+        return day, day
+    d = dt.date.fromordinal(day)
+    first = d.replace(day=1)
+    last = (first + dt.timedelta(days=32)).replace(day=1) - dt.timedelta(days=1)
+    return first.toordinal(), last.toordinal()
+
+def _when(kind, day):
+    if kind == "monthly":
+        return "this month" if day == la_today().replace(day=1).toordinal() else f"in {dt.date.fromordinal(day):%B}"
+    return "today" if day == la_today().toordinal() else f"on {dt.date.fromordinal(day).isoformat()}"
+
+def spent(uid, scope, first, last, conn=None) -> float:
+    """`uid`'s spend in `scope` between two date ordinals, from the day buckets."""
+    conn = conn or ledger.get_conn()
+    kind, key = scope
+    if kind == "total":
+        q, args = "kind='category'", ()
+    else:
+        q, args = "kind=? AND lower(key)=?", (kind, key)
+    return conn.execute(f"SELECT COALESCE(SUM(total), 0) FROM day_rollup WHERE uid=? AND day BETWEEN ? AND ? AND {q}",
+                        (uid, first, last, *args)).fetchone()[0]
+
+def check(uid, expenses) -> list:
+    """Alert texts for expenses that were just logged (and written through to the ledger) for `uid`."""
+    index = rules()
+    if not index:
+        return []
+    alerts = []
+    added = defaultdict(float)  # (scope, kind, day) -> this message's spend in it
+    with metrics.stage("budget_check"):
+        for d in expenses:
+            day = row_day([None, d.get("date") or ""])
+            try:
+                amt = float(d.get("amount"))
+            except (TypeError, ValueError):
+                continue
+            if day is None:
+                continue
+            keys = (("category", str(d.get("category") or "") or "other"),
+                    ("merchant", str(d.get("name") or "") or "Unknown"), ("total", ""))
+            for kind, key in keys:
+                scope = (kind, key.lower())
+                for r in index.get(scope, ()):
+                    if _applies(r, uid, "single") and amt >= r["limit"]:
+                        alerts.append(f"⚠️ {d.get('name') or 'Expense'} {amt:.2f} is over the "
+                                      f"{r['limit']:.2f} single-expense limit for {_label(r)}")
+                if scope in index:
+                    added[(scope, "daily", day)] += amt
+                    added[(scope, "monthly", _period("monthly", day)[0])] += amt
+        conn = ledger.get_conn()
+        for (scope, kind, day), amt in added.items():
+            hits = [r for r in index[scope] if _applies(r, uid, kind)]
+            if not hits:
+                continue
+            after = spent(uid, scope, *_period(kind, day), conn=conn)
+            before = after - amt
+            when = _when(kind, day)
+            for r in hits:
+                limit = r["limit"]
+                warn = limit * r.get("warn_at", BUDGET_WARN_AT)
+                if before < limit <= after:
+                    alerts.append(f"🚨 {_label(r)}: {after:.2f} spent {when}, over the {kind} budget of {limit:.2f}")
+                elif kind == "monthly" and before < warn <= after < limit:
+                    alerts.append(f"⚠️ {_label(r)}: {after:.2f} spent {when}, {after / limit:.0%} of the "
+                                  f"monthly budget of {limit:.2f}")
+    return alerts
+
+def status(uid, date=None) -> list:
+    """Every rule that applies to `uid` with its current spend, for /debug-budgets."""
+    day = (date or la_today()).toordinal()
+    out = []
+    for scope, rs in rules().items():
+        for r in rs:
+            if r.get("user") not in (None, uid):
+                continue
+            row = dict(r)
+            if r["kind"] != "single":
+                row["spent"] = round(spent(uid, scope, *_period(r["kind"], day)), 2)
+            out.append(row)
+    return out
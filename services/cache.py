@@ -0,0 +1,86 @@
+"""Content-addressed result cache shared by all workers (SQLite file).
+
+Entries live in namespaces ("ocr", "llm-extract", ...) under a caller-built
+key, usually a hash of the input. Entries expire after CACHE_TTL_DAYS and the
+least recently used ones are evicted past CACHE_MAX_ENTRIES.
+"""
+import os, json, time, hashlib, sqlite3, threading
+from config import CACHE_ENABLED, CACHE_DB_PATH, CACHE_MAX_ENTRIES, CACHE_TTL_DAYS
+
+TOUCH_EVERY = 60  # seconds; avoid a write on every hit just to bump `accessed`
+EVICT_EVERY = 100  # sets between eviction checks
+
+_local = threading.local()
+_lock = threading.Lock()
+_stats = {}
+_sets = 0
+
+def digest(*parts) -> str:
+    h = hashlib.sha256()
+    for p in parts:
+        h.update(p if isinstance(p, bytes) else str(p).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+def get_conn():
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "pid", None) != os.getpid():
+        conn = sqlite3.connect(CACHE_DB_PATH, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                ns TEXT, key TEXT, value TEXT, created REAL, accessed REAL,
+                PRIMARY KEY (ns, key)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache(accessed)")
+        _local.conn, _local.pid = conn, os.getpid()
+    return conn
+
+def _count(ns, outcome):
+    with _lock:
+        s = _stats.setdefault(ns, {"hits": 0, "misses": 0})
+        s[outcome] += 1
+
+def get(ns, key):
+    """Cached value or None."""
+    if not CACHE_ENABLED or not key:
+        return None
+    conn = get_conn()
+    r = conn.execute("SELECT value, created, accessed FROM cache WHERE ns=? AND key=?", (ns, key)).fetchone()
+    now = time.time()
+    if not r or now - r[1] > CACHE_TTL_DAYS * 86400:
+        _count(ns, "misses")
+        return None
+    if now - r[2] > TOUCH_EVERY:
+        conn.execute("UPDATE cache SET accessed=? WHERE ns=? AND key=?", (now, ns, key))
+    _count(ns, "hits")
+    return json.loads(r[0])
+
+def put(ns, key, value):
+    global _sets
+    if not CACHE_ENABLED or not key:
+        return
+    now = time.time()
+    conn = get_conn()
+    conn.execute("INSERT OR REPLACE INTO cache(ns, key, value, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                 (ns, key, json.dumps(value), now, now))
+    with _lock:
+        _sets += 1
+        due = _sets % EVICT_EVERY == 0
+    if due:
+        evict()
+
+def evict():
+    """Drop expired entries, then the least recently used beyond CACHE_MAX_ENTRIES."""
+    conn = get_conn()
+    conn.execute("DELETE FROM cache WHERE created < ?", (time.time() - CACHE_TTL_DAYS * 86400,))
+    n = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+    if n > CACHE_MAX_ENTRIES:
+        conn.execute("DELETE FROM cache WHERE rowid IN (SELECT rowid FROM cache ORDER BY accessed LIMIT ?)",
+                     (n - CACHE_MAX_ENTRIES,))
+
+def stats():
+    with _lock:
+        return {ns: dict(s) for ns, s in _stats.items()}
@@ -0,0 +1,87 @@
+"""Compact, token-budgeted context for the week/month summary prompts.
+
+`build_contexts` keeps every category and merchant of both windows for the JSON
+endpoints; the model only needs the biggest few. `window_prompt` ranks them by
+spend, folds the rest into one "(N others)" line, sets the previous window's
+amount and the change next to each, and writes small pipe-separated tables
+instead of JSON. If the estimate is still over SUMMARY_TOKEN_BUDGET it shrinks
+the top-K, then drops the analytics insights, and as a last resort cuts the text.
+"""
+from services import metrics
+from config import SUMMARY_TOKEN_BUDGET, SUMMARY_TOP_K
+
+CHARS_PER_TOKEN = 4  # rough average for English and numbers; avoids shipping a tokenizer
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+def _n(x):
+    return f"{x or 0:.2f}".rstrip("0").rstrip(".")
+
+def _change(cur, prev):
+    if not prev:
+        return "new" if cur else ""
+    return f"{(cur - prev) / prev:+.0%}"
+
+def _cell(s):
+    return str(s).replace("|", "/").replace("\n", " ")
+
+def ranked(cur: dict, prev: dict, k: int) -> list:
+    """[(name, amount, previous amount)] for the top `k` of `cur` by amount, plus one
+    ("(N others)", ...) row folding in the rest of both windows."""
+    order = sorted(cur.items(), key=lambda kv: (-kv[1], kv[0]))
+    rows = [(name, amt, prev.get(name, 0.0)) for name, amt in order[:k]]
+    if len(order) > k:
+        top = {name for name, _ in order[:k]}
+        rows.append((f"({len(order) - k} others)", sum(a for _, a in order[k:]),
+                     sum(a for name, a in prev.items() if name not in top)))
+    return rows
+
+def _table(title, rows):
+    return [f"{title} (name|amount|prev|change):"] + [f"{_cell(n)}|{_n(a)}|{_n(p)}|{_change(a, p)}" for n, a, p in rows]
+
+def _insights(ins):
+    lines = []
+    if ins.get("unusual"):
+        lines.append("unusual expenses (date|name|category|amount|category mean):")
+        lines += [f"{u['date']}|{_cell(u['name'])}|{u['category']}|{_n(u['amount'])}|{_n(u['category_mean'])}"
+                  for u in ins["unusual"]]
+    if ins.get("recurring"):
+        lines.append("recurring charges (merchant|cadence|amount):")
+        lines += [f"{_cell(r['merchant'])}|{r['cadence']}|{_n(r['amount'])}" for r in ins["recurring"]]
+    trend = ins.get("category_trend_3m") or {}
+    if trend.get("categories"):
+        lines.append(f"3-month trend ({','.join(trend['months'])}):")
+        lines += [f"{c}|{','.join(_n(a) for a in amts)}" for c, amts in trend["categories"].items()]
+    return lines
+
+def _render(ctx, k, insights):
+    w, prev = ctx["window"], ctx.get("previous_window")
+    m = w["metrics"]
+    pm = prev["metrics"] if prev else {}
+    span = f"{ctx['label']} {w['start']}..{w['end']}"
+    if prev:
+        span += f" vs previous {prev['start']}..{prev['end']}"
+    lines = [span,
+             f"total {_n(m['total'])} (prev {_n(pm.get('total'))}, {_change(m['total'], pm.get('total'))}); "
+             f"expenses {m['count']} (prev {pm.get('count', 0)}); avg/day {_n(w['avg_per_day'])}"]
+    lines += _table("categories", ranked(m["by_category"], pm.get("by_category") or {}, k))
+    lines += _table("merchants", ranked(m["by_merchant"], pm.get("by_merchant") or {}, k))
+    if insights and ctx.get("insights"):
+        lines += _insights(ctx["insights"])
+    return "\n".join(lines)
+
+def window_prompt(ctx, k=SUMMARY_TOP_K, budget=SUMMARY_TOKEN_BUDGET) -> str:
+    """Compact text of a week/month context, at most about `budget` tokens."""
+    ks = [max(1, k)]
+    while ks[-1] > 1:
+        ks.append(ks[-1] // 2)
+    for insights in (True, False):
+        for kk in ks:
+            text = _render(ctx, kk, insights)
+            if estimate_tokens(text) <= budget:
+                if (kk, insights) != (ks[0], True):
+                    metrics.inc("summary_context_trimmed_total", step="top_k" if insights else "insights")
+                return text
+    metrics.inc("summary_context_trimmed_total", step="cut")
+    return text[:budget * CHARS_PER_TOKEN]
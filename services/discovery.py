@@ -0,0 +1,56 @@
+"""Trimmed Sheets discovery document bundled with the app.
+
+google-api-python-client ships the full sheets.v4 document (~290 KB). Building
+`spreadsheets().values()` from it processes every schema, which takes a few
+hundred ms on a cold instance. The bundled copy keeps only the
+`spreadsheets.values` methods and the schemas they reference.
+
+    python -m services.discovery    # regenerate after upgrading google-api-python-client
+"""
+import os, json
+
+PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sheets.v4.values.json")
+
+def _refs(node, acc):
+    if isinstance(node, dict):
+        if "$ref" in node:
+            acc.add(node["$ref"])
+        for v in node.values():
+            _refs(v, acc)
+    elif isinstance(node, list):
+        for v in node:
+            _refs(v, acc)
+    return acc
+
+def trim(doc: dict) -> dict:
+    """`doc` reduced to spreadsheets.values and the schemas it can reach."""
+    values = doc["resources"]["spreadsheets"]["resources"]["values"]
+    need, seen = _refs(values, set()), set()
+    while need - seen:
+        name = (need - seen).pop()
+        seen.add(name)
+        _refs(doc["schemas"][name], need)
+    out = dict(doc)
+    out["resources"] = {"spreadsheets": {"resources": {"values": values}}}
+    out["schemas"] = {k: doc["schemas"][k] for k in sorted(seen)}
+    return out
+
+def load():
+    """The bundled document as a string, or None if it is missing."""
+    try:
+        with open(PATH, encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return None
+
+def main():
+    import googleapiclient
+    src = os.path.join(os.path.dirname(googleapiclient.__file__), "discovery_cache", "documents", "sheets.v4.json")
+    with open(src, encoding="utf-8") as f:
+        doc = trim(json.load(f))
+    with open(PATH, "w", encoding="utf-8") as f:
+        json.dump(doc, f, separators=(",", ":"), sort_keys=True)
+    print(f"Wrote {PATH} (revision {doc.get('revision')}, {len(doc['schemas'])} schemas)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Duplicate-expense detection.
+
+An expense is a likely duplicate of one of the same user's ledger rows with the
+same amount (to the cent) and merchant (normalized) dated within
+DUPES_WINDOW_DAYS of it, or of a receipt whose OCR text was already logged
+(`receipt_prints`, keyed by a fingerprint of the text). A check is an indexed
+probe on rows(uid, amt, day) plus one primary-key lookup, whatever the ledger size.
+
+Under DUPES_POLICY=ask, held expenses wait in `pending_dupes` (one message per
+user) until the user replies YES.
+
+`scan` finds duplicates already in the ledger with one sort and one linear pass:
+
+    python -m services.dupes [--user whatsapp:+1...] [--days 1] [--json]
+"""
+import re, json, time, hashlib, argparse
+import datetime as dt
+from services import ledger, metrics
+from utils.rows import row_day
+from config import DUPES_WINDOW_DAYS, DUPES_ASK_TTL_MIN
+
+_STORE_NO = re.compile(r"(#|no\.?\s*)\d+\s*$")
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+MIN_PRINT_CHARS = 20  # shorter OCR text ("image receipt", a blur) is not a usable fingerprint
+
+def init(conn):
+    conn.executescript("""
+        CREATE INDEX IF NOT EXISTS rows_uid_amt_day ON rows(uid, amt, day);
+        CREATE TABLE IF NOT EXISTS receipt_prints (uid TEXT, fp TEXT, row_num INTEGER, PRIMARY KEY (uid, fp));
+        CREATE TABLE IF NOT EXISTS pending_dupes (uid TEXT PRIMARY KEY, payload TEXT, created REAL);
+    """)
+
+def merchant_key(name) -> str:
+    """'Starbucks #1234' and 'STARBUCKS' both give 'starbucks'."""
+    name = _STORE_NO.sub("", str(name or "").strip().lower())
+    return _NON_ALNUM.sub("", name) or "unknown"
+
+def fingerprint(ocr_text):
+    """Fingerprint of a receipt's OCR text (case, spacing and punctuation ignored), or None."""
+    norm = _NON_ALNUM.sub("", (ocr_text or "").lower())
+    if len(norm) < MIN_PRINT_CHARS:
+        return None
+    return hashlib.sha1(norm.encode()).hexdigest()[:20]
+
+def _amount(d):
+    try:
+        return round(float(d.get("amount")), 2)
+    except (TypeError, ValueError):
+        return None
+
+def find(uid, data, days=DUPES_WINDOW_DAYS):
+    """(row number, reason) of a ledger row `data` (an extracted expense) likely duplicates, else None."""
+    conn = ledger.get_conn()
+    with metrics.stage("dupes_check"):
+        fp = data.get("fingerprint")
+        if fp:
+            r = conn.execute("SELECT row_num FROM receipt_prints WHERE uid=? AND fp=?", (uid, fp)).fetchone()
+            if r:
+                return r[0], "same receipt"
+        amt, day = _amount(data), row_day([None, data.get("date") or ""])
+        if amt is None or day is None:
+            return None
+        key = merchant_key(data.get("name"))
+        for row_num, name, d in conn.execute(
+                "SELECT row_num, name, day FROM rows WHERE uid=? AND amt BETWEEN ? AND ? AND day BETWEEN ? AND ?",
+                (uid, amt - 0.005, amt + 0.005, day - days, day + days)):
+            if merchant_key(name) == key:
+                return row_num, f"same amount and merchant on {dt.date.fromordinal(d).isoformat()}"
+    return None
+
+def remember(uid, expenses, row_nums):
+    """Record the receipt fingerprints of just-logged expenses."""
+    params = [(uid, d["fingerprint"], r) for d, r in zip(expenses, row_nums) if d.get("fingerprint")]
+    if params:
+        conn = ledger.get_conn()
+        with conn:
+            conn.executemany("INSERT OR IGNORE INTO receipt_prints(uid, fp, row_num) VALUES (?, ?, ?)", params)
+
+def hold(uid, expenses, source):
+    """Keep expenses for `uid` until they confirm them (replaces anything held before)."""
+    conn = ledger.get_conn()
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO pending_dupes(uid, payload, created) VALUES (?, ?, ?)",
+                     (uid, json.dumps({"expenses": expenses, "source": source}), time.time()))
+
+def take(uid):
+    """(expenses, source) held for `uid`, removing them; None if nothing (unexpired) is held."""
+    conn = ledger.get_conn()
+    with conn:
+        r = conn.execute("SELECT payload, created FROM pending_dupes WHERE uid=?", (uid,)).fetchone()
+        if not r:
+            return None
+        conn.execute("DELETE FROM pending_dupes WHERE uid=?", (uid,))
+    if time.time() - r[1] > DUPES_ASK_TTL_MIN * 60:
+        return None
+    held = json.loads(r[0])
+    return held["expenses"], held["source"]
+
+def scan(uid=None, days=DUPES_WINDOW_DAYS) -> list:
+    """Groups of likely duplicate ledger rows, biggest wasted amount first.
+
+    Rows are sorted by (user, cents, merchant key, day), so candidates end up
+    adjacent; one pass then chains rows at most `days` apart.
+    """
+    q = "SELECT uid, row_num, day, amt, name FROM rows WHERE day IS NOT NULL AND amt IS NOT NULL"
+    args = ()
+    if uid is not None:
+        q, args = q + " AND uid=?", (uid,)
+    with metrics.stage("dupes_scan"):
+        rows = sorted((u, round(a * 100), merchant_key(n), d, r, n) for u, r, d, a, n in ledger.get_conn().execute(q, args))
+    groups, cur = [], []
+    for row in rows + [None]:
+        if row and cur and row[:3] == cur[-1][:3] and row[3] - cur[-1][3] <= days:
+            cur.append(row)
+            continue
+        if len(cur) > 1:
+            groups.append([{"row": r[4], "date": dt.date.fromordinal(r[3]).isoformat(), "name": r[5],
+                            "amount": r[1] / 100, "user": r[0]} for r in cur])
+        cur = [row]
+    return sorted(groups, key=lambda g: -g[0]["amount"] * (len(g) - 1))
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Find likely duplicate rows in the ledger")
+    ap.add_argument("--user", help="only this sender (default: everyone)")
+    ap.add_argument("--days", type=int, default=DUPES_WINDOW_DAYS, help="max days between duplicates")
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args(argv)
+    ledger.sync(force=True)
+    groups = scan(args.user, args.days)
+    if args.json:
+        print(json.dumps(groups, indent=2))
+        return
+    for g in groups:
+        print(f"{g[0]['amount']:>10.2f}  {g[0]['name']}  " + ", ".join(f"row {r['row']} ({r['date']})" for r in g))
+    extra = sum(g[0]["amount"] * (len(g) - 1) for g in groups)
+    print(f"{len(groups)} groups, {sum(len(g) - 1 for g in groups)} extra rows, {extra:.2f} possibly double-counted")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Pooled, keep-alive HTTP sessions shared by the outbound service calls.
+
+One session per (process, policy). Sessions retry with exponential backoff on
+429/5xx and honour Retry-After. The "default" policy only retries idempotent
+methods (GET, HEAD, ...). A POST that went out may already have been processed,
+so "ocr" and "twilio" never retry read timeouts or dropped connections (read=0,
+other=0), only failures to connect and their listed statuses. Twilio is retried
+on 429 alone, because a 5xx on a send may already have delivered.
+"""
+import os, threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config import HTTP_POOL_SIZE, HTTP_RETRIES
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+_POLICIES = {
+    "default": {"status_forcelist": RETRY_STATUSES},  # urllib3's idempotent methods only
+    "ocr": {"status_forcelist": RETRY_STATUSES, "allowed_methods": None, "read": 0, "other": 0},
+    "twilio": {"status_forcelist": (429,), "allowed_methods": None, "read": 0, "other": 0},
+}
+
+_sessions = {}
+_lock = threading.Lock()
+
+def _build(policy):
+    retry = Retry(total=HTTP_RETRIES, backoff_factor=0.5, respect_retry_after_header=True,
+                  raise_on_status=False, **_POLICIES[policy])
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    s = requests.Session()
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+def get_session(policy="default") -> requests.Session:
+    key = (os.getpid(), policy)  # never share sockets across forked workers
+    s = _sessions.get(key)
+    if s is None:
+        with _lock:
+            s = _sessions.get(key) or _sessions.setdefault(key, _build(policy))
+    return s
+
+def warm_up(urls):
+    """Open keep-alive connections (TCP + TLS) to `urls` ahead of the first real call."""
+    for policy, url in urls:
+        try:
+            get_session(policy).head(url, timeout=5)
+        except Exception as e:
+            print(f"HTTP warm-up for {url} failed: {e}")
@@ -0,0 +1,223 @@
+import threading
+from services.llm import extract_expenses, extract_batch, normalize_extraction
+from services.quickparse import quick_parse
+from services.ocr import media_items, ocr_attachments
+from services.sheets import append_transaction_row, append_transaction_rows, wait_for_write
+from services import budgets, dupes, ledger, metrics, quickparse, summaries
+from services.messaging import send_whatsapp
+from utils.dates import la_today
+from config import QUICKPARSE_ENABLED, QUICKPARSE_MIN_CONFIDENCE, ALLOWED_SENDERS, BUDGET_ALERTS, DUPES_POLICY
+
+NOT_ALLOWED = "This number isn't set up for expense tracking."
+ALREADY_LOGGED = "Already logged this message."
+CONFIRM_WORDS = {"yes", "y", "yes log it", "log it"}
+
+class IngestError(Exception):
+    """Processing failed; str(e) is the reply to send back to the user."""
+
+def sender_allowed(sender: str) -> bool:
+    return not ALLOWED_SENDERS or sender in ALLOWED_SENDERS
+
+def pretty_expense(data):
+    pretty_amt = f'{data.get("currency","USD")} {data.get("amount")}' if data.get("amount") is not None else "Unknown amount"
+    return f"{data.get('name','?')} · {pretty_amt} · {data.get('category','?')} · {data.get('date','?')}"
+
+def logged_reply(expenses):
+    if len(expenses) == 1:
+        return f"Logged: {pretty_expense(expenses[0])}"
+    return f"Logged {len(expenses)} expenses:\n" + "\n".join(f"• {pretty_expense(d)}" for d in expenses)
+
+def batchable_text(form):
+    """Text this message would send to the LLM when that can be batched with others
+    (text-only and not handled by the quick parser), else None."""
+    if int(form.get("NumMedia", "0") or 0) > 0:
+        return None
+    body = (form.get("Body") or "").strip()
+    if QUICKPARSE_ENABLED:
+        data, confidence = quickparse.parse(body, form.get("From") or ledger.OWNER)  # not quick_parse: keep its hit stats per message
+        if data and confidence >= QUICKPARSE_MIN_CONFIDENCE:
+            return None
+    return body
+
+def finish_extraction(expenses, text):
+    """Fill defaults on extracted expenses; a message with none still logs one row, as before."""
+    expenses = expenses or [normalize_extraction({}, text)]
+    for data in expenses:
+        if not data.get("date"):
+            data["date"] = la_today().isoformat()
+    return expenses
+
+def attachment_texts(body, ocr_texts):
+    """LLM input per attachment: the caption (shared by all of them) plus its OCR text."""
+    return [(body + "\n" + t).strip() if body else (t or "image receipt") for t in ocr_texts]
+
+def finish_attachments(texts, results, ocr_texts=None):
+    """A media message's expenses, attachment by attachment; each one logs at least one row.
+    Each attachment's receipt fingerprint (from `ocr_texts`) is kept on its expenses for `dupes`."""
+    expenses = []
+    for i, (text, res) in enumerate(zip(texts, results)):
+        if isinstance(res, Exception):
+            raise res
+        done = finish_extraction(res, text)
+        fp = dupes.fingerprint(ocr_texts[i]) if ocr_texts else None
+        if fp:
+            for d in done:
+                d["fingerprint"] = fp
+        expenses += done
+    return expenses
+
+def quick_results(form, body):
+    """[[expense]] when the quick parser handles a text message, else None (an LLM fallback)."""
+    if not QUICKPARSE_ENABLED:
+        return None
+    quick = quick_parse(body, form.get("From") or ledger.OWNER)
+    if not quick:
+        metrics.inc("llm_fallbacks_total", reason="quickparse_miss")
+        return None
+    return [[quick]]
+
+def extract_message(form, prefetched=None) -> tuple:
+    """(expenses, source) for an inbound Twilio message form (any mapping).
+
+    `prefetched` is this message's result from a batched `extract_batch` call.
+    """
+    body = (form.get("Body") or "").strip()
+    num_media = int(form.get("NumMedia", "0") or 0)
+    source = "image" if num_media > 0 else "text"
+    if source == "text":
+        texts = [body]
+        results = quick_results(form, body)
+        if results is None:
+            results = [prefetched if isinstance(prefetched, list) else extract_expenses(body)]
+    else:
+        items = media_items(form)
+        ocr_texts = ocr_attachments(items) if items else [""]
+        texts = attachment_texts(body, ocr_texts)
+        results = extract_batch(texts)  # one LLM request covers every attachment
+        return finish_attachments(texts, results, ocr_texts), source
+    return finish_attachments(texts, results), source
+
+def append_expenses(expenses, source, msg_sid, user):
+    """Log a message's expenses; several go out as one bulk append. Returns their
+    sheet row numbers. Raises on failure."""
+    if len(expenses) == 1:
+        return [append_transaction_row(expenses[0], source, msg_sid, user)]
+    results = append_transaction_rows([(d, source, msg_sid, user) for d in expenses])
+    errors = [r for r in results if isinstance(r, Exception)]
+    if errors:
+        raise errors[0]
+    return results
+
+def screen_duplicates(user, expenses, source):
+    """Apply DUPES_POLICY to freshly extracted expenses. Returns (expenses to log now,
+    a note for the reply)."""
+    if DUPES_POLICY == "off":
+        return expenses, ""
+    uid = user or ledger.OWNER
+    keep, held, notes = [], [], []
+    for d in expenses:
+        hit = dupes.find(uid, d)
+        if hit is None:
+            keep.append(d)
+            continue
+        what = f"{pretty_expense(d)} looks like a duplicate of row {hit[0]} ({hit[1]})"
+        if DUPES_POLICY == "flag":
+            d["notes"] = f"{d.get('notes') or ''} [possible duplicate of row {hit[0]}]".strip()
+            keep.append(d)
+            notes.append(f"⚠️ {what}; logged anyway.")
+        elif DUPES_POLICY == "ask":
+            held.append(d)
+            notes.append(f"❓ {what}. Reply YES to log it anyway.")
+        else:
+            notes.append(f"⏭️ Skipped: {what}.")
+    if held:
+        dupes.hold(uid, held, source)
+    return keep, "\n".join(notes)
+
+def confirmed_duplicates(form):
+    """(expenses, source) held for the sender under DUPES_POLICY=ask if this message
+    is their YES, else None."""
+    if DUPES_POLICY != "ask" or int(form.get("NumMedia", "0") or 0) > 0:
+        return None
+    if (form.get("Body") or "").strip().lower().rstrip("!. ") not in CONFIRM_WORDS:
+        return None
+    return dupes.take(form.get("From") or ledger.OWNER)
+
+def confirmation(expenses, note, user) -> str:
+    """Reply for a handled message; also runs the budget check on what was logged."""
+    if not expenses:
+        return note
+    return logged_reply(expenses) + (f"\n{note}" if note else "") + budget_alerts(user, expenses)
+
+def _push(text, to):
+    try:
+        send_whatsapp(text, to=to or None)
+    except Exception as e:
+        print(f"Budget alert push failed: {e}")
+
+def budget_alerts(user, expenses) -> str:
+    """Check budget rules for just-logged expenses. Returns text to add to the reply:
+    the alerts with BUDGET_ALERTS=reply, else "" (push sends them as their own message)."""
+    if BUDGET_ALERTS == "off":
+        return ""
+    try:
+        alerts = budgets.check(user or ledger.OWNER, expenses)
+    except Exception as e:
+        print(f"Budget check failed: {e}")
+        return ""
+    if not alerts:
+        return ""
+    if BUDGET_ALERTS == "push":
+        threading.Thread(target=_push, args=("\n".join(alerts), user), daemon=True).start()
+        return ""
+    return "\n\n" + "\n".join(alerts)
+
+def already_logged(msg_sid, recheck=False) -> bool:
+    """True if this message's rows are already in the sheet. With `recheck` (a retry: an
+    earlier append may have timed out and still landed) this first waits for the
+    process's pending append and re-syncs the ledger from the sheet."""
+    if not msg_sid:
+        return False
+    if recheck:
+        wait_for_write(msg_sid)
+        ledger.sync(force=True)
+    return ledger.has_msg_sid(msg_sid)
+
+# Steps of handle_message shared with its async twin in services.aio
+def extraction_failed(e) -> IngestError:
+    return IngestError(f"LLM/OCR error: {e}")
+
+def append_failed(expenses, e) -> IngestError:
+    pretty = "\n".join(pretty_expense(d) for d in expenses)
+    return IngestError(f"Parsed but sheet append failed: {pretty}\n({e})")
+
+def logged(user, expenses, rows, note) -> str:
+    """Bookkeeping once a message's expenses are in the sheet; returns the reply."""
+    dupes.remember(user or ledger.OWNER, expenses, rows)
+    summaries.schedule_precompute(user or ledger.OWNER)
+    return confirmation(expenses, note, user)
+
+def handle_message(form, prefetched=None, retry=False) -> str:
+    """Extract, log and return the confirmation text. Raises IngestError."""
+    msg_sid = form.get("MessageSid") or ""
+    if already_logged(msg_sid, recheck=retry):
+        # Twilio redelivery or a retried job whose append already went through
+        return ALREADY_LOGGED
+    user = form.get("From") or ""
+    held = confirmed_duplicates(form)
+    if held:
+        (expenses, source), note = held, ""
+    else:
+        try:
+            expenses, source = extract_message(form, prefetched)
+        except Exception as e:
+            raise extraction_failed(e) from e
+        expenses, note = screen_duplicates(user, expenses, source)
+    if not expenses:
+        return note
+
+    try:
+        rows = append_expenses(expenses, source, msg_sid, user)
+    except Exception as e:
+        raise append_failed(expenses, e) from e
+    return logged(user, expenses, rows, note)
@@ -0,0 +1,157 @@
+"""Durable SQLite-backed queue for asynchronous webhook ingestion.
+
+Jobs are keyed by Twilio MessageSid, so a redelivered webhook is a no-op.
+Every gunicorn worker runs a few daemon threads that claim and process jobs;
+the claim happens under BEGIN IMMEDIATE so two processes never take the same job.
+"""
+import os, json, sqlite3, threading, time, uuid
+from config import QUEUE_DB_PATH, INGEST_WORKERS, INGEST_MAX_ATTEMPTS, INGEST_BATCH_SIZE
+
+STALE_AFTER = 300  # seconds without a heartbeat before a 'running' job from a dead worker is retried
+
+_local = threading.local()
+_started_pid = None
+
+def get_conn():
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "pid", None) != os.getpid():
+        conn = sqlite3.connect(QUEUE_DB_PATH, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                msg_sid TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',  -- pending | running | done | failed
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_at REAL NOT NULL,
+                reply TEXT,
+                error TEXT,
+                created REAL NOT NULL,
+                updated REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs(status, next_at)")
+        _local.conn, _local.pid = conn, os.getpid()
+    return conn
+
+def enqueue(form: dict) -> bool:
+    """Queue an inbound message. Returns False if this MessageSid was already queued."""
+    msg_sid = form.get("MessageSid") or f"local-{uuid.uuid4().hex}"
+    now = time.time()
+    cur = get_conn().execute(
+        "INSERT OR IGNORE INTO jobs(msg_sid, payload, next_at, created, updated) VALUES (?, ?, ?, ?, ?)",
+        (msg_sid, json.dumps(form), now, now, now),
+    )
+    return cur.rowcount == 1
+
+def claim_many(limit):
+    """Take up to `limit` due jobs. Returns [(msg_sid, form, attempts, reply), ...]."""
+    conn = get_conn()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("UPDATE jobs SET status='pending' WHERE status='running' AND updated < ?",
+                     (now - STALE_AFTER,))
+        rows = conn.execute(
+            "SELECT msg_sid, payload, attempts, reply FROM jobs "
+            "WHERE status='pending' AND next_at <= ? ORDER BY next_at LIMIT ?", (now, limit)
+        ).fetchall()
+        conn.executemany("UPDATE jobs SET status='running', attempts=attempts+1, updated=? WHERE msg_sid=?",
+                         [(now, r[0]) for r in rows])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return [(r[0], json.loads(r[1]), r[2] + 1, r[3]) for r in rows]
+
+def heartbeat(msg_sids):
+    """Mark claimed jobs as still being worked on, so they don't go stale while they wait their turn."""
+    if msg_sids:
+        get_conn().execute(f"UPDATE jobs SET updated=? WHERE status='running' AND msg_sid IN "
+                           f"({', '.join('?' * len(msg_sids))})", (time.time(), *msg_sids))
+
+def _set(msg_sid, **fields):
+    fields["updated"] = time.time()
+    cols = ", ".join(f"{k}=?" for k in fields)
+    get_conn().execute(f"UPDATE jobs SET {cols} WHERE msg_sid=?", (*fields.values(), msg_sid))
+
+def save_reply(msg_sid, reply):
+    _set(msg_sid, reply=reply)
+
+def complete(msg_sid):
+    _set(msg_sid, status="done", error=None)
+
+def retry_later(msg_sid, attempts, error):
+    # Exponential backoff: 2s, 4s, 8s, ... capped at 5 minutes
+    delay = min(300, 2 ** attempts)
+    _set(msg_sid, status="pending", error=str(error), next_at=time.time() + delay)
+
+def fail(msg_sid, error):
+    _set(msg_sid, status="failed", error=str(error))
+
+def stats():
+    cur = get_conn().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+    return dict(cur.fetchall())
+
+def _run(job, prefetched=None):
+    from services.ingest import handle_message, IngestError
+    from services.messaging import send_whatsapp
+
+    msg_sid, form, attempts, reply = job
+    try:
+        if reply is None:
+            try:
+                reply = handle_message(form, prefetched, retry=attempts > 1)
+            except IngestError as e:
+                if attempts < INGEST_MAX_ATTEMPTS:
+                    raise
+                reply = str(e)  # out of retries: tell the user what went wrong
+            save_reply(msg_sid, reply)
+        send_whatsapp(reply, to=form.get("From") or None)
+        complete(msg_sid)
+    except Exception as e:
+        if attempts < INGEST_MAX_ATTEMPTS:
+            retry_later(msg_sid, attempts, e)
+        else:
+            fail(msg_sid, e)
+            print(f"Ingest job {msg_sid} failed after {attempts} attempts: {e}")
+
+def process_batch(limit=None) -> int:
+    """Claim up to `limit` jobs and run them, extracting all their text messages
+    in one batched LLM call. Returns how many jobs ran (0 when nothing was due)."""
+    from services.ingest import batchable_text
+    from services.llm import extract_batch
+
+    jobs = claim_many(limit or INGEST_BATCH_SIZE)
+    texts = {}
+    for job in jobs:
+        text = batchable_text(job[1]) if job[3] is None else None
+        if text:
+            texts[job[0]] = text
+    prefetched = {}
+    if len(texts) > 1:
+        # Failed items come back as exceptions; handle_message then retries them alone
+        prefetched = dict(zip(texts, extract_batch(list(texts.values()))))
+    for k, job in enumerate(jobs):
+        # Jobs run one after another; a long batch must not make the ones still waiting look stale
+        heartbeat([j[0] for j in jobs[k:]])
+        _run(job, prefetched.get(job[0]))
+    return len(jobs)
+
+def _worker_loop():
+    while True:
+        try:
+            if not process_batch():
+                time.sleep(0.5)
+        except Exception as e:
+            print(f"Ingest worker error: {e}")
+            time.sleep(2)
+
+def start_workers(n=None):
+    """Start the per-process worker threads (idempotent)."""
+    global _started_pid
+    if _started_pid == os.getpid():
+        return
+    _started_pid = os.getpid()
+    for i in range(n or INGEST_WORKERS):
+        threading.Thread(target=_worker_loop, name=f"ingest-{i}", daemon=True).start()
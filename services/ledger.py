@@ -0,0 +1,265 @@
+"""Local SQLite mirror of the `transactions` sheet.
+
+Rows are keyed by their 1-based sheet row number. New rows arrive two ways:
+write-through from `append_transaction_row`, and an incremental tail sync that
+only fetches rows past the last synced sheet row. Summaries read from here.
+
+Each row's date and amount are parsed once on the way in and stored in the
+indexed `day`/`amt` columns, so window queries are index range scans. Every
+write also refreshes the per-day buckets in `services.rollups`.
+
+Rows are partitioned by `uid`, the sender's WhatsApp address (column J). Rows
+without one belong to OWNER (YOUR_WHATSAPP_NUMBER). Per-user queries go
+through the (uid, day) index and never touch other users' rows.
+
+The sheet is read in pages of SHEETS_READ_PAGE rows. `row_blocks` keeps the
+date span of every page-sized block of sheet rows, so `fetch_window` can read
+a date range straight from the sheet by fetching only the blocks that can hold it.
+"""
+import os, sqlite3, threading, time
+import datetime as dt
+from config import LEDGER_DB_PATH, LEDGER_SYNC_INTERVAL, YOUR_WHATSAPP_NUMBER, SHEETS_READ_PAGE
+from services import metrics
+from utils.rows import row_day, row_amount, to_ordinal
+
+COLUMNS = ["ts", "date", "name", "amount", "currency", "category", "notes", "source", "msg_sid", "user"]
+FIRST_DATA_ROW = 2  # row 1 is the header
+OWNER = YOUR_WHATSAPP_NUMBER or ""
+
+_local = threading.local()
+_sync_lock = threading.Lock()
+_last_sync = 0.0
+
+def _init(conn):
+    conn.executescript(f"""
+        CREATE TABLE IF NOT EXISTS rows (
+            row_num INTEGER PRIMARY KEY,
+            {", ".join(c + " TEXT" for c in COLUMNS)},
+            day INTEGER,
+            amt REAL,
+            uid TEXT
+        );
+        CREATE INDEX IF NOT EXISTS rows_msg_sid ON rows(msg_sid);
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+    """)
+    _migrate(conn)
+    conn.execute("CREATE INDEX IF NOT EXISTS rows_day ON rows(day)")
+    conn.execute("CREATE INDEX IF NOT EXISTS rows_uid_day ON rows(uid, day)")
+    _init_blocks(conn)
+    from services import rollups, dupes
+    rollups.init(conn)
+    dupes.init(conn)
+
+def _block(row_num):
+    return (row_num - FIRST_DATA_ROW) // SHEETS_READ_PAGE
+
+def _init_blocks(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS row_blocks (block INTEGER PRIMARY KEY, min_day INTEGER, max_day INTEGER)")
+    r = conn.execute("SELECT value FROM meta WHERE key='block_rows'").fetchone()
+    if r and int(r[0]) == SHEETS_READ_PAGE:
+        return
+    # New ledger, or SHEETS_READ_PAGE changed: recompute every block's date span
+    with conn:
+        conn.execute("DELETE FROM row_blocks")
+        conn.execute("INSERT INTO row_blocks(block, min_day, max_day) "
+                     "SELECT (row_num - ?) / ?, MIN(day), MAX(day) FROM rows WHERE day IS NOT NULL GROUP BY 1",
+                     (FIRST_DATA_ROW, SHEETS_READ_PAGE))
+        conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('block_rows', ?)", (str(SHEETS_READ_PAGE),))
+
+def _widen_blocks(conn, params):
+    # Spans only grow on rewrites; a too-wide span just means one extra page read
+    spans = {}
+    for p in params:
+        day = p[-3]
+        if day is None:
+            continue
+        b = _block(p[0])
+        lo, hi = spans.get(b, (day, day))
+        spans[b] = (min(lo, day), max(hi, day))
+    conn.executemany(
+        "INSERT INTO row_blocks(block, min_day, max_day) VALUES (?, ?, ?) ON CONFLICT(block) DO UPDATE SET "
+        "min_day = MIN(min_day, excluded.min_day), max_day = MAX(max_day, excluded.max_day)",
+        [(b, lo, hi) for b, (lo, hi) in spans.items()])
+
+def _migrate(conn):
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(rows)")}
+    if "uid" in cols:
+        return
+    # Ledger files created before parsed columns / per-user rows existed
+    with conn:
+        if "user" not in cols:
+            conn.execute("ALTER TABLE rows ADD COLUMN user TEXT")
+        for col, typ in (("day", "INTEGER"), ("amt", "REAL"), ("uid", "TEXT")):
+            if col not in cols:
+                conn.execute(f"ALTER TABLE rows ADD COLUMN {col} {typ}")
+        cur = conn.execute(f"SELECT row_num, {', '.join(COLUMNS)} FROM rows")
+        updates = []
+        for r in cur.fetchall():
+            row = _trimmed(_cell(v) for v in r[1:])
+            updates.append((row_day(row), row_amount(row), row_uid(row), r[0]))
+        conn.executemany("UPDATE rows SET day=?, amt=?, uid=? WHERE row_num=?", updates)
+        # Buckets are keyed by user now; rollups.init rebuilds them
+        conn.execute("DROP TABLE IF EXISTS day_rollup")
+
+def get_conn():
+    # One connection per thread (and per process, since gunicorn forks workers)
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "pid", None) != os.getpid():
+        conn = sqlite3.connect(LEDGER_DB_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _init(conn)
+        _local.conn, _local.pid = conn, os.getpid()
+    return conn
+
+def get_meta(key, default=None):
+    r = get_conn().execute("SELECT value FROM meta WHERE key=?", (key,)).fetchone()
+    return r[0] if r else default
+
+def set_meta(key, value):
+    conn = get_conn()
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)", (key, str(value)))
+
+def row_uid(row):
+    """Owner of a raw sheet row: its sender, else OWNER."""
+    user = row[9].strip() if len(row) > 9 else ""
+    return user or OWNER
+
+def _cell(v):
+    return "" if v is None else str(v)
+
+def _padded(row):
+    cells = [_cell(v) for v in row[:len(COLUMNS)]]
+    return cells + [""] * (len(COLUMNS) - len(cells))
+
+def _trimmed(cells):
+    # Match Sheets API shape: trailing empty cells are dropped
+    cells = list(cells)
+    while cells and cells[-1] == "":
+        cells.pop()
+    return cells
+
+def _upsert(conn, start_row, rows):
+    from services import rollups
+    if not rows:
+        return
+    # Days the replaced rows used to be on also need their buckets refreshed
+    touched = set(conn.execute(
+        "SELECT DISTINCT uid, day FROM rows WHERE row_num BETWEEN ? AND ?",
+        (start_row, start_row + len(rows) - 1)))
+    params = []
+    for i, r in enumerate(rows):
+        cells = _padded(r)
+        row = _trimmed(cells)
+        params.append((start_row + i, *cells, row_day(row), row_amount(row), row_uid(row)))
+    conn.executemany(
+        f"INSERT OR REPLACE INTO rows(row_num, {', '.join(COLUMNS)}, day, amt, uid) "
+        f"VALUES (?{', ?' * (len(COLUMNS) + 3)})",
+        params,
+    )
+    rollups.refresh_days(conn, touched | {(p[-1], p[-3]) for p in params})
+    _widen_blocks(conn, params)
+    _bump_version(conn)
+
+def _bump_version(conn):
+    # Shared by every worker through the DB file; lets readers cache derived data
+    conn.execute("INSERT INTO meta(key, value) VALUES ('version', '1') "
+                 "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1")
+
+def version() -> int:
+    """Changes whenever ledger rows are written."""
+    return int(get_meta("version", 0))
+
+def record_many(first_row_num: int, rows: list):
+    """Write-through for consecutive rows appended starting at `first_row_num`."""
+    conn = get_conn()
+    with conn:
+        _upsert(conn, first_row_num, rows)
+
+def synced_through() -> int:
+    return int(get_meta("synced_through", FIRST_DATA_ROW - 1))
+
+def sync(force=False):
+    """Fetch sheet rows past the last synced row, one page at a time (each page is
+    committed before the next is read). Returns how many were fetched."""
+    global _last_sync
+    if not force and time.monotonic() - _last_sync < LEDGER_SYNC_INTERVAL:
+        return 0
+    from services.sheets import iter_row_blocks
+    n = 0
+    with metrics.stage("ledger_sync"), _sync_lock:
+        conn = get_conn()
+        for start, rows in iter_row_blocks(synced_through() + 1):
+            with conn:
+                _upsert(conn, start, rows)
+                conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('synced_through', ?)",
+                             (str(start + len(rows) - 1),))
+            n += len(rows)
+        _last_sync = time.monotonic()
+    return n
+
+def window_ranges(start, end):
+    """Sheet row ranges [(first, last), ...] that can hold rows dated within [start, end]:
+    synced blocks whose date span overlaps it, then the unsynced tail (last=None)."""
+    s, e = to_ordinal(start), to_ordinal(end)
+    blocks = [b for (b,) in get_conn().execute(
+        "SELECT block FROM row_blocks WHERE max_day >= ? AND min_day <= ? ORDER BY block", (s, e))]
+    tail = synced_through() + 1
+    ranges = []
+    for b in blocks:
+        first = FIRST_DATA_ROW + b * SHEETS_READ_PAGE
+        last = min(first + SHEETS_READ_PAGE - 1, tail - 1)
+        if ranges and ranges[-1][1] + 1 == first:
+            ranges[-1] = (ranges[-1][0], last)  # adjacent blocks become one range
+        else:
+            ranges.append((first, last))
+    return ranges + [(tail, None)]
+
+def fetch_window(start, end, uid=None):
+    """Yield (sheet row number, raw row) for rows dated within [start, end] (and owned by
+    `uid`, if given), read from the sheet itself so hand edits show up. Only the
+    blocks that can contain those dates are fetched."""
+    from services.sheets import iter_rows
+    s, e = to_ordinal(start), to_ordinal(end)
+    for row_num, row in iter_rows(window_ranges(start, end)):
+        day = row_day(row)
+        if day is not None and s <= day <= e and (uid is None or row_uid(row) == uid):
+            yield row_num, row
+
+def resync():
+    """Drop the mirror and re-read the whole sheet (use after hand edits)."""
+    from services import rollups
+    conn = get_conn()
+    with conn:
+        conn.execute("DELETE FROM rows")
+        conn.execute("DELETE FROM row_blocks")
+        conn.execute("DELETE FROM meta WHERE key='synced_through'")
+        _bump_version(conn)
+    n = sync(force=True)
+    rollups.rebuild()
+    return n
+
+def row_count() -> int:
+    return get_conn().execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+
+def latest_date(uid=OWNER):
+    r = get_conn().execute("SELECT MAX(day) FROM rows WHERE uid=?", (uid,)).fetchone()
+    return dt.date.fromordinal(r[0]).isoformat() if r and r[0] is not None else None
+
+def users():
+    """Every uid with at least one row."""
+    return [r[0] for r in get_conn().execute("SELECT DISTINCT uid FROM rows WHERE uid IS NOT NULL")]
+
+def has_msg_sid(msg_sid: str) -> bool:
+    if not msg_sid:
+        return False
+    return get_conn().execute("SELECT 1 FROM rows WHERE msg_sid=? LIMIT 1", (msg_sid,)).fetchone() is not None
+
+if __name__ == "__main__":
+    import sys
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "sync"
+    if cmd == "resync":
+        print(f"Resynced {resync()} rows.")
+    else:
+        print(f"Fetched {sync(force=True)} new rows.")
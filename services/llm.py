@@ -1,8 +1,18 @@
-import json, re
-from groq import Groq
-from config import GROQ_API_KEY
+import json, re, time
+from config import GROQ_API_KEY, LLM_BATCH_SIZE
+from services import cache, compact, metrics
+from utils.dates import la_today
 
-groq_client = Groq(api_key=GROQ_API_KEY)
+groq_client = None  # built on first use; tests and benchmarks may assign a stand-in
+
+def get_groq_client():
+    global groq_client
+    if groq_client is None:
+        from groq import Groq  # ~0.4 s of imports; keep it off the cold-start path
+        groq_client = Groq(api_key=GROQ_API_KEY)
+    return groq_client
+
+EXTRACT_MODEL = "llama-3.1-8b-instant"
 
 SYSTEM_PROMPT = (
     "You are a strict JSON generator. Always respond with a single JSON object and nothing else.\n"
@@ -17,9 +27,31 @@ SYSTEM_PROMPT = (
     "Output must be valid JSON."
 )
 
+# Words whose meaning depends on the day the message was sent
+_RELATIVE = re.compile(r"\b(today|yesterday|tomorrow|tonight|last|ago|this|next|mon|tue|wed|thu|fri|sat|sun)", re.I)
+# A written date ("10/18", "2026-10-18", "18 Oct"), e.g. the one printed on a receipt
+_MONTH = r"(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)"
+_EXPLICIT_DATE = re.compile(rf"\b\d{{1,4}}[/-]\d{{1,2}}\b|\b\d{{1,2}}\.\d{{1,2}}\.\d{{2,4}}\b|"
+                            rf"\b{_MONTH}[a-z]*\.?\s*\d|\b\d{{1,2}}(st|nd|rd|th)?\s+{_MONTH}", re.I)
+
+def _extract_cache_key(text: str, prompt: str = SYSTEM_PROMPT, today=None) -> str:
+    norm = " ".join(text.lower().split())
+    day = (today or la_today()).isoformat() if _RELATIVE.search(norm) else ""
+    return cache.digest(EXTRACT_MODEL, prompt, norm, day)
+
 def extract_with_llm(text: str) -> dict:
-    r = groq_client.chat.completions.create(
-        model="llama-3.1-8b-instant",
+    key = _extract_cache_key(text)
+    hit = cache.get("llm-extract", key)
+    if hit is not None:
+        return hit
+    data = _extract_uncached(text)
+    cache_extraction(key, data, text)
+    return data
+
+def extract_request(text: str) -> dict:
+    """chat.completions.create kwargs for an extraction (shared with the async client)."""
+    return dict(
+        model=EXTRACT_MODEL,
         response_format={"type": "json_object"},  # Groq JSON mode needs 'json' mention in messages, done below
         temperature=0,
         messages=[
@@ -27,9 +59,23 @@ def extract_with_llm(text: str) -> dict:
             {"role": "user", "content": f"Return JSON only. Input: {text.strip()}"}
         ],
     )
-    data = json.loads(r.choices[0].message.content)
 
-    # normalize
+def _cacheable(data: dict, text: str, today=None) -> dict:
+    stored = dict(data)
+    if stored.get("date") == (today or la_today()).isoformat() and not _EXPLICIT_DATE.search(text):
+        # The model defaulted to today: routes fill in "today", so tomorrow's "coffee 5"
+        # gets tomorrow. A written date is kept (its key has no day part).
+        stored["date"] = None
+    return stored
+
+def cache_extraction(key: str, data: dict, text: str):
+    cache.put("llm-extract", key, _cacheable(data, text))
+
+def _extract_uncached(text: str) -> dict:
+    r = get_groq_client().chat.completions.create(**extract_request(text))
+    return normalize_extraction(json.loads(r.choices[0].message.content), text)
+
+def normalize_extraction(data: dict, text: str) -> dict:
     amt = data.get("amount", None)
     try:
         data["amount"] = float(amt) if amt is not None else None
@@ -47,42 +93,207 @@ def extract_with_llm(text: str) -> dict:
         data["date"] = None  # routes layer sets LA "today" if missing
     return data
 
+# ---- Multi-expense, multi-input extraction
+CATEGORIES = {"rent", "groceries", "eating_out", "utilities", "transport", "shopping", "medical",
+              "entertainment", "travel", "education", "transfer", "other"}
+
+BATCH_SYSTEM_PROMPT = (
+    "You are a strict JSON generator. Always respond with a single JSON object and nothing else.\n"
+    "Task: extract every expense from each numbered input message.\n"
+    "A message may hold several expenses (e.g. 'uber 14, lunch 22'): return one entry per expense. "
+    "A receipt is one expense for its total; list its line items briefly in notes. "
+    "A message with no expense gets an empty list.\n"
+    "Return {\"results\": [{\"i\": <input number>, \"expenses\": [expense, ...]}, ...]} with one result per input.\n"
+    "Each expense has keys:\n"
+    "- name: merchant or person (string)\n"
+    "- amount: number only, no currency symbol, null if missing\n"
+    "- currency: 3-letter code, default USD if unclear\n"
+    "- category: one of [rent, groceries, eating_out, utilities, transport, shopping, medical, entertainment, travel, education, transfer, other]\n"
+    "- date: YYYY-MM-DD in America/Los_Angeles, null if not stated\n"
+    "- notes: short summary\n"
+    "Output must be valid JSON."
+)
+
+def batch_request(texts: list, sent: list = None) -> dict:
+    """chat.completions.create kwargs extracting all of `texts` in one call (shared with the async client).
+
+    `sent` optionally gives each input the date it was written (an imported chat
+    line), which relative dates in it are resolved against instead of today.
+    """
+    sent = sent or [None] * len(texts)
+    inputs = "\n".join(json.dumps({"i": i, "text": t.strip(), **({"sent": d.isoformat()} if d else {})},
+                                  ensure_ascii=False) for i, (t, d) in enumerate(zip(texts, sent)))
+    when = f"Today is {la_today().isoformat()}."
+    if any(sent):
+        when += " Inputs with a \"sent\" date were written that day: resolve 'yesterday', weekdays etc. from it."
+    return dict(
+        model=EXTRACT_MODEL,
+        response_format={"type": "json_object"},
+        temperature=0,
+        messages=[
+            {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+            {"role": "user", "content": f"Return JSON only. {when} Inputs:\n{inputs}"}
+        ],
+    )
+
+def _valid_expense(e, text: str) -> dict:
+    """Schema check for one model-produced expense; raises ValueError."""
+    if not isinstance(e, dict):
+        raise ValueError("expense is not an object")
+    for k in ("name", "currency", "category", "date", "notes"):
+        if e.get(k) is not None and not isinstance(e[k], str):
+            raise ValueError(f"{k} is not a string")
+    amt = e.get("amount")
+    if amt is not None and not isinstance(amt, (int, float)):
+        try:
+            float(str(amt).replace(",", ""))
+        except ValueError:
+            raise ValueError("amount is not a number")
+        e["amount"] = str(amt).replace(",", "")
+    data = normalize_extraction(dict(e), text)
+    if data["category"] not in CATEGORIES:
+        data["category"] = "other"
+    data["currency"] = data["currency"].upper()[:3]
+    return data
+
+def parse_batch_response(content: str, texts: list) -> dict:
+    """{input index: [expense, ...]} for every result that passes validation; others are left out."""
+    try:
+        results = json.loads(content).get("results")
+    except (ValueError, AttributeError):
+        return {}
+    out = {}
+    for r in results if isinstance(results, list) else []:
+        try:
+            i = r["i"]
+            if not isinstance(i, int) or not 0 <= i < len(texts) or i in out or not isinstance(r["expenses"], list):
+                continue
+            out[i] = [_valid_expense(e, texts[i]) for e in r["expenses"]]
+        except (KeyError, TypeError, ValueError):
+            continue
+    return out
+
+def _expenses_cache_key(text: str, today=None) -> str:
+    return _extract_cache_key(text, BATCH_SYSTEM_PROMPT, today)
+
+def cache_expenses(key: str, expenses: list, text: str, today=None):
+    cache.put("llm-expenses", key, [_cacheable(e, text, today) for e in expenses])
+
+def _extract_group(texts, idxs, out, keys, sent):
+    # One request for texts[idxs]; items it misses or gets wrong are split and retried
+    err = None
+    try:
+        with metrics.stage("llm_extract"):
+            r = get_groq_client().chat.completions.create(
+                **batch_request([texts[i] for i in idxs], [sent[i] for i in idxs]))
+        got = parse_batch_response(r.choices[0].message.content, [texts[i] for i in idxs])
+    except Exception as e:
+        got, err = {}, e
+    failed = []
+    for j, i in enumerate(idxs):
+        if j in got:
+            out[i] = got[j]
+            cache_expenses(keys[i], got[j], texts[i], sent[i])
+        else:
+            failed.append(i)
+    if len(failed) == 1 and len(idxs) == 1:
+        out[failed[0]] = err or ValueError("LLM returned no valid result for this input")
+    elif failed:
+        metrics.inc("llm_fallbacks_total", reason="batch_split")
+        half = (len(failed) + 1) // 2
+        for part in (failed[:half], failed[half:]):
+            if part:
+                _extract_group(texts, part, out, keys, sent)
+
+def extract_batch(texts: list, batch_size: int = None, sent: list = None) -> list:
+    """Expenses for many inputs, `batch_size` inputs per LLM request.
+
+    Returns one entry per text: a list of expense dicts (possibly empty), or the
+    exception that made it fail. Cached inputs are not sent again. `sent` is the
+    date each text was written (see `batch_request`), None for today.
+    """
+    out = [None] * len(texts)
+    sent = sent or [None] * len(texts)
+    keys = [_expenses_cache_key(t, d) for t, d in zip(texts, sent)]
+    pending = []
+    for i, key in enumerate(keys):
+        hit = cache.get("llm-expenses", key)
+        if hit is not None:
+            out[i] = hit
+        else:
+            pending.append(i)
+    step = max(1, batch_size or LLM_BATCH_SIZE)
+    for k in range(0, len(pending), step):
+        _extract_group(texts, pending[k:k + step], out, keys, sent)
+    return out
+
+def extract_expenses(text: str) -> list:
+    """Every expense in one message (a list, possibly empty). Raises on LLM failure."""
+    res = extract_batch([text])[0]
+    if isinstance(res, Exception):
+        raise res
+    return res
+
 # ---- AI summaries
 FIN_ASST_SYSTEM = (
     "You are a helpful financial assistant named Grok. "
     "Write concise, WhatsApp-friendly text. No markdown links."
 )
+SUMMARY_MODEL = "llama-3.1-8b-instant"
 
-def grok_summarize(context: dict) -> str:
-    msg = (
-        "Return plain text (not JSON). "
-        "Here is the expense data in JSON:\n\n"
-        + json.dumps(context, ensure_ascii=False)
-        + "\n\nNow write the summary and advice."
-    )
-    r = groq_client.chat.completions.create(
-        model="llama-3.1-8b-instant",
-        temperature=0.4,
-        messages=[
-            {"role": "system", "content": FIN_ASST_SYSTEM},
-            {"role": "user", "content": msg}
-        ],
-    )
-    return r.choices[0].message.content.strip()
-
-def grok_summarize_window(ctx: dict) -> str:
-    msg = (
-        "Return plain text (not JSON). "
-        "Here is the expense data in JSON for the window and previous window:\n\n"
-        + json.dumps(ctx, ensure_ascii=False)
-        + "\n\nNow write the summary and advice."
-    )
-    r = groq_client.chat.completions.create(
-        model="llama-3.1-8b-instant",
+def summary_message(context: dict, window: bool = False) -> str:
+    if window:
+        # Week/month contexts go through the compact, token-budgeted encoding
+        data = ("Here is the expense data for the window, compared with the previous window:\n\n"
+                + compact.window_prompt(context))
+    else:
+        data = "Here is the expense data in JSON:\n\n" + json.dumps(context, ensure_ascii=False)
+    return "Return plain text (not JSON). " + data + "\n\nNow write the summary and advice."
+
+def summary_request(context: dict, window: bool = False, msg: str = None) -> dict:
+    msg = msg or summary_message(context, window)
+    return dict(
+        model=SUMMARY_MODEL,
         temperature=0.4,
         messages=[
             {"role": "system", "content": FIN_ASST_SYSTEM},
             {"role": "user", "content": msg}
         ],
     )
-    return r.choices[0].message.content.strip()
+
+def summary_cache_key(context: dict, window: bool = False, msg: str = None) -> str:
+    # The prompt holds every aggregate the text is written from, so a new or
+    # edited row that changes what the model sees misses the cache
+    return cache.digest(SUMMARY_MODEL, FIN_ASST_SYSTEM, window, msg or summary_message(context, window))
+
+def record_summary(window: bool, msg: str, response, seconds: float):
+    """Prompt size and LLM latency of one generated summary, into /metrics and the log."""
+    kind = "window" if window else "day"
+    usage = getattr(response, "usage", None)
+    tokens = getattr(usage, "prompt_tokens", None) or compact.estimate_tokens(msg)
+    metrics.inc("summaries_generated_total", kind=kind)
+    metrics.inc("summary_prompt_tokens_total", tokens, kind=kind)
+    metrics.observe("summary_llm_seconds", seconds, kind=kind)
+    print(json.dumps({"summary": {"kind": kind, "prompt_chars": len(msg), "prompt_tokens": tokens,
+                                  "ms": round(seconds * 1000, 1)}}))
+
+def _summarize(context: dict, window: bool, refresh: bool) -> str:
+    msg = summary_message(context, window)
+    key = summary_cache_key(context, window, msg)
+    if not refresh:
+        hit = cache.get("summary", key)
+        if hit is not None:
+            return hit
+    t0 = time.perf_counter()
+    with metrics.stage("llm_summary"):
+        r = get_groq_client().chat.completions.create(**summary_request(context, window, msg))
+    record_summary(window, msg, r, time.perf_counter() - t0)
+    text = r.choices[0].message.content.strip()
+    cache.put("summary", key, text)
+    return text
+
+def grok_summarize(context: dict, refresh: bool = False) -> str:
+    return _summarize(context, False, refresh)
+
+def grok_summarize_window(ctx: dict, refresh: bool = False) -> str:
+    return _summarize(ctx, True, refresh)
@@ -1,14 +1,38 @@
-import requests
-from config import TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_WHATSAPP_FROM, YOUR_WHATSAPP_NUMBER
+import time, threading
+from services import metrics
+from services.http import get_session
+from config import TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_WHATSAPP_FROM, YOUR_WHATSAPP_NUMBER, TWILIO_SEND_RATE
 
-def send_whatsapp(body: str):
-    if not all([TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_WHATSAPP_FROM, YOUR_WHATSAPP_NUMBER]):
+class RateLimiter:
+    """Spaces calls at most `rate` per second across all threads of the process."""
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_at = 0.0
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Claim the next slot; returns how many seconds the caller must wait for it."""
+        if not self.interval:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            at = max(now, self.next_at)
+            self.next_at = at + self.interval
+        return at - now
+
+twilio_limiter = RateLimiter(TWILIO_SEND_RATE)
+
+def send_whatsapp(body: str, to: str = None):
+    to = to or YOUR_WHATSAPP_NUMBER
+    if not all([TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_WHATSAPP_FROM, to]):
         raise RuntimeError("Missing Twilio env vars")
-    r = requests.post(
-        f"https://api.twilio.com/2010-04-01/Accounts/{TWILIO_ACCOUNT_SID}/Messages.json",
-        auth=(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN),
-        data={"From": TWILIO_WHATSAPP_FROM, "To": YOUR_WHATSAPP_NUMBER, "Body": body},
-        timeout=20
-    )
+    time.sleep(twilio_limiter.reserve())
+    with metrics.stage("twilio_send"):
+        r = get_session("twilio").post(
+            f"https://api.twilio.com/2010-04-01/Accounts/{TWILIO_ACCOUNT_SID}/Messages.json",
+            auth=(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN),
+            data={"From": TWILIO_WHATSAPP_FROM, "To": to, "Body": body},
+            timeout=20
+        )
     r.raise_for_status()
     return True
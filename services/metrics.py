@@ -0,0 +1,136 @@
+"""In-process metrics: per-stage timers, counters and a sampled slow-request log.
+
+`with stage("ocr"):` times one service call into a latency histogram and, inside
+a traced request, into that request's stage breakdown. `render()` is the
+Prometheus text served at /metrics. Numbers are per worker process.
+"""
+import json, time, random, threading, functools, contextvars, inspect
+from collections import deque
+from contextlib import contextmanager
+from config import METRICS_ENABLED, METRICS_SLOW_MS, METRICS_SLOW_SAMPLE, METRICS_SLOW_LOG_SIZE
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_lock = threading.Lock()
+_hists = {}     # (name, labels) -> [bucket counts..., +Inf count, sum]
+_counters = {}  # (name, labels) -> value
+_slow = deque(maxlen=METRICS_SLOW_LOG_SIZE)
+_trace = contextvars.ContextVar("metrics_trace", default=None)
+
+def _labels(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def inc(name, n=1, **labels):
+    if not METRICS_ENABLED:
+        return
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + n
+
+def observe(name, seconds, **labels):
+    if not METRICS_ENABLED:
+        return
+    key = (name, _labels(labels))
+    with _lock:
+        h = _hists.get(key)
+        if h is None:
+            h = _hists[key] = [0] * (len(BUCKETS) + 2)
+        for i, b in enumerate(BUCKETS):
+            if seconds <= b:
+                h[i] += 1
+        h[-2] += 1
+        h[-1] += seconds
+
+@contextmanager
+def stage(name):
+    """Time one service call (media_download, ocr, llm_extract, sheets_append, ...)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        took = time.perf_counter() - t0
+        observe("stage_duration_seconds", took, stage=name)
+        trace = _trace.get()
+        if trace is not None:
+            s = trace.setdefault(name, {"ms": 0.0, "n": 0})
+            s["ms"] += took * 1000
+            s["n"] += 1
+
+def _finish(route, t0, trace, status):
+    took = time.perf_counter() - t0
+    observe("request_duration_seconds", took, route=route)
+    inc("requests_total", route=route, status=status)
+    if took * 1000 >= METRICS_SLOW_MS and random.random() < METRICS_SLOW_SAMPLE:
+        entry = {"route": route, "status": status, "ms": round(took * 1000, 1),
+                 "at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                 "stages": {k: {"ms": round(v["ms"], 1), "n": v["n"]} for k, v in trace.items()}}
+        _slow.append(entry)
+        print(json.dumps({"slow_request": entry}))
+
+def traced(route):
+    """Decorator for a view: request latency, status count and a stage breakdown for the slow log."""
+    def wrap(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def run_async(*args, **kw):
+                trace, t0, status = {}, time.perf_counter(), "error"
+                token = _trace.set(trace)
+                try:
+                    res = await fn(*args, **kw)
+                    status = "ok"
+                    return res
+                finally:
+                    _trace.reset(token)
+                    _finish(route, t0, trace, status)
+            return run_async
+
+        @functools.wraps(fn)
+        def run(*args, **kw):
+            trace, t0, status = {}, time.perf_counter(), "error"
+            token = _trace.set(trace)
+            try:
+                res = fn(*args, **kw)
+                status = "ok"
+                return res
+            finally:
+                _trace.reset(token)
+                _finish(route, t0, trace, status)
+        return run
+    return wrap
+
+def slow_requests():
+    return list(_slow)
+
+def _fmt(labels, extra=()):
+    items = list(labels) + list(extra)
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}" if items else ""
+
+def render() -> str:
+    """Prometheus text exposition of everything recorded in this process."""
+    from services import cache, quickparse
+    with _lock:
+        hists = {k: list(v) for k, v in _hists.items()}
+        counters = dict(_counters)
+    for ns, s in cache.stats().items():
+        for outcome in ("hits", "misses"):
+            counters[("cache_requests_total", (("ns", ns), ("outcome", outcome)))] = s[outcome]
+    qp = quickparse.stats()
+    for outcome in ("hits", "misses"):
+        counters[("quickparse_total", (("outcome", outcome),))] = qp[outcome]
+
+    out, typed = [], set()
+    for (name, labels), h in sorted(hists.items()):
+        if name not in typed:
+            out.append(f"# TYPE {name} histogram")
+            typed.add(name)
+        for b, n in zip(BUCKETS, h):
+            out.append(f"{name}_bucket{_fmt(labels, [('le', b)])} {n}")
+        out.append(f"{name}_bucket{_fmt(labels, [('le', '+Inf')])} {h[-2]}")
+        out.append(f"{name}_sum{_fmt(labels)} {h[-1]:.6f}")
+        out.append(f"{name}_count{_fmt(labels)} {h[-2]}")
+    for (name, labels), v in sorted(counters.items()):
+        if name not in typed:
+            out.append(f"# TYPE {name} counter")
+            typed.add(name)
+        out.append(f"{name}{_fmt(labels)} {v}")
+    return "\n".join(out) + "\n"
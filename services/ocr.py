@@ -1,13 +1,23 @@
-import io, requests
-from PIL import Image
-import pytesseract
-from config import OCR_BACKEND, OCRSPACE_API_KEY, TESSERACT_CMD, TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN
+import io, os, base64, hashlib, threading
+import multiprocessing as mp
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from config import (OCR_BACKEND, OCRSPACE_API_KEY, TESSERACT_CMD, TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN,
+                    CACHE_PHASH, OCR_WORKERS, WEB_CONCURRENCY, OCR_MAX_SIDE, OCR_TESSERACT_CONFIG,
+                    MEDIA_CONCURRENCY, PDF_MAX_PAGES, PDF_RENDER_DPI)
+from services import cache, metrics
+from services.http import get_session
 
-# Configure tesseract path (only used if OCR_BACKEND=tesseract)
-pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+# PIL and pytesseract are imported where used: most deployments OCR via OCR.Space
+# and should not pay for them at startup
+def _pytesseract(cmd=TESSERACT_CMD):
+    import pytesseract
+    pytesseract.pytesseract.tesseract_cmd = cmd
+    return pytesseract
 
 def fetch_media_bytes(url: str) -> bytes:
-    r = requests.get(url, auth=(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN), timeout=20)
+    with metrics.stage("media_download"):
+        r = get_session().get(url, auth=(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN), timeout=20)
     r.raise_for_status()
     return r.content
 
@@ -18,21 +28,237 @@ def ocr_via_ocrspace(image_bytes: bytes) -> str:
     files = {"file": ("receipt.jpg", image_bytes, "application/octet-stream")}
     data = {"language": "eng", "scale": "true", "isTable": "true"}
     headers = {"apikey": OCRSPACE_API_KEY}
-    r = requests.post(url, headers=headers, data=data, files=files, timeout=30)
+    r = get_session("ocr").post(url, headers=headers, data=data, files=files, timeout=30)
     r.raise_for_status()
-    js = r.json()
+    return parse_ocrspace_response(r.json())
+
+def parse_ocrspace_response(js: dict) -> str:
     if js.get("IsErroredOnProcessing"):
         raise RuntimeError(js.get("ErrorMessage") or "OCR.Space error")
     parsed = js.get("ParsedResults", [])
     text = parsed[0].get("ParsedText", "") if parsed else ""
     return text.strip()
 
-def ocr_via_tesseract(image_bytes: bytes) -> str:
+# ---- Tesseract: preprocessing + bounded process pool
+def _otsu_threshold(gray):
+    hist = gray.histogram()[:256]
+    total = sum(hist)
+    sum_all = sum(i * h for i, h in enumerate(hist))
+    best, best_t, w_b, sum_b = 0.0, 128, 0, 0
+    for t in range(256):
+        w_b += hist[t]
+        if w_b == 0:
+            continue
+        w_f = total - w_b
+        if w_f == 0:
+            break
+        sum_b += t * hist[t]
+        m_b, m_f = sum_b / w_b, (sum_all - sum_b) / w_f
+        between = w_b * w_f * (m_b - m_f) ** 2
+        if between > best:
+            best, best_t = between, t
+    return best_t
+
+def _receipt_bbox(gray):
+    """Bounding box of the bright paper region, or None if it is not clearly separable."""
+    small = gray.copy()
+    small.thumbnail((256, 256))
+    t = _otsu_threshold(small)
+    box = small.point(lambda p: 255 if p > t else 0).getbbox()
+    if not box:
+        return None
+    sx, sy = gray.width / small.width, gray.height / small.height
+    x0, y0, x1, y1 = box
+    area = (x1 - x0) * (y1 - y0) / (small.width * small.height)
+    if area < 0.2 or area > 0.95:
+        return None  # nothing to crop, or the "paper" is noise
+    pad = 8
+    return (max(0, int(x0 * sx) - pad), max(0, int(y0 * sy) - pad),
+            min(gray.width, int(x1 * sx) + pad), min(gray.height, int(y1 * sy) + pad))
+
+def preprocess_image(img):
+    """EXIF-rotate, grayscale, crop to the receipt, rescale for OCR and binarize."""
+    from PIL import Image, ImageOps
+    img = ImageOps.exif_transpose(img)
+    gray = img.convert("L")
+    box = _receipt_bbox(gray)
+    if box:
+        gray = gray.crop(box)
+    # Phone photos are 12MP+; text is already legible to tesseract well below that.
+    # Tiny thumbnails get upscaled so glyphs reach a usable height.
+    long_side = max(gray.size)
+    if long_side > OCR_MAX_SIDE:
+        gray.thumbnail((OCR_MAX_SIDE, OCR_MAX_SIDE), Image.LANCZOS)
+    elif long_side < OCR_MAX_SIDE // 2:
+        scale = (OCR_MAX_SIDE // 2) / long_side
+        gray = gray.resize((int(gray.width * scale), int(gray.height * scale)), Image.LANCZOS)
+    gray = ImageOps.autocontrast(gray, cutoff=1)
+    t = _otsu_threshold(gray)
+    return gray.point(lambda p: 255 if p > t else 0, mode="1")
+
+def _init_ocr_worker(cmd):
+    # One tesseract thread per worker process; the pool provides the parallelism
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+    _pytesseract(cmd)
+
+def _tesseract_job(image_bytes: bytes, preprocess: bool = True) -> str:
+    from PIL import Image
     img = Image.open(io.BytesIO(image_bytes))
-    return pytesseract.image_to_string(img).strip()
+    if preprocess:
+        img = preprocess_image(img)
+    return _pytesseract().image_to_string(img, config=OCR_TESSERACT_CONFIG if preprocess else "").strip()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Every gunicorn worker has its own pool: split the cores between them
+            workers = OCR_WORKERS or max(1, (os.cpu_count() or 1) // max(1, WEB_CONCURRENCY))
+            # spawn: forking a threaded gunicorn worker is not safe
+            _pool = ProcessPoolExecutor(max_workers=workers,
+                                        mp_context=mp.get_context("spawn"),
+                                        initializer=_init_ocr_worker, initargs=(TESSERACT_CMD,))
+        return _pool
+
+def ocr_via_tesseract(image_bytes: bytes, preprocess: bool = True) -> str:
+    return _get_pool().submit(_tesseract_job, image_bytes, preprocess).result()
+
+PHASH_THUMB = 256    # px, long side of the thumbnail a perceptual-hash hit is checked against
+PHASH_MAX_DIFF = 24  # grey levels; re-compressed copies stay near 10, a changed digit is 40+
+
+def perceptual_hash(image_bytes: bytes):
+    """(64-bit difference hash, thumbnail) of an image, or (None, None) if it is not one.
+
+    The hash survives WhatsApp re-compression of the same photo, but it is also shared
+    by different receipts of one layout, so a hit is only used if `same_image` agrees.
+    """
+    from PIL import Image, ImageOps
+    try:
+        gray = Image.open(io.BytesIO(image_bytes)).convert("L")
+    except Exception:
+        return None, None  # not an image (e.g. a PDF)
+    px = list(gray.resize((9, 8)).getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (px[row * 9 + col] > px[row * 9 + col + 1])
+    thumb = ImageOps.autocontrast(gray)
+    thumb.thumbnail((PHASH_THUMB, PHASH_THUMB), Image.LANCZOS)
+    buf = io.BytesIO()
+    thumb.save(buf, "PNG", optimize=True)
+    return f"{bits:016x}", base64.b64encode(buf.getvalue()).decode("ascii")
+
+def same_image(thumb: str, other: str) -> bool:
+    """True if two `perceptual_hash` thumbnails show the same picture: no 3x3 patch
+    differs by more than PHASH_MAX_DIFF grey levels (a different amount does)."""
+    from PIL import Image, ImageChops, ImageFilter
+    a, b = (Image.open(io.BytesIO(base64.b64decode(t))) for t in (thumb, other))
+    if abs(a.width / a.height - b.width / b.height) > 0.02:
+        return False
+    if a.size != b.size:
+        b = b.resize(a.size, Image.LANCZOS)
+    return max(ImageChops.difference(a, b).filter(ImageFilter.BoxBlur(1)).getdata()) <= PHASH_MAX_DIFF
+
+# ---- Attachments: every MediaUrlN of a message, PDFs split into pages
+def media_items(form) -> list:
+    """[(url, content type)] for every attachment of an inbound Twilio message form."""
+    n = int(form.get("NumMedia", "0") or 0)
+    return [(form.get(f"MediaUrl{i}"), form.get(f"MediaContentType{i}") or "")
+            for i in range(n) if form.get(f"MediaUrl{i}")]
+
+def is_pdf(content: bytes, content_type: str = "") -> bool:
+    return content_type == "application/pdf" or content[:5] == b"%PDF-"
+
+_pdf_lock = threading.Lock()  # pdfium is not thread-safe
+
+def pdf_pages(content: bytes) -> list:
+    """PNG bytes of the first PDF_MAX_PAGES pages, rendered at PDF_RENDER_DPI."""
+    import pypdfium2 as pdfium
+    pages = []
+    with metrics.stage("pdf_render"), _pdf_lock:
+        pdf = pdfium.PdfDocument(content)
+        try:
+            for i in range(min(len(pdf), PDF_MAX_PAGES)):
+                buf = io.BytesIO()
+                pdf[i].render(scale=PDF_RENDER_DPI / 72).to_pil().save(buf, "PNG")
+                pages.append(buf.getvalue())
+        finally:
+            pdf.close()
+    return pages
+
+_media_pool = None
+
+def _get_media_pool():
+    global _media_pool
+    with _pool_lock:
+        if _media_pool is None:
+            _media_pool = ThreadPoolExecutor(max_workers=MEDIA_CONCURRENCY, thread_name_prefix="media")
+        return _media_pool
+
+def _attachment_images(item) -> list:
+    url, content_type = item
+    content = fetch_media_bytes(url)
+    return pdf_pages(content) if is_pdf(content, content_type) else [content]
+
+def ocr_attachments(items) -> list:
+    """OCR text of each (url, content type) attachment, in order; a PDF's pages are joined.
+
+    All downloads run at once, then every image and PDF page is OCR'd at once, on a
+    pool of MEDIA_CONCURRENCY threads shared by the whole process. Raises if any
+    attachment fails, so none is silently dropped.
+    """
+    # A lone photo (the common case) is handled on the calling thread
+    pool = _get_media_pool()
+    loaded = [_attachment_images(items[0])] if len(items) == 1 else pool.map(_attachment_images, items)
+    images = [(i, img) for i, imgs in enumerate(loaded) for img in imgs]
+    blobs = [img for _, img in images]
+    texts = [ocr_image_bytes(blobs[0])] if len(blobs) == 1 else pool.map(ocr_image_bytes, blobs)
+    parts = defaultdict(list)
+    for (i, _), text in zip(images, texts):
+        if text:
+            parts[i].append(text)
+    return ["\n\n".join(parts[i]) for i in range(len(items))]
+
+def ocr_from_media_url(media_url: str, content_type: str = "") -> str:
+    return ocr_attachments([(media_url, content_type)])[0]
+
+def ocr_cache_keys(content_sha256: str, phash: str = None) -> list:
+    """[(namespace, key)] for an image, by content hash and optionally perceptual hash."""
+    backend = OCR_BACKEND.lower()
+    variant = f"{backend}:{OCR_MAX_SIDE}:{OCR_TESSERACT_CONFIG}" if backend == "tesseract" else backend
+    keys = [("ocr", cache.digest(variant, content_sha256))]
+    if phash:
+        keys.append(("ocr-phash", cache.digest(variant, phash)))
+    return keys
+
+def cached_ocr(keys, thumb=None):
+    for ns, key in keys:
+        hit = cache.get(ns, key)
+        if hit is None:
+            continue
+        if ns == "ocr-phash":
+            # Only a confirmed copy of the same picture; entries without a thumbnail can't be checked
+            if not isinstance(hit, dict) or not thumb or not same_image(thumb, hit["thumb"]):
+                metrics.inc("ocr_phash_rejected_total")
+                continue
+            return hit["text"]
+        return hit
+    return None
+
+def store_ocr(keys, text, thumb=None):
+    for ns, key in keys:
+        cache.put(ns, key, {"text": text, "thumb": thumb} if ns == "ocr-phash" else text)
 
-def ocr_from_media_url(media_url: str) -> str:
-    content = fetch_media_bytes(media_url)
-    if OCR_BACKEND.lower() == "tesseract":
-        return ocr_via_tesseract(content)
-    return ocr_via_ocrspace(content)  # default
+def ocr_image_bytes(content: bytes) -> str:
+    phash, thumb = perceptual_hash(content) if CACHE_PHASH else (None, None)
+    keys = ocr_cache_keys(hashlib.sha256(content).hexdigest(), phash)
+    hit = cached_ocr(keys, thumb)
+    if hit is not None:
+        return hit
+    with metrics.stage("ocr"):
+        text = ocr_via_tesseract(content) if OCR_BACKEND.lower() == "tesseract" else ocr_via_ocrspace(content)
+    store_ocr(keys, text, thumb)
+    return text
@@ -0,0 +1,184 @@
+"""Deterministic fast path for simple expense messages ("rent 1200", "$12.50 starbucks coffee").
+
+`quick_parse` returns the same dict shape as `extract_with_llm`, or None when
+it is not confident enough, in which case callers fall back to the LLM.
+Categories come from the sender's merchants already in the ledger (learned)
+and a small built-in keyword map. Money coming in (refunds, salary, negative
+amounts), bills not yet paid, future dates and relative dates other than
+"yesterday" or a weekday ("last week", "3 days ago") always go to the LLM.
+"""
+import re, time, threading
+import datetime as dt
+
+from config import QUICKPARSE_MIN_CONFIDENCE
+from services import ledger
+from utils.dates import la_today, normalize_sheet_date
+
+CURRENCIES = {"$": "USD", "usd": "USD", "dollar": "USD", "dollars": "USD", "bucks": "USD",
+              "€": "EUR", "eur": "EUR", "euro": "EUR", "euros": "EUR",
+              "£": "GBP", "gbp": "GBP", "₹": "INR", "inr": "INR", "rs": "INR", "rs.": "INR"}
+
+# word -> category; BRANDS are keywords that are also a good merchant name
+KEYWORDS = {
+    "rent": "rent", "landlord": "rent",
+    "groceries": "groceries", "grocery": "groceries", "costco": "groceries", "safeway": "groceries",
+    "trader": "groceries", "walmart": "groceries", "kroger": "groceries", "aldi": "groceries",
+    "coffee": "eating_out", "starbucks": "eating_out", "lunch": "eating_out", "dinner": "eating_out",
+    "breakfast": "eating_out", "restaurant": "eating_out", "cafe": "eating_out", "pizza": "eating_out",
+    "mcdonalds": "eating_out", "chipotle": "eating_out", "doordash": "eating_out", "ubereats": "eating_out",
+    "electricity": "utilities", "electric": "utilities", "water": "utilities", "internet": "utilities",
+    "phone": "utilities", "comcast": "utilities", "pge": "utilities", "utilities": "utilities",
+    "uber": "transport", "lyft": "transport", "gas": "transport", "fuel": "transport", "parking": "transport",
+    "bus": "transport", "train": "transport", "metro": "transport", "toll": "transport", "taxi": "transport",
+    "amazon": "shopping", "target": "shopping", "clothes": "shopping", "shoes": "shopping",
+    "pharmacy": "medical", "doctor": "medical", "dentist": "medical", "cvs": "medical", "walgreens": "medical",
+    "netflix": "entertainment", "spotify": "entertainment", "movie": "entertainment", "movies": "entertainment",
+    "concert": "entertainment", "hotel": "travel", "flight": "travel", "airbnb": "travel",
+    "tuition": "education", "course": "education", "books": "education", "venmo": "transfer", "zelle": "transfer",
+}
+BRANDS = {"starbucks", "costco", "safeway", "walmart", "kroger", "aldi", "mcdonalds", "chipotle",
+          "doordash", "ubereats", "comcast", "pge", "uber", "lyft", "amazon", "target", "cvs",
+          "walgreens", "netflix", "spotify", "airbnb", "venmo", "zelle"}
+GENERIC = {"station", "ride", "bill", "store", "shop", "payment", "trip", "order", "ticket", "fee"}
+FILLER = {"paid", "pay", "spent", "spend", "bought", "buy", "for", "at", "to", "on", "in", "the",
+          "a", "an", "of", "with", "my", "and", "from", "via", "got"}
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+MONTHS = {"january", "february", "march", "april", "may", "june", "july", "august", "september",
+          "october", "november", "december", "jan", "feb", "mar", "apr", "jun", "jul", "aug", "sep",
+          "sept", "oct", "nov", "dec"}
+# Income, refunds, debts and unpaid bills are not plain expenses
+NEGATIVE = {"refund", "refunded", "returned", "return", "received", "receive", "got paid", "salary",
+            "income", "paycheck", "payroll", "reimbursed", "reimbursement", "due", "owe", "owes", "owed",
+            "paid back", "pay back", "cashback", "deposit"}
+FUTURE = {"next", "on", "due", "this", "coming", "tomorrow", "until", "by"}
+# Only "yesterday" and a weekday are resolved here; "last week", "3 days ago" go to the LLM
+RELATIVE = {"last", "ago", "week", "weeks", "month", "months", "earlier", "day", "days"}
+
+_AMOUNT = re.compile(r"(?<![\w/.])([$€£₹])?\s?(\d{1,3}(?:,\d{3})+|\d+)(\.\d{1,2})?(?![\w/])")
+_DATE_TOKEN = re.compile(r"\b(\d{4}-\d{1,2}-\d{1,2}|\d{1,2}/\d{1,2}(?:/\d{2,4})?)\b")
+_WORD = re.compile(r"[a-z][a-z'.&]*")
+_NEGATIVE_AMOUNT = re.compile(r"(?<![\w])-\s?[$€£₹]?\s?\d")
+
+LEARNED_TTL = 300  # seconds between reloads of a user's merchant dictionary
+_learned = {}  # uid -> (loaded at, {merchant: (name, category)})
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+def learned_merchants(uid=ledger.OWNER):
+    """lowercased merchant name -> (display name, most used category), from `uid`'s own rows."""
+    hit = _learned.get(uid)
+    if hit and time.monotonic() - hit[0] < LEARNED_TTL:
+        return hit[1]
+    cur = ledger.get_conn().execute(
+        "SELECT LOWER(name), name, category, COUNT(*) AS n FROM rows "
+        "WHERE uid=? AND name NOT IN ('', 'Unknown') AND category != '' GROUP BY 1, 3 ORDER BY n", (uid,)
+    )
+    learned = {key: (name, cat) for key, name, cat, _ in cur}  # most frequent wins (ordered last)
+    _learned[uid] = (time.monotonic(), learned)
+    return learned
+
+def keyword_category(text: str):
+    """Category of the first built-in keyword in `text`, or None."""
+    return next((KEYWORDS[w] for w in _WORD.findall((text or "").lower()) if w in KEYWORDS), None)
+
+def _relative_date(words, today):
+    if "yesterday" in words:
+        return today - dt.timedelta(days=1)
+    for i, day in enumerate(WEEKDAYS):
+        if day in words:
+            back = (today.weekday() - i) % 7
+            if back == 0 and "last" in words:
+                back = 7  # "last friday" on a Friday
+            return today - dt.timedelta(days=back)
+    return None
+
+def quick_parse(text: str, uid=ledger.OWNER, today=None):
+    """Parse a simple expense message from `uid`, or return None to defer to the LLM.
+
+    Relative dates are resolved against `today` (default: today in LA), e.g. the
+    day an imported chat message was sent.
+    """
+    data, confidence = parse(text or "", uid, today)
+    with _lock:
+        _stats["hits" if data and confidence >= QUICKPARSE_MIN_CONFIDENCE else "misses"] += 1
+    return data if data and confidence >= QUICKPARSE_MIN_CONFIDENCE else None
+
+def parse(text, uid=ledger.OWNER, today=None):
+    """(expense dict or None, confidence) for `text`, without the threshold or the hit stats."""
+    today = today or la_today()
+    s = text.strip().lower()
+    if not s or len(s) > 120 or "\n" in s:
+        return None, 0.0
+    padded = f" {' '.join(_WORD.findall(s))} "
+    if any(f" {cue} " in padded for cue in NEGATIVE):
+        return None, 0.0
+
+    date = None
+    m = _DATE_TOKEN.search(s)
+    if m:
+        date = normalize_sheet_date(m.group(1) if m.group(1).count("/") != 1 else f"{m.group(1)}/{today.year}")
+        s = s[:m.start()] + " " + s[m.end():]
+
+    if _NEGATIVE_AMOUNT.search(s):
+        return None, 0.0  # "coffee -5" is a refund or a correction
+    amounts = _AMOUNT.findall(s)
+    if len(amounts) != 1:
+        return None, 0.0  # no amount, or several expenses: leave it to the LLM
+    sym, whole, frac = amounts[0]
+    amount = float(whole.replace(",", "") + frac)
+    s = _AMOUNT.sub(" ", s)
+
+    words = _WORD.findall(s)
+    currency = CURRENCIES.get(sym) or next((CURRENCIES[w] for w in words if w in CURRENCIES), "USD")
+    if MONTHS & set(words) or "tomorrow" in words:
+        return None, 0.0  # a month or future reference the day resolver does not handle
+    if FUTURE & set(words) and set(WEEKDAYS) & set(words):
+        return None, 0.0  # "on friday", "next monday": not necessarily the past one
+    rel = _relative_date(words, today)
+    if rel:
+        date = rel.isoformat()
+    elif RELATIVE & set(words):
+        return None, 0.0  # a date we cannot resolve; logging it under today would be wrong
+    skip = FILLER | set(CURRENCIES) | set(WEEKDAYS) | {"today", "yesterday", "last"}
+    rest = [w.strip(".'") for w in words if w not in skip]
+    rest = [w for w in rest if w]
+    if not rest:
+        return None, 0.0
+
+    confidence = 0.5
+    learned = learned_merchants(uid)
+    name = category = None
+    matched = set()
+    for n in (3, 2, 1):  # longest known merchant phrase wins
+        for i in range(len(rest) - n + 1):
+            hit = learned.get(" ".join(rest[i:i + n]))
+            if hit:
+                name, category = hit
+                matched = set(rest[i:i + n])
+                break
+        if name:
+            break
+    if name:
+        confidence += 0.3
+        others = [w for w in rest if w not in matched and w not in KEYWORDS and w not in GENERIC]
+    else:
+        kw = next((w for w in rest if w in BRANDS), None) or next((w for w in rest if w in KEYWORDS), None)
+        if kw is None:
+            return None, 0.0
+        category = KEYWORDS[kw]
+        others = [w for w in rest if w not in KEYWORDS and w not in GENERIC]
+        name = kw.title()  # other words may be a description, a place or a typo: not a merchant
+        confidence += 0.25
+    if len(rest) <= 4:
+        confidence += 0.1
+    # Each word that is neither a known merchant, a keyword nor filler is a guess
+    confidence -= 0.05 * len(others)
+
+    return {"name": name, "amount": amount, "currency": currency, "category": category,
+            "date": date, "notes": text.strip()}, round(confidence, 2)
+
+def stats():
+    with _lock:
+        hits, misses = _stats["hits"], _stats["misses"]
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "hit_rate": round(hits / total, 3) if total else None}
@@ -0,0 +1,136 @@
+"""Per-day spending rollups kept next to the ledger rows.
+
+`day_rollup` holds one bucket per (user, day, category) and (user, day,
+merchant), plus a ('rows', '') bucket counting every dated row so averages can
+use days with activity. Buckets for a user's day are recomputed whenever one of
+their ledger rows on that day is written, so a week or month is a sum over at
+most 31 days of that user's buckets.
+"""
+from collections import defaultdict
+from services import ledger, metrics
+from utils.rows import to_ordinal
+
+_CHUNK = 500  # stay under SQLite's bound-parameter limit
+
+def init(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS day_rollup (
+            uid TEXT, day INTEGER, kind TEXT, key TEXT, total REAL, n INTEGER,
+            PRIMARY KEY (uid, day, kind, key)
+        )
+    """)
+    # Ledger files that predate rollups: build buckets once
+    if conn.execute("SELECT 1 FROM day_rollup LIMIT 1").fetchone() is None:
+        keys = conn.execute("SELECT DISTINCT uid, day FROM rows WHERE day IS NOT NULL").fetchall()
+        if keys:
+            with conn:
+                refresh_days(conn, keys)
+
+def refresh_days(conn, keys):
+    """Recompute buckets for `keys` ((uid, day ordinal) pairs) from ledger rows. Caller commits."""
+    by_uid = defaultdict(set)
+    for uid, day in keys:
+        if day is not None:
+            by_uid[uid].add(day)
+    for uid, days in by_uid.items():
+        days = sorted(days)
+        for i in range(0, len(days), _CHUNK):
+            chunk = days[i:i + _CHUNK]
+            marks = ", ".join("?" * len(chunk))
+            args = [uid, *chunk]
+            conn.execute(f"DELETE FROM day_rollup WHERE uid=? AND day IN ({marks})", args)
+            conn.execute(f"""
+                INSERT INTO day_rollup(uid, day, kind, key, total, n)
+                SELECT uid, day, 'category', COALESCE(NULLIF(category, ''), 'other'), SUM(amt), COUNT(*)
+                FROM rows WHERE uid=? AND day IN ({marks}) AND amt IS NOT NULL GROUP BY 1, 2, 3, 4
+            """, args)
+            conn.execute(f"""
+                INSERT INTO day_rollup(uid, day, kind, key, total, n)
+                SELECT uid, day, 'merchant', COALESCE(NULLIF(name, ''), 'Unknown'), SUM(amt), COUNT(*)
+                FROM rows WHERE uid=? AND day IN ({marks}) AND amt IS NOT NULL GROUP BY 1, 2, 3, 4
+            """, args)
+            conn.execute(f"""
+                INSERT INTO day_rollup(uid, day, kind, key, total, n)
+                SELECT uid, day, 'rows', '', 0, COUNT(*) FROM rows WHERE uid=? AND day IN ({marks}) GROUP BY 1, 2
+            """, args)
+
+def rebuild():
+    """Drop every bucket and recompute from the ledger. Returns the number of (user, day) pairs."""
+    conn = ledger.get_conn()
+    with conn:
+        conn.execute("DELETE FROM day_rollup")
+        keys = conn.execute("SELECT DISTINCT uid, day FROM rows WHERE day IS NOT NULL").fetchall()
+        refresh_days(conn, keys)
+    return len(keys)
+
+def reconcile():
+    """Re-read the sheet (picking up hand edits) and rebuild buckets.
+
+    Returns the (uid, day ordinal) pairs whose buckets changed.
+    """
+    conn = ledger.get_conn()
+    q = "SELECT uid, day, kind, key, ROUND(total, 6), n FROM day_rollup ORDER BY 1, 2, 3, 4"
+    before = {}
+    for r in conn.execute(q):
+        before.setdefault(r[:2], []).append(r)
+    ledger.resync()
+    after = {}
+    for r in conn.execute(q):
+        after.setdefault(r[:2], []).append(r)
+    return sorted(d for d in before.keys() | after.keys() if before.get(d) != after.get(d))
+
+def has_day(day, uid=ledger.OWNER) -> bool:
+    """True if `uid` has any row dated `day`."""
+    return ledger.get_conn().execute(
+        "SELECT 1 FROM day_rollup WHERE uid=? AND day=? AND kind='rows'", (uid, to_ordinal(day))).fetchone() is not None
+
+def windows_metrics(windows, uid=ledger.OWNER):
+    """[(metrics, days), ...] for each (start, end) in `windows`, from one scan of
+    `uid`'s buckets spanning all of them. metrics has total, count, by_category,
+    by_merchant, top_category and top_merchant; days is the number of days in
+    the window that have rows."""
+    spans = [(to_ordinal(s), to_ordinal(e)) for s, e in windows]
+    if not spans:
+        return []
+    cols, params = [], []
+    for s, e in spans:
+        cols.append("SUM(CASE WHEN day BETWEEN ? AND ? THEN total END), "
+                    "SUM(CASE WHEN day BETWEEN ? AND ? THEN n END), "
+                    "SUM(CASE WHEN day BETWEEN ? AND ? THEN 1 END)")
+        params += [s, e] * 3
+    params += [uid, min(s for s, _ in spans), max(e for _, e in spans)]
+    with metrics.stage("rollup_query"):
+        rows = ledger.get_conn().execute(
+            f"SELECT kind, key, {', '.join(cols)} FROM day_rollup WHERE uid=? AND day BETWEEN ? AND ? GROUP BY kind, key",
+            params,
+        ).fetchall()
+    acc = [({}, {}, [0.0, 0, 0]) for _ in spans]
+    for r in rows:
+        kind, key = r[0], r[1]
+        for i, (by_cat, by_name, tot) in enumerate(acc):
+            amt, cnt, ndays = r[2 + 3*i: 5 + 3*i]
+            if ndays is None:
+                continue
+            if kind == "category":
+                by_cat[key] = amt
+                tot[0] += amt; tot[1] += cnt
+            elif kind == "merchant":
+                by_name[key] = amt
+            else:
+                tot[2] = ndays
+    out = []
+    for by_cat, by_name, (total, n, days) in acc:
+        top_cat = max(by_cat.items(), key=lambda kv: kv[1])[0] if by_cat else None
+        top_name = max(by_name.items(), key=lambda kv: kv[1])[0] if by_name else None
+        out.append(({"total": round(total,2), "count": n, "by_category": by_cat, "by_merchant": by_name,
+                     "top_category": top_cat, "top_merchant": top_name}, days))
+    return out
+
+if __name__ == "__main__":
+    import sys
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "reconcile"
+    if cmd == "rebuild":
+        print(f"Rebuilt rollups for {rebuild()} user-days.")
+    else:
+        fixed = reconcile()
+        print(f"Reconciled rollups; {len(fixed)} user-days changed.")
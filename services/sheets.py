@@ -1,10 +1,13 @@
-import os, json
+import os, re, json, time, queue, atexit, threading
 import datetime as dt
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
-from config import SERVICE_ACCOUNT_JSON, SERVICE_ACCOUNT_JSON_CONTENT, SHEET_ID
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from config import (SERVICE_ACCOUNT_JSON, SERVICE_ACCOUNT_JSON_CONTENT, SHEET_ID,
+                    SHEETS_BATCH_SIZE, SHEETS_BATCH_WAIT_MS, SHEETS_WRITE_TIMEOUT, SHEETS_READ_PAGE, HTTP_RETRIES)
+from services import discovery, metrics
 
 _sheets_values = None
+_creds = None
+_thread = threading.local()
 
 def _load_sa_info():
     if SERVICE_ACCOUNT_JSON_CONTENT:
@@ -12,21 +15,42 @@ def _load_sa_info():
     with open(SERVICE_ACCOUNT_JSON) as f:
         return json.load(f)
 
+def _thread_http():
+    # httplib2 is not thread-safe: each thread (and forked worker) keeps its own
+    # authorized keep-alive connection
+    http = getattr(_thread, "http", None)
+    if http is None or getattr(_thread, "pid", None) != os.getpid():
+        import httplib2
+        from google_auth_httplib2 import AuthorizedHttp
+        http = AuthorizedHttp(_creds, http=httplib2.Http(timeout=30))
+        _thread.http, _thread.pid = http, os.getpid()
+    return http
+
+def _build_request(http, *args, **kwargs):
+    from googleapiclient.http import HttpRequest
+    return HttpRequest(_thread_http(), *args, **kwargs)
+
 def get_values_client():
-    global _sheets_values
+    global _sheets_values, _creds
     if _sheets_values:
         return _sheets_values
+    # The Google client libraries are imported here, not at startup
+    from google.oauth2.service_account import Credentials
+    from googleapiclient.discovery import build, build_from_document
     sa_info = _load_sa_info()
-    creds = Credentials.from_service_account_info(
+    _creds = Credentials.from_service_account_info(
         sa_info, scopes=["https://www.googleapis.com/auth/spreadsheets"]
     )
-    _sheets_values = build("sheets", "v4", credentials=creds).spreadsheets().values()
+    doc = discovery.load()
+    service = (build_from_document(doc, credentials=_creds, requestBuilder=_build_request) if doc
+               else build("sheets", "v4", credentials=_creds, requestBuilder=_build_request))
+    _sheets_values = service.spreadsheets().values()
     print("Google Sheets client initialized.")
     return _sheets_values
 
-def append_transaction_row(data: dict, source: str, msg_sid: str):
+def _build_row(data: dict, source: str, msg_sid: str, user: str = ""):
     ts = dt.datetime.utcnow().isoformat()
-    row = [
+    return [
         ts,
         data.get("date"),
         data.get("name"),
@@ -35,17 +59,182 @@ def append_transaction_row(data: dict, source: str, msg_sid: str):
         data.get("category"),
         data.get("notes"),
         source,
-        msg_sid
+        msg_sid,
+        user
     ]
+
+def append_rows(rows: list):
+    """One `values().append` call for many rows. Returns their sheet row numbers."""
     client = get_values_client()
-    client.append(
+    res = client.append(
         spreadsheetId=SHEET_ID,
-        range="transactions!A:I",
+        range="transactions!A:J",
         valueInputOption="USER_ENTERED",
-        body={"values": [row]}
+        body={"values": rows}
     ).execute()
 
-def read_all_rows():
+    # Write through to the local ledger so summaries see the rows without a re-sync
+    first = _updated_row_number(res)
+    if not first:
+        return [None] * len(rows)
+    from services import ledger
+    try:
+        ledger.record_many(first, rows)
+    except Exception as e:
+        # The rows are in the sheet: failing here would make callers append them again.
+        # The next tail sync picks them up (write-through never advances synced_through).
+        print(f"Ledger write-through failed for rows {first}-{first + len(rows) - 1}: {e}")
+    return [first + i for i in range(len(rows))]
+
+class _WriteBuffer:
+    """Write-behind buffer that coalesces concurrent appends into bulk calls.
+
+    A single writer thread drains whatever is pending (up to SHEETS_BATCH_SIZE
+    rows, lingering SHEETS_BATCH_WAIT_MS for more) into one append. Each caller
+    gets a Future resolving to its sheet row number or the append error.
+    """
+    def __init__(self, max_rows, wait_s):
+        self.max_rows, self.wait_s = max_rows, wait_s
+        self.pending = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="sheets-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, row) -> Future:
+        fut = Future()
+        self.pending.put((row, fut))
+        return fut
+
+    def _take_batch(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.wait_s
+        while len(batch) < self.max_rows:
+            try:
+                item = self.pending.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is None:
+                self.pending.put(None)  # let _run see the stop marker after this flush
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                return
+            batch = self._take_batch(item)
+            try:
+                row_nums = append_rows([row for row, _ in batch])
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            for (_, fut), n in zip(batch, row_nums):
+                fut.set_result(n)
+
+    def close(self):
+        self.pending.put(None)
+        self.thread.join(timeout=30)
+
+_buffer = None
+_buffer_lock = threading.Lock()
+_inflight = {}  # msg_sid -> Future of its queued append, until the writer finishes it
+
+def _get_buffer():
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None or not _buffer.thread.is_alive():
+            _buffer = _WriteBuffer(SHEETS_BATCH_SIZE, SHEETS_BATCH_WAIT_MS / 1000.0)
+        return _buffer
+
+@atexit.register
+def flush_pending_writes():
+    if _buffer is not None:
+        _buffer.close()
+
+def submit_transaction_row(data: dict, source: str, msg_sid: str, user: str = "") -> Future:
+    """Queue one transaction on the write buffer; the Future resolves to its sheet row number."""
+    fut = _get_buffer().submit(_build_row(data, source, msg_sid, user))
+    if msg_sid:
+        _inflight[msg_sid] = fut
+        fut.add_done_callback(lambda _: _inflight.pop(msg_sid, None))
+    return fut
+
+def append_transaction_row(data: dict, source: str, msg_sid: str, user: str = ""):
+    """Append one transaction; concurrent calls share a bulk append. Returns the sheet row number.
+
+    A TimeoutError does not mean the row was not written: it stays queued and the
+    writer may still append it. Retries go through `wait_for_write` and a ledger re-sync.
+    """
+    with metrics.stage("sheets_append"):
+        if SHEETS_BATCH_SIZE <= 1:
+            return append_rows([_build_row(data, source, msg_sid, user)])[0]
+        fut = submit_transaction_row(data, source, msg_sid, user)
+        try:
+            return fut.result(timeout=SHEETS_WRITE_TIMEOUT)
+        except FutureTimeout:
+            raise TimeoutError(f"sheet append still pending after {SHEETS_WRITE_TIMEOUT:g}s") from None
+
+def wait_for_write(msg_sid, timeout=SHEETS_WRITE_TIMEOUT):
+    """Wait for this process's queued append of `msg_sid`, if one is still pending."""
+    fut = _inflight.get(msg_sid)
+    if fut is None:
+        return
+    try:
+        fut.result(timeout=timeout)
+    except Exception:
+        pass  # failed or still stuck: the caller re-checks the sheet either way
+
+def append_transaction_rows(items: list):
+    """Bulk append [(data, source, msg_sid[, user]), ...] in chunks of SHEETS_BATCH_SIZE.
+
+    Returns one entry per item: its sheet row number, or the exception that
+    failed its chunk.
+    """
+    rows = [_build_row(*item) for item in items]
+    step = max(1, SHEETS_BATCH_SIZE)
+    results = []
+    for i in range(0, len(rows), step):
+        chunk = rows[i:i + step]
+        try:
+            with metrics.stage("sheets_append"):
+                results.extend(append_rows(chunk))
+        except Exception as e:
+            results.extend([e] * len(chunk))
+    return results
+
+def _updated_row_number(res):
+    # e.g. {"updates": {"updatedRange": "transactions!A57:J57"}}
+    rng = (res or {}).get("updates", {}).get("updatedRange", "")
+    m = re.search(r"![A-Z]+(\d+)", rng)
+    return int(m.group(1)) if m else None
+
+def iter_row_blocks(start_row: int = 2, end_row: int = None, page: int = None):
+    """Yield (first sheet row number, raw rows) pages of at most `page` rows, from 1-based
+    `start_row` through `end_row` (default: the end of the sheet).
+
+    Only one page is in memory at a time. The API drops trailing empty rows from a
+    range, so a short page may just end in blank rows: reading to the end stops at
+    the first empty page.
+    """
+    page = page or SHEETS_READ_PAGE
     client = get_values_client()
-    res = client.get(spreadsheetId=SHEET_ID, range="transactions!A:I").execute()
-    return res.get("values", [])[1:]
+    row = start_row
+    while end_row is None or row <= end_row:
+        last = row + page - 1 if end_row is None else min(row + page - 1, end_row)
+        with metrics.stage("sheets_read"):
+            res = client.get(spreadsheetId=SHEET_ID, range=f"transactions!A{row}:J{last}").execute(num_retries=HTTP_RETRIES)
+        rows = res.get("values", [])
+        if not rows and end_row is None:
+            return
+        if rows:
+            yield row, rows
+        row = last + 1
+
+def iter_rows(ranges):
+    """Yield (sheet row number, raw row) for [(first, last), ...] ranges; last=None reads to the end."""
+    for first, last in ranges:
+        for start, rows in iter_row_blocks(first, last):
+            for i, r in enumerate(rows):
+                yield start + i, r
@@ -0,0 +1,67 @@
+"""Cold-start timing for this process: import / init phases, warm-up steps and the
+time to the first response, served at /debug-startup.
+
+    python -m services.startup [--top 20]   # per-package import cost of `import app`
+
+Times are measured from when this module is first imported (the top of app.py),
+so interpreter start-up itself is not included.
+"""
+import os, sys, time, threading, subprocess, argparse
+from collections import defaultdict
+from contextlib import contextmanager
+
+T0 = time.perf_counter()
+_phases = []  # (name, seconds, started at seconds since T0)
+_lock = threading.Lock()
+_first_response = None
+
+@contextmanager
+def timed(name):
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _lock:
+            _phases.append((name, time.perf_counter() - t, t - T0))
+
+def mark_first_response(response=None):
+    """after_request hook: remembers when the first response of the process went out."""
+    global _first_response
+    if _first_response is None:
+        _first_response = time.perf_counter() - T0
+    return response
+
+def report() -> dict:
+    with _lock:
+        phases = [{"phase": n, "ms": round(s * 1000, 1), "at_ms": round(a * 1000, 1)} for n, s, a in _phases]
+    return {"phases": phases, "uptime_s": round(time.perf_counter() - T0, 3),
+            "first_response_ms": round(_first_response * 1000, 1) if _first_response is not None else None}
+
+def print_report(title="Startup"):
+    r = report()
+    print(f"{title}: " + ", ".join(f"{p['phase']} {p['ms']}ms" for p in r["phases"]))
+
+def import_costs(target="app", top=20):
+    """[(package, ms)] of self import time per top-level package for `import target`, in a fresh interpreter."""
+    # no warm-up thread: its imports would be interleaved with the ones measured
+    p = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {target}"],
+                       capture_output=True, text=True, env=dict(os.environ, WARMUP_ON_START="0"))
+    by_pkg = defaultdict(int)
+    for line in p.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        by_pkg[name.strip().split(".")[0]] += int(self_us)
+    return [(pkg, round(us / 1000, 1)) for pkg, us in sorted(by_pkg.items(), key=lambda kv: -kv[1])[:top]]
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Per-package import cost of the app")
+    ap.add_argument("--target", default="app")
+    ap.add_argument("--top", type=int, default=20)
+    args = ap.parse_args(argv)
+    costs = import_costs(args.target, args.top)
+    for pkg, ms in costs:
+        print(f"{pkg:>28}  {ms:8.1f} ms")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,252 @@
+"""Summary engine: daily / weekly / monthly contexts from one pass over the rollups.
+
+`build_contexts(kinds, date)` syncs the ledger once, collects every window the
+requested kinds need (the day, its trailing window, the week or month and the
+previous one) and aggregates them all in a single `rollups.windows_metrics` scan.
+Contexts are per user (`uid`, default the owner); `fan_out` runs the engine for
+many users with bounded concurrency.
+
+The /summaries cron sends in the background (`start_send_all`): a marker per
+(user, kind, cron date) in `summary_sent` is claimed before each send, so a
+retried or overlapping cron call skips what was already sent.
+
+Summary texts are memoized by a fingerprint of their context (see
+`services.llm.summary_cache_key`), so they are only regenerated after the
+window's data changes. With SUMMARY_PRECOMPUTE, `schedule_precompute(uid)`
+regenerates a user's current day/week/month texts in the background shortly
+after they log something, so previews and crons return straight from the cache.
+"""
+import time, threading, contextvars
+import datetime as dt
+import calendar
+from concurrent.futures import ThreadPoolExecutor
+
+from services import ledger, rollups
+from services.llm import grok_summarize, grok_summarize_window
+from services.messaging import send_whatsapp
+from utils.dates import la_today
+from config import SUMMARY_FANOUT_WORKERS, SUMMARY_PRECOMPUTE, SUMMARY_PRECOMPUTE_DELAY, ANALYTICS_IN_SUMMARIES
+
+KINDS = ("day", "week", "month")
+
+def week_bounds(anchor_date: dt.date):
+    start = anchor_date - dt.timedelta(days=anchor_date.weekday())
+    end = start + dt.timedelta(days=6)
+    return start.isoformat(), end.isoformat()
+
+def month_bounds(anchor_date: dt.date):
+    y, m = anchor_date.year, anchor_date.month
+    first = dt.date(y, m, 1)
+    last = dt.date(y, m, calendar.monthrange(y, m)[1])
+    return first.isoformat(), last.isoformat()
+
+def prev_week_bounds(week_start_iso):
+    start = dt.date.fromisoformat(week_start_iso)
+    prev_end = start - dt.timedelta(days=1)
+    prev_start = prev_end - dt.timedelta(days=6)
+    return prev_start.isoformat(), prev_end.isoformat()
+
+def prev_month_bounds(month_start_iso):
+    start = dt.date.fromisoformat(month_start_iso)
+    y, m = start.year, start.month
+    py, pm = (y-1, 12) if m == 1 else (y, m-1)
+    first = dt.date(py, pm, 1)
+    last = dt.date(py, pm, calendar.monthrange(py, pm)[1])
+    return first.isoformat(), last.isoformat()
+
+def trailing_bounds(end_iso, days):
+    end = dt.date.fromisoformat(end_iso)
+    return (end - dt.timedelta(days=days - 1)).isoformat(), end_iso
+
+def due_kinds(today: dt.date):
+    """Kinds a once-a-day cron should send on `today`: the week on Sundays, the month on its last day."""
+    kinds = ["day"]
+    if today.weekday() == 6:
+        kinds.append("week")
+    if today.day == calendar.monthrange(today.year, today.month)[1]:
+        kinds.append("month")
+    return kinds
+
+def requested_kinds(kinds_arg, date_iso):
+    """Kinds from a "day,week,month" query value, or those due on `date_iso` when empty."""
+    if kinds_arg:
+        return [k for k in kinds_arg.split(",") if k in KINDS]
+    return due_kinds(dt.date.fromisoformat(date_iso))
+
+def _day_used(date_iso, fallback_to_latest, uid):
+    day = date_iso or la_today().isoformat()
+    if fallback_to_latest and not rollups.has_day(day, uid):
+        day = ledger.latest_date(uid) or day
+    return day
+
+def _anchor(date_iso, uid):
+    if date_iso:
+        return dt.date.fromisoformat(date_iso)
+    latest = ledger.latest_date(uid)
+    return dt.date.fromisoformat(latest) if latest else la_today()
+
+def build_contexts(kinds=KINDS, date=None, days_window=7, fallback_to_latest=True, compare_prev=True,
+                   uid=ledger.OWNER):
+    """{kind: context} of `uid`'s rows for each of `kinds` ("day", "week", "month") anchored on `date` (ISO).
+
+    Without `date` the day is today (falling back to the latest logged day) and
+    weeks/months are anchored on the latest logged day, as the cron endpoints expect.
+    """
+    ledger.sync()
+    windows = {}
+    if "day" in kinds:
+        day = _day_used(date, fallback_to_latest, uid)
+        windows["day"] = (day, day)
+        windows["trailing"] = trailing_bounds(day, days_window)
+    if "week" in kinds or "month" in kinds:
+        anchor = _anchor(date, uid)
+        for label, bounds, prev in (("week", week_bounds, prev_week_bounds), ("month", month_bounds, prev_month_bounds)):
+            if label in kinds:
+                windows[label] = bounds(anchor)
+                if compare_prev:
+                    windows["prev_" + label] = prev(windows[label][0])
+
+    names = list(windows)
+    res = dict(zip(names, rollups.windows_metrics([windows[n] for n in names], uid)))
+
+    out = {}
+    if "day" in kinds:
+        mN, uniq = res["trailing"]
+        avg_per_day = round(mN["total"]/max(1,uniq), 2) if uniq else 0.0
+        out["day"] = {"date_used": windows["day"][0], "today": res["day"][0],
+                      "last_window_days": days_window,
+                      "last_window": {"total": mN["total"], "count": mN["count"], "avg_per_day": avg_per_day, "by_category": mN["by_category"]}}
+    for label in ("week", "month"):
+        if label not in kinds:
+            continue
+        (start_iso, end_iso), (metrics, uniq) = windows[label], res[label]
+        prev = None
+        if compare_prev:
+            ps, pe = windows["prev_" + label]
+            prev = {"start": ps, "end": pe, "metrics": res["prev_" + label][0]}
+        avg_per_day = round(metrics["total"]/max(1,uniq), 2) if uniq else 0.0
+        out[label] = {"label": label, "window": {"start": start_iso, "end": end_iso, "metrics": metrics, "avg_per_day": avg_per_day}, "previous_window": prev}
+        if ANALYTICS_IN_SUMMARIES and metrics["count"]:
+            from services import analytics  # NumPy is only needed once a window has rows
+            out[label]["insights"] = analytics.window_insights(uid, start_iso, end_iso)
+    return out
+
+def empty_text(kind, ctx):
+    """Reply for a context with no expenses, or None if there is something to summarise."""
+    if kind == "day":
+        return f"Daily summary for {ctx['date_used']}\nNo expenses logged." if ctx["today"]["count"] == 0 else None
+    if ctx["window"]["metrics"]["count"] > 0:
+        return None
+    start_iso, end_iso = ctx["window"]["start"], ctx["window"]["end"]
+    if kind == "week":
+        return f"Weekly summary {start_iso} → {end_iso}\nNo expenses logged."
+    return f"Monthly summary {start_iso[:7]}\nNo expenses logged."
+
+def fan_out(fn, uids, workers=None):
+    """Run fn(uid) for every uid on a bounded pool. Returns {uid: exception} for the failures."""
+    failed = {}
+    def one(uid):
+        try:
+            fn(uid)
+        except Exception as e:
+            failed[uid] = e
+    with ThreadPoolExecutor(max_workers=max(1, workers or SUMMARY_FANOUT_WORKERS)) as pool:
+        # each task runs in a copy of the caller's context so its stages land in the request trace
+        for f in [pool.submit(contextvars.copy_context().run, one, uid) for uid in uids]:
+            f.result()
+    return failed
+
+def summary_text(kind, ctx, refresh=False):
+    empty = empty_text(kind, ctx)
+    if empty:
+        return empty
+    return grok_summarize(ctx, refresh) if kind == "day" else grok_summarize_window(ctx, refresh)
+
+# ---- Cron sends
+def _sent_conn():
+    conn = ledger.get_conn()
+    conn.execute("CREATE TABLE IF NOT EXISTS summary_sent "
+                 "(uid TEXT, kind TEXT, period TEXT, sent_at REAL, PRIMARY KEY (uid, kind, period))")
+    return conn
+
+def claim_send(uid, kind, date_iso) -> bool:
+    """Mark `uid`'s `kind` summary for the cron date as sent; False if it already was."""
+    conn = _sent_conn()
+    with conn:
+        cur = conn.execute("INSERT OR IGNORE INTO summary_sent(uid, kind, period, sent_at) VALUES (?, ?, ?, ?)",
+                           (uid, kind, date_iso, time.time()))
+    return cur.rowcount == 1
+
+def release_send(uid, kinds, date_iso):
+    """Undo claims whose send failed, so the next cron call retries them."""
+    conn = _sent_conn()
+    with conn:
+        conn.executemany("DELETE FROM summary_sent WHERE uid=? AND kind=? AND period=?",
+                         [(uid, k, date_iso) for k in kinds])
+
+def send_all(kinds, date_iso, uids, refresh=False):
+    """Send every user in `uids` their `kinds` summaries for the cron date, skipping any
+    already sent. Returns {uid: exception} for the failures."""
+    def send_for(uid):
+        todo = [k for k in kinds if claim_send(uid, k, date_iso)]
+        sent = 0
+        try:
+            if todo:
+                ctxs = build_contexts(todo, date_iso, uid=uid)
+                for kind in todo:
+                    send_whatsapp(summary_text(kind, ctxs[kind], refresh), to=uid or None)
+                    sent += 1
+        except Exception:
+            release_send(uid, todo[sent:], date_iso)
+            raise
+
+    failed = fan_out(send_for, uids)
+    for uid, e in failed.items():
+        print(f"Summary for {uid} failed: {e}")
+    print(f"Summaries for {date_iso}: {len(uids) - len(failed)}/{len(uids)} users done")
+    return failed
+
+def start_send_all(kinds, date_iso, uids, refresh=False):
+    """Run `send_all` on a background thread, so the cron request returns right away."""
+    t = threading.Thread(target=send_all, args=(kinds, date_iso, uids, refresh), name="summaries-cron", daemon=True)
+    t.start()
+    return t
+
+# ---- Background precompute
+_due = {}  # uid -> monotonic time its precompute runs
+_cv = threading.Condition()
+_worker = None
+
+def precompute(uid):
+    """Generate (into the cache) the texts previews and crons will ask for next."""
+    date_iso = la_today().isoformat()
+    for date in (None, date_iso):  # preview default anchor, and the /summaries cron's
+        for kind, ctx in build_contexts(KINDS, date, uid=uid).items():
+            summary_text(kind, ctx)
+
+def _precompute_loop():
+    while True:
+        with _cv:
+            while not _due or min(_due.values()) > time.monotonic():
+                _cv.wait(timeout=min(_due.values()) - time.monotonic() if _due else None)
+            now = time.monotonic()
+            ready = [uid for uid, at in _due.items() if at <= now]
+            for uid in ready:
+                del _due[uid]
+        for uid in ready:
+            try:
+                precompute(uid)
+            except Exception as e:
+                print(f"Summary precompute for {uid} failed: {e}")
+
+def schedule_precompute(uid):
+    """Queue a background precompute for `uid`; messages within the delay share one run."""
+    global _worker
+    if not SUMMARY_PRECOMPUTE:
+        return
+    with _cv:
+        _due.setdefault(uid, time.monotonic() + SUMMARY_PRECOMPUTE_DELAY)
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_precompute_loop, name="summary-precompute", daemon=True)
+            _worker.start()
+        _cv.notify()
@@ -0,0 +1,19 @@
+"""Point every service at throwaway SQLite files and the offline fakes before any
+module reads config (the same setup bench/run.py gives its child processes)."""
+import os, tempfile
+
+_tmp = tempfile.mkdtemp(prefix="tests-")
+os.environ.update(
+    LEDGER_DB_PATH=os.path.join(_tmp, "ledger.db"), CACHE_DB_PATH=os.path.join(_tmp, "cache.db"),
+    QUEUE_DB_PATH=os.path.join(_tmp, "queue.db"), WARMUP_ON_START="0", INGEST_MODE="sync",
+    SUMMARY_PRECOMPUTE="0", ALLOWED_SENDERS="", INTERNAL_CRON_TOKEN="",
+    SHEET_ID="test", GROQ_API_KEY="test", OCRSPACE_API_KEY="test",
+    TWILIO_ACCOUNT_SID="ACtest", TWILIO_AUTH_TOKEN="test",
+    TWILIO_WHATSAPP_FROM="whatsapp:+15550000000", YOUR_WHATSAPP_NUMBER="whatsapp:+15551234567")
+
+import pytest
+from bench import fakes
+
+@pytest.fixture(autouse=True)
+def offline():
+    return fakes.install()
@@ -0,0 +1,44 @@
+import io, json
+import datetime as dt
+
+from services import backfill, llm
+
+CHAT = """3/1/24, 9:14 PM - Sam: uber 14 yesterday
+3/1/24, 9:14 PM - Bot: Logged: Uber 14.00 USD (transport)
+3/5/24, 8:02 AM - Sam: rent 1200
+3/6/24, 1:30 PM - Sam: dinner with the team 40 yesterday at luigis
+"""
+
+def records(text=CHAT, **kw):
+    return list(backfill.parse_whatsapp(io.StringIO(text), sender="Sam", **kw))
+
+def test_scan_and_parse_chat():
+    assert backfill.scan_chat(io.StringIO(CHAT)) == ("Sam", False)
+    assert [(r["line"], r["date"]) for r in records()] == [(1, "2024-03-01"), (3, "2024-03-05"), (4, "2024-03-06")]
+
+def test_dayfirst_dates():
+    chat = "13/02/2024, 21:14 - Sam: coffee 5\n01/03/2024, 08:00 - Sam: rent 1200\n"
+    assert backfill.scan_chat(io.StringIO(chat)) == ("Sam", True)
+    assert [r["date"] for r in records(chat, dayfirst=True)] == ["2024-02-13", "2024-03-01"]
+
+def test_quickparse_dates_are_relative_to_the_message():
+    out = {r["line"]: r for r in backfill.pre_extract(records())}
+    assert out[1]["expenses"][0]["date"] == "2024-02-29"  # the day before it was sent
+    assert out[3]["expenses"][0]["date"] == "2024-03-05"
+    assert "expenses" not in out[4]  # left to the LLM
+
+def test_llm_gets_each_line_sent_date():
+    recs = records()
+    req = llm.batch_request([r["text"] for r in recs], [backfill._sent(r) for r in recs])
+    inputs = [json.loads(l) for l in req["messages"][1]["content"].split("Inputs:\n", 1)[1].splitlines()]
+    assert [x["sent"] for x in inputs] == ["2024-03-01", "2024-03-05", "2024-03-06"]
+    assert "sent" not in llm.batch_request(["coffee 5"])["messages"][1]["content"]
+
+def test_llm_group_falls_back_to_the_message_date():
+    recs = backfill._llm_group([r for r in records() if r["line"] == 4])
+    assert [e["date"] for e in recs[0]["expenses"]] == ["2024-03-06"]
+
+def test_statement_rows_have_no_reference_date():
+    row = {"line": 2, "text": "x", "date": "2024-03-01", "name": "UBER", "amount": 14.0}
+    assert backfill._sent(row) is None
+    assert backfill._sent({**row, "name": None}) == dt.date(2024, 3, 1)
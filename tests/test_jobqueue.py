@@ -0,0 +1,56 @@
+import time
+import pytest
+
+from services import jobqueue
+
+@pytest.fixture(autouse=True)
+def empty_queue():
+    jobqueue.get_conn().execute("DELETE FROM jobs")
+
+def enqueue(n):
+    for i in range(n):
+        assert jobqueue.enqueue({"MessageSid": f"SM{i}", "Body": f"coffee {i}"})
+
+def age(seconds):
+    jobqueue.get_conn().execute("UPDATE jobs SET updated = updated - ?", (seconds,))
+
+def test_enqueue_is_idempotent():
+    enqueue(1)
+    assert not jobqueue.enqueue({"MessageSid": "SM0"})
+
+def test_claim_many_takes_due_jobs_once():
+    enqueue(3)
+    jobs = jobqueue.claim_many(2)
+    assert [(sid, form["Body"], attempts, reply) for sid, form, attempts, reply in jobs] == \
+        [("SM0", "coffee 0", 1, None), ("SM1", "coffee 1", 1, None)]
+    assert [j[0] for j in jobqueue.claim_many(5)] == ["SM2"]
+    assert jobqueue.claim_many(5) == []
+    assert jobqueue.stats() == {"running": 3}
+
+def test_claim_many_skips_jobs_not_yet_due():
+    enqueue(1)
+    jobqueue.retry_later("SM0", 1, "boom")
+    assert jobqueue.claim_many(5) == []
+
+def test_stale_jobs_are_reclaimed_unless_heartbeat():
+    enqueue(3)
+    jobqueue.claim_many(3)
+    age(jobqueue.STALE_AFTER + 1)
+    jobqueue.heartbeat(["SM1", "SM2"])
+    jobs = jobqueue.claim_many(5)
+    assert [(j[0], j[2]) for j in jobs] == [("SM0", 2)]
+
+def test_process_batch_keeps_waiting_jobs_fresh(monkeypatch):
+    enqueue(3)
+    ran = []
+
+    def slow_run(job, prefetched=None):
+        assert jobqueue.claim_many(5) == []  # nothing the batch still holds looks stale
+        ran.append(job[0])
+        jobqueue.complete(job[0])
+        age(jobqueue.STALE_AFTER + 1)  # each job takes longer than STALE_AFTER
+
+    monkeypatch.setattr(jobqueue, "_run", slow_run)
+    assert jobqueue.process_batch(3) == 3
+    assert ran == ["SM0", "SM1", "SM2"]
+    assert jobqueue.stats() == {"done": 3}
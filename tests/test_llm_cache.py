@@ -0,0 +1,43 @@
+import datetime as dt
+import pytest
+
+from services import llm
+
+TODAY = dt.date(2026, 10, 18)
+
+@pytest.fixture(autouse=True)
+def today(monkeypatch):
+    monkeypatch.setattr(llm, "la_today", lambda: TODAY)
+
+def test_key_has_a_day_only_for_relative_text(monkeypatch):
+    plain, relative = llm._extract_cache_key("Coffee  5"), llm._extract_cache_key("coffee 5 yesterday")
+    assert plain == llm._extract_cache_key("coffee 5")
+    monkeypatch.setattr(llm, "la_today", lambda: TODAY + dt.timedelta(days=1))
+    assert llm._extract_cache_key("coffee 5") == plain
+    assert llm._extract_cache_key("coffee 5 yesterday") != relative
+    assert llm._extract_cache_key("coffee 5 yesterday", today=TODAY) == relative
+
+def test_batch_and_single_keys_differ():
+    assert llm._expenses_cache_key("coffee 5") != llm._extract_cache_key("coffee 5")
+
+@pytest.mark.parametrize("text", ["coffee 5", "coffee 5.50", "lunch $12.99 at chipotle", "coffee 5 today"])
+def test_defaulted_date_is_not_cached(text):
+    assert llm._cacheable({"date": "2026-10-18"}, text)["date"] is None
+
+@pytest.mark.parametrize("text", ["coffee 5 10/18", "TOTAL 12.00\n2026-10-18", "Oct 18 lunch 12",
+                                  "18th October dinner 40", "18.10.2026 total 5"])
+def test_written_date_is_kept(text):
+    assert llm._cacheable({"date": "2026-10-18"}, text)["date"] == "2026-10-18"
+
+def test_other_dates_are_kept_and_reference_day_is_used():
+    assert llm._cacheable({"date": "2026-10-17"}, "coffee 5 yesterday")["date"] == "2026-10-17"
+    sent = dt.date(2024, 3, 1)
+    assert llm._cacheable({"date": "2024-03-01"}, "coffee 5", sent)["date"] is None
+    assert llm._cacheable({"date": "2026-10-18"}, "coffee 5", sent)["date"] == "2026-10-18"
+
+def test_extract_batch_caches_per_input(offline):
+    first = llm.extract_batch(["coffee 5", "uber 14, lunch 22"])
+    calls = offline["groq"].chat.completions.calls
+    assert [[e["amount"] for e in r] for r in first] == [[5.0], [14.0, 22.0]]
+    assert llm.extract_batch(["uber 14, lunch 22"]) == [first[1]]
+    assert offline["groq"].chat.completions.calls == calls
@@ -0,0 +1,39 @@
+import datetime as dt
+import pytest
+
+from services import quickparse
+
+FRIDAY = dt.date(2026, 10, 16)
+
+def parse(text, today=FRIDAY):
+    return quickparse.parse(text, today=today)
+
+def test_simple_messages():
+    data, confidence = parse("rent 1200")
+    assert (data["name"], data["amount"], data["category"], data["date"]) == ("Rent", 1200.0, "rent", None)
+    assert confidence >= 0.8
+    data, _ = parse("$12.50 starbucks coffee")
+    assert (data["name"], data["amount"], data["currency"], data["category"]) == ("Starbucks", 12.5, "USD", "eating_out")
+
+def test_relative_dates_resolve_against_today():
+    assert parse("uber 14 yesterday")[0]["date"] == "2026-10-15"
+    assert parse("lunch 12 wednesday")[0]["date"] == "2026-10-14"
+    assert parse("lunch 12 last friday")[0]["date"] == "2026-10-09"  # not today
+    assert parse("lunch 12 friday")[0]["date"] == "2026-10-16"
+
+def test_written_date_takes_the_reference_year():
+    assert parse("coffee 5 3/2", today=dt.date(2024, 6, 1))[0]["date"] == "2024-03-02"
+
+@pytest.mark.parametrize("text", [
+    "books 30 last week", "coffee 5 last month", "lunch 15 earlier today", "taxi 20 3 days ago",
+    "coffee -5", "refund 20 amazon", "got paid 2000 salary", "dinner 30 next friday", "rent 1200 tomorrow",
+    "uber 14 lunch 22", "hello", "coffee 5 on march 3",
+])
+def test_defers_to_the_llm(text):
+    assert parse(text) == (None, 0.0)
+    assert quickparse.quick_parse(text) is None
+
+def test_leftover_words_are_not_the_merchant():
+    data, confidence = parse("coffee at blue bottle 5")
+    assert data["name"] == "Coffee"
+    assert confidence < parse("coffee 5")[1]
@@ -0,0 +1,23 @@
+import datetime as dt
+from utils.dates import row_date_iso
+
+def _safe_float(x):
+    try: return float(x)
+    except: return 0.0
+
+def to_ordinal(d):
+    if d is None:
+        return None
+    if isinstance(d, str):
+        d = dt.date.fromisoformat(d)
+    return d.toordinal()
+
+def row_day(row):
+    iso = row_date_iso(row)
+    return to_ordinal(iso) if iso else None
+
+def row_amount(row):
+    # Rows without a category column are skipped by aggregation
+    if len(row) < 6:
+        return None
+    return _safe_float(row[3]) if len(row) > 3 else 0.0